@@ -0,0 +1,304 @@
+"""Контроль допуска запросов: token bucket на пользователя и сброс нагрузки по лагу event loop"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from fastapi.responses import JSONResponse
+
+from telegram_auth import InitDataError, init_data_verifier
+
+logger = logging.getLogger(__name__)
+
+# ============ НАСТРОЙКИ ============
+# Лимиты по маршрутам: префикс пути -> (токенов в секунду, размер корзины)
+ROUTE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "/api/game-question": (4.0, 8),
+    "/api/room-status": (4.0, 8),
+    "/api/game-results": (2.0, 5),
+    "/api/mercury-status": (2.0, 5),
+    "/api/horoscope": (5.0, 10),
+    "/api/day-card": (2.0, 5),
+    "/api/favorites": (5.0, 10),
+    "/api/questions/": (2.0, 10),
+    "/api/questions": (1.0, 3),
+    "/api/join-room": (2.0, 5),
+    "/api/create-room": (1.0, 5),
+    "/api/start-game": (1.0, 3),
+    "/api/submit-answers": (5.0, 10),
+    "/api/submit-answer": (10.0, 20),
+}
+DEFAULT_LIMIT: Tuple[float, int] = (10.0, 20)
+
+# Маршруты, которые не сбрасываются при перегрузке — они двигают игру вперед
+PRIORITY_ROUTES = ("/api/submit-answer", "/api/create-room", "/api/join-room", "/api/start-game")
+
+# Маршруты без ограничений (проверки живости балансировщика)
+EXEMPT_ROUTES = ("/health", "/robots.txt")
+
+SHED_LAG_THRESHOLD = float(os.environ.get("SHED_LAG_MS", 150)) / 1000
+SHED_RETRY_AFTER = int(os.environ.get("SHED_RETRY_AFTER", 2))
+MAX_BUCKETS = int(os.environ.get("ADMISSION_MAX_BUCKETS", 100_000))
+# Адреса прокси/балансировщиков, которым доверяем X-Forwarded-For (через запятую)
+TRUSTED_PROXIES = frozenset(
+    address.strip() for address in os.environ.get("TRUSTED_PROXIES", "").split(",") if address.strip()
+)
+# Тело POST больше этого отклоняется с 413, не дочитываясь до конца
+MAX_KEY_BODY = 64 * 1024
+
+
+# ============ TOKEN BUCKET ============
+class TokenBucket:
+    """Корзина токенов с ленивым пополнением"""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def acquire(self, now: float) -> float:
+        """Забрать токен. Возвращает 0, если можно пройти, иначе сколько секунд ждать"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+# ============ ЛАГ EVENT LOOP ============
+class LoopLagMonitor:
+    """Непрерывно измеряет задержку event loop по опозданию таймера"""
+
+    def __init__(self, interval: float = 0.05, smoothing: float = 0.3):
+        self.interval = interval
+        self.smoothing = smoothing
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            sample = max(0.0, loop.time() - started - self.interval)
+            # Рост учитываем сразу, спад — сглаженно
+            if sample > self.lag:
+                self.lag = sample
+            else:
+                self.lag += (sample - self.lag) * self.smoothing
+            self.max_lag = max(self.max_lag, sample)
+
+
+lag_monitor = LoopLagMonitor()
+
+
+# ============ ИДЕНТИФИКАЦИЯ КЛИЕНТА ============
+def _header(scope, header: bytes) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == header:
+            return value.decode("latin-1")
+    return None
+
+
+def request_init_data(scope) -> Optional[str]:
+    """initData из заголовка X-Telegram-Init-Data или параметра запроса"""
+    init_data = _header(scope, b"x-telegram-init-data")
+    if init_data is None and scope.get("query_string"):
+        values = parse_qs(scope["query_string"].decode("latin-1")).get("initData")
+        if values:
+            init_data = values[0]
+    return init_data
+
+
+def body_init_data(body: bytes) -> Optional[str]:
+    """initData из JSON-тела POST-запроса"""
+    if not body or len(body) > MAX_KEY_BODY:
+        return None
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    init_data = payload.get("initData") if isinstance(payload, dict) else None
+    return init_data if isinstance(init_data, str) else None
+
+
+def client_ip(scope) -> str:
+    """IP клиента; за доверенным прокси — первый недоверенный адрес из X-Forwarded-For"""
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if address not in TRUSTED_PROXIES:
+        return address
+    forwarded = _header(scope, b"x-forwarded-for")
+    if forwarded:
+        # Адреса дописываются справа, поэтому идем с конца до первого чужого
+        for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+            if hop not in TRUSTED_PROXIES:
+                return hop
+    return address
+
+
+def client_key(scope, init_data: Optional[str] = None) -> str:
+    """Ключ лимита: пользователь Telegram, иначе IP клиента"""
+    if init_data is None:
+        init_data = request_init_data(scope)
+    if init_data:
+        try:
+            return f"tg:{init_data_verifier.user_id(init_data)}"
+        except InitDataError:
+            pass
+    return f"ip:{client_ip(scope)}"
+
+
+async def read_body(receive, limit: int = MAX_KEY_BODY) -> Optional[List[dict]]:
+    """Прочитать тело запроса; сообщения потом отдаются приложению повторно.
+
+    Возвращает None, как только тело превысило limit — остаток не читается.
+    """
+    messages = []
+    size = 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        size += len(message.get("body", b""))
+        if size > limit:
+            return None
+        if message["type"] != "http.request" or not message.get("more_body", False):
+            return messages
+
+
+def declared_length(scope) -> Optional[int]:
+    """Content-Length из заголовков, если он указан и корректен"""
+    value = _header(scope, b"content-length")
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def replay(messages: List[dict], receive):
+    """receive, который сначала отдает уже прочитанные сообщения"""
+    pending = list(messages)
+
+    async def replayed():
+        if pending:
+            return pending.pop(0)
+        return await receive()
+
+    return replayed
+
+
+# ============ MIDDLEWARE ============
+class AdmissionMiddleware:
+    """ASGI middleware: лимиты на пользователя и адаптивный сброс нагрузки"""
+
+    def __init__(self, app, monitor: LoopLagMonitor = lag_monitor,
+                 limits: Dict[str, Tuple[float, int]] = None,
+                 default_limit: Tuple[float, int] = DEFAULT_LIMIT,
+                 lag_threshold: float = SHED_LAG_THRESHOLD,
+                 max_buckets: int = MAX_BUCKETS):
+        self.app = app
+        self.monitor = monitor
+        self.limits = ROUTE_LIMITS if limits is None else limits
+        self.default_limit = default_limit
+        self.lag_threshold = lag_threshold
+        self.max_buckets = max_buckets
+        self.buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self.shed_count = 0
+        self.limited_count = 0
+        self.rejected_count = 0
+
+    def _route(self, path: str) -> Tuple[str, Tuple[float, int]]:
+        for prefix, limit in self.limits.items():
+            if path.startswith(prefix):
+                return prefix, limit
+        return "*", self.default_limit
+
+    def _should_shed(self, path: str) -> bool:
+        lag = self.monitor.lag
+        if lag <= self.lag_threshold or path.startswith(PRIORITY_ROUTES):
+            return False
+        # Доля сбрасываемого опроса растет с лагом: при двойном пороге — весь опрос
+        return random.random() < (lag - self.lag_threshold) / self.lag_threshold
+
+    def _acquire(self, key: Tuple[str, str], limit: Tuple[float, int]) -> float:
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(limit[0], limit[1], now)
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket.acquire(now)
+
+    async def _too_large(self, scope, receive, send):
+        self.rejected_count += 1
+        response = JSONResponse(status_code=413, content={"detail": "Слишком большое тело запроса"})
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        if path.startswith(EXEMPT_ROUTES):
+            await self.app(scope, receive, send)
+            return
+
+        if self._should_shed(path):
+            self.shed_count += 1
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Сервер перегружен, повторите позже"},
+                headers={"Retry-After": str(SHED_RETRY_AFTER)}
+            )
+            await response(scope, receive, send)
+            return
+
+        if scope["method"] == "POST" and (declared_length(scope) or 0) > MAX_KEY_BODY:
+            await self._too_large(scope, receive, send)
+            return
+
+        init_data = request_init_data(scope)
+        if init_data is None and scope["method"] == "POST":
+            # Игровые POST-маршруты и избранное передают initData в JSON-теле
+            messages = await read_body(receive)
+            if messages is None:
+                await self._too_large(scope, receive, send)
+                return
+            receive = replay(messages, receive)
+            init_data = body_init_data(b"".join(m.get("body", b"") for m in messages))
+
+        route, limit = self._route(path)
+        wait = self._acquire((client_key(scope, init_data), route), limit)
+        if wait > 0:
+            self.limited_count += 1
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Слишком много запросов"},
+                headers={"Retry-After": str(max(1, int(wait + 0.999)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
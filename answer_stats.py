@@ -0,0 +1,292 @@
+"""Глобальная статистика ответов по вопросам: что выбирают пары и как часто угадывают.
+
+Горячий путь (submit_answer) только увеличивает счетчики в numpy-массивах —
+O(1), без I/O. Фоновая задача раз в ANSWER_STATS_FLUSH_S секунд отдает
+накопленные приращения потоку, который одной транзакцией дописывает их
+в SQLite; свои приращения прибавляются к итогам в памяти. Итоги целиком
+(с ответами других воркеров) перечитываются не чаще ANSWER_STATS_REFRESH_S.
+Вопросы в базе хранятся по категории игры (ключ каталога) и тексту, поэтому
+перестановка каталога не путает статистику, а одинаковые тексты в разных
+играх не сливаются.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from favorites_store import DATABASE_PATH
+
+logger = logging.getLogger(__name__)
+
+# ============ НАСТРОЙКИ ============
+ANSWER_STATS_FLUSH_INTERVAL = float(os.environ.get("ANSWER_STATS_FLUSH_S", 10))
+# Как часто перечитывать итоги других воркеров, когда у этого нет новых ответов
+ANSWER_STATS_REFRESH_INTERVAL = float(os.environ.get("ANSWER_STATS_REFRESH_S", 60))
+
+
+class AnswerStats:
+    """Счетчики выборов вариантов и угадываний по вопросам каталога"""
+
+    def __init__(self, db_path: str = DATABASE_PATH, flush_interval: float = ANSWER_STATS_FLUSH_INTERVAL,
+                 refresh_interval: float = ANSWER_STATS_REFRESH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        # Когда итоги последний раз читались из базы (time.monotonic)
+        self._read_at = 0.0
+        self._lock = threading.Lock()
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._catalog: Optional[List[Dict[str, Any]]] = None
+        self._categories: List[str] = []
+        self._option_index: List[Dict[str, int]] = []
+        # Итоги из базы и приращения этого воркера, еще не записанные в нее
+        self.picks = np.zeros((0, 0), dtype=np.int64)
+        self.matches = np.zeros((0, 2), dtype=np.int64)
+        self.pending_picks = self.picks.copy()
+        self.pending_matches = self.matches.copy()
+        # Кэш ответов эндпоинта; сбрасывается после каждой записи в базу
+        self._cache: Dict[int, Dict[str, Any]] = {}
+
+    def init(self):
+        """Открыть соединение в текущем процессе (после fork) и привести схему к актуальной"""
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock, self._conn:
+            # Миграцию выполнит один процесс, остальные дождутся ее конца
+            self._conn.execute("BEGIN IMMEDIATE")
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(answer_picks)")}
+            legacy = bool(columns) and "category" not in columns
+            if legacy:
+                self._conn.execute("ALTER TABLE answer_picks RENAME TO answer_picks_legacy")
+                self._conn.execute("ALTER TABLE answer_matches RENAME TO answer_matches_legacy")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS answer_picks (
+                    category TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    option TEXT NOT NULL,
+                    picks INTEGER NOT NULL,
+                    PRIMARY KEY (category, question, option)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS answer_matches (
+                    category TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    guesses INTEGER NOT NULL,
+                    correct INTEGER NOT NULL,
+                    PRIMARY KEY (category, question)
+                )
+            """)
+            if legacy:
+                # Старые итоги хранились только по тексту: пустая категория, см. _read_totals
+                self._conn.execute("INSERT INTO answer_picks SELECT '', question, option, picks FROM answer_picks_legacy")
+                self._conn.execute(
+                    "INSERT INTO answer_matches SELECT '', question, guesses, correct FROM answer_matches_legacy"
+                )
+                self._conn.execute("DROP TABLE answer_picks_legacy")
+                self._conn.execute("DROP TABLE answer_matches_legacy")
+                logger.info("🗂️ Статистика ответов перенесена на ключ (категория, текст)")
+
+    # ---------- каталог ----------
+    def configure(self, questions: List[Dict[str, Any]], categories: List[str]):
+        """Задать плоский каталог вопросов; id вопроса — индекс в этом списке.
+
+        categories[q] — категория игры (ключ каталога), к которой относится вопрос q.
+        """
+        if questions is self._catalog:
+            return
+        self._catalog = questions
+        self._categories = categories
+        self._option_index = [
+            {option: index for index, option in enumerate(question["options"])} for question in questions
+        ]
+        width = max((len(question["options"]) for question in questions), default=0)
+        self.picks = np.zeros((len(questions), width), dtype=np.int64)
+        self.matches = np.zeros((len(questions), 2), dtype=np.int64)
+        self.pending_picks = self.picks.copy()
+        self.pending_matches = self.matches.copy()
+        self._cache.clear()
+
+    # ---------- горячий путь ----------
+    def record_pick(self, question_id: int, answer: str):
+        """Игрок ответил за себя"""
+        option = self._option_index[question_id].get(answer)
+        if option is not None:
+            self.pending_picks[question_id, option] += 1
+
+    def record_guesses(self, question_id: int, guesses: int, correct: int):
+        """Итог раунда: сколько догадок о чужом ответе и сколько верных"""
+        row = self.pending_matches[question_id]
+        row[0] += guesses
+        row[1] += correct
+
+    # ---------- чтение ----------
+    def stats(self, question_id: int) -> Optional[Dict[str, Any]]:
+        """Распределение ответов на вопрос; None — такого вопроса нет"""
+        if self._catalog is None or not 0 <= question_id < len(self._catalog):
+            return None
+        payload = self._cache.get(question_id)
+        if payload is not None:
+            return payload
+
+        question = self._catalog[question_id]
+        options = question["options"]
+        picks = (self.picks[question_id] + self.pending_picks[question_id])[:len(options)].tolist()
+        guesses, correct = (self.matches[question_id] + self.pending_matches[question_id]).tolist()
+        total = sum(picks)
+        payload = {
+            "question_id": question_id,
+            "question": question["question"],
+            "total_answers": total,
+            "options": [
+                {"option": option, "picks": count, "share": round(count / total, 4) if total else 0.0}
+                for option, count in zip(options, picks)
+            ],
+            "top_option": options[picks.index(max(picks))] if total else None,
+            "guesses": guesses,
+            "match_rate": round(correct / guesses, 4) if guesses else None,
+        }
+        self._cache[question_id] = payload
+        return payload
+
+    def memory_usage(self, sizeof: Callable[[Any], int] = sys.getsizeof) -> Dict[str, int]:
+        """Кэш ответов эндпоинта и массивы счетчиков"""
+        cache = dict(self._cache)
+        arrays = [self.picks, self.matches, self.pending_picks, self.pending_matches]
+        return {"entries": len(cache), "approx_bytes": sizeof(cache) + sum(sizeof(array) for array in arrays)}
+
+    # ---------- запись в базу ----------
+    def _write(self, catalog: List[Dict[str, Any]], categories: List[str], picks: np.ndarray,
+               matches: np.ndarray, refresh: bool) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Дописать приращения; с refresh — вернуть итоги из базы (выполняется в потоке)"""
+        pick_rows = [
+            (categories[q], catalog[q]["question"], catalog[q]["options"][o], int(picks[q, o]))
+            for q, o in zip(*np.nonzero(picks))
+        ]
+        match_rows = [
+            (categories[q], catalog[q]["question"], int(matches[q, 0]), int(matches[q, 1]))
+            for q in np.flatnonzero(matches.any(axis=1))
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO answer_picks (category, question, option, picks) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(category, question, option) DO UPDATE SET picks = picks + excluded.picks",
+                pick_rows
+            )
+            self._conn.executemany(
+                "INSERT INTO answer_matches (category, question, guesses, correct) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(category, question) DO UPDATE SET guesses = guesses + excluded.guesses, "
+                "correct = correct + excluded.correct",
+                match_rows
+            )
+            return self._read_totals(catalog, categories, picks.shape[1]) if refresh else None
+
+    def _read_totals(self, catalog: List[Dict[str, Any]], categories: List[str],
+                     width: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Итоги из базы для каталога (вызывается под self._lock)"""
+        positions = {(category, question["question"]): q
+                     for q, (category, question) in enumerate(zip(categories, catalog))}
+        # Итоги без категории игры (до разделения по категориям — пустая, затем
+        # поле category вопроса) относим к вопросу с таким текстом, только если он
+        # в каталоге один
+        texts = Counter(question["question"] for question in catalog)
+        by_text = {question["question"]: q for q, question in enumerate(catalog) if texts[question["question"]] == 1}
+
+        def position(category: str, question: str) -> Optional[int]:
+            q = positions.get((category, question))
+            return by_text.get(question) if q is None else q
+
+        totals_picks = np.zeros((len(catalog), width), dtype=np.int64)
+        totals_matches = np.zeros((len(catalog), 2), dtype=np.int64)
+        for category, question, option, count in self._conn.execute(
+                "SELECT category, question, option, picks FROM answer_picks"):
+            q = position(category, question)
+            if q is not None and option in catalog[q]["options"]:
+                totals_picks[q, catalog[q]["options"].index(option)] += count
+        for category, question, guesses, correct in self._conn.execute(
+                "SELECT category, question, guesses, correct FROM answer_matches"):
+            q = position(category, question)
+            if q is not None:
+                totals_matches[q] += (guesses, correct)
+        return totals_picks, totals_matches
+
+    def _load_totals(self, catalog: List[Dict[str, Any]], categories: List[str],
+                     width: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            return self._read_totals(catalog, categories, width)
+
+    async def flush(self):
+        catalog, categories = self._catalog, self._categories
+        # До start() соединения с базой нет — приращения копятся в памяти
+        if catalog is None or self._conn is None:
+            return
+        picks, matches = self.pending_picks, self.pending_matches
+        pending = bool(picks.any() or matches.any())
+        # Итоги других воркеров подтягиваем лишь изредка: полное чтение — это обход таблиц
+        refresh = time.monotonic() - self._read_at >= self.refresh_interval
+        if not pending and not refresh:
+            return
+        if pending:
+            # Забираем приращения целиком: новые ответы копятся в свежих массивах
+            self.pending_picks = np.zeros_like(picks)
+            self.pending_matches = np.zeros_like(matches)
+        started = time.perf_counter()
+        try:
+            if pending:
+                totals = await asyncio.to_thread(self._write, catalog, categories, picks, matches, refresh)
+            else:
+                totals = await asyncio.to_thread(self._load_totals, catalog, categories, picks.shape[1])
+        except Exception as e:
+            logger.error(f"❌ Не удалось записать статистику ответов: {e}")
+            if pending and catalog is self._catalog:
+                self.pending_picks += picks
+                self.pending_matches += matches
+            return
+        if refresh:
+            self._read_at = time.monotonic()
+        if catalog is self._catalog:
+            if totals is not None:
+                self.picks, self.matches = totals
+            else:
+                self.picks += picks
+                self.matches += matches
+            self._cache.clear()
+        logger.debug(f"📊 Статистика ответов записана за {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        """Подключиться к базе, загрузить итоги и запустить периодическую запись"""
+        await asyncio.to_thread(self.init)
+        if self._catalog is not None:
+            catalog = self._catalog
+            totals = await asyncio.to_thread(self._load_totals, catalog, self._categories, self.picks.shape[1])
+            self._read_at = time.monotonic()
+            if catalog is self._catalog:
+                self.picks, self.matches = totals
+                self._cache.clear()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+answer_stats = AnswerStats()
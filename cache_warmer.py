@@ -0,0 +1,60 @@
+"""Прогрев кэшей перед полуночью.
+
+Гороскопы, карта дня и статус Меркурия кэшируются по дате. Чтобы первые
+запросы новых суток не считали их на event loop все разом, задачи прогрева
+заранее заполняют кэши на завтра.
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_WARM_LEAD = timedelta(minutes=float(os.environ.get("CACHE_WARM_LEAD_MIN", 5)))
+
+
+class MidnightWarmer:
+    """Планировщик: за CACHE_WARM_LEAD до полуночи UTC считает данные на завтра"""
+
+    def __init__(self, lead: timedelta = CACHE_WARM_LEAD):
+        self.lead = lead
+        self.jobs: List[Callable[[str], Awaitable[None]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def job(self, fn: Callable[[str], Awaitable[None]]):
+        """Зарегистрировать задачу прогрева; получает дату завтрашнего дня"""
+        self.jobs.append(fn)
+        return fn
+
+    async def warm(self, date_str: str):
+        for job in self.jobs:
+            try:
+                await job(date_str)
+            except Exception as e:
+                logger.error(f"❌ Ошибка прогрева {job.__name__} на {date_str}: {e}")
+        logger.info(f"🔥 Кэши прогреты на {date_str}")
+
+    async def _run(self):
+        while True:
+            now = datetime.now(timezone.utc)
+            midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            run_at = midnight - self.lead
+            if run_at > now:
+                await asyncio.sleep((run_at - now).total_seconds())
+            await self.warm(midnight.strftime("%Y-%m-%d"))
+            # Ждем наступления новых суток, чтобы не прогревать повторно
+            await asyncio.sleep(max(0.0, (midnight - datetime.now(timezone.utc)).total_seconds()) + 1)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+cache_warmer = MidnightWarmer()
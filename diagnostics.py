@@ -0,0 +1,212 @@
+"""Диагностика блокировок event loop и семплирующий профайлер медленных обработчиков.
+
+Включается переменной окружения GNOME_DIAGNOSTICS=1. Сторожевой поток следит
+за сердцебиением event loop: если колбэк держит loop дольше порога, поток
+снимает стек основного потока. Тот же поток периодически семплирует стек
+и накапливает время по маршрутам и свернутые стеки для флеймграфов.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+# ============ НАСТРОЙКИ ============
+DIAGNOSTICS_ENABLED = os.environ.get("GNOME_DIAGNOSTICS", "0") == "1"
+BLOCK_THRESHOLD = float(os.environ.get("DIAG_BLOCK_MS", 100)) / 1000
+SAMPLE_INTERVAL = float(os.environ.get("DIAG_SAMPLE_MS", 10)) / 1000
+HEARTBEAT_INTERVAL = 0.02
+MAX_BLOCK_EVENTS = 100
+MAX_STACKS = 5000
+MAX_STACK_DEPTH = 64
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+# Кадры, которые передают управление циклу, написанному на C (uvloop):
+# если такой кадр на вершине стека, loop ждет событий внутри C-кода
+_LOOP_DRIVERS = {
+    ("runners.py", "run"),
+    ("base_events.py", "run_until_complete"),
+    ("base_events.py", "run_forever"),
+}
+
+
+def _is_idle(frame) -> bool:
+    """Loop ждет событий в селекторе — это не работа обработчиков"""
+    if frame is None:
+        return True
+    code = frame.f_code
+    if code.co_name in ("select", "poll") and code.co_filename.endswith("selectors.py"):
+        return True
+    if os.path.basename(code.co_filename) == "__init__.py" and code.co_name == "run":
+        return os.path.basename(os.path.dirname(code.co_filename)) == "uvloop"
+    return (os.path.basename(code.co_filename), code.co_name) in _LOOP_DRIVERS
+
+
+class LoopWatchdog:
+    """Сторожевой поток: детектор блокировок и семплирующий профайлер"""
+
+    def __init__(self, block_threshold: float = BLOCK_THRESHOLD,
+                 sample_interval: float = SAMPLE_INTERVAL):
+        self.block_threshold = block_threshold
+        self.sample_interval = sample_interval
+        self.block_events = deque(maxlen=MAX_BLOCK_EVENTS)
+        self.stacks: Counter = Counter()
+        self.route_samples: Counter = Counter()
+        self.total_samples = 0
+        self.started_at = time.time()
+        self._route_codes: Dict[object, str] = {}
+        self._beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._current_block: Optional[dict] = None
+        self.loop_type = "asyncio"
+
+    # ---------- запуск и остановка ----------
+    def start(self, app: FastAPI):
+        self._route_codes = {
+            route.endpoint.__code__: route.path
+            for route in app.routes
+            if hasattr(getattr(route, "endpoint", None), "__code__")
+        }
+        self._loop_thread_id = threading.get_ident()
+        self.loop_type = type(asyncio.get_running_loop()).__module__.split(".")[0]
+        self._beat = time.monotonic()
+        self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"🩺 Диагностика event loop включена (порог {self.block_threshold * 1000:.0f} мс)")
+
+    async def stop(self):
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._thread is not None:
+            # Поток просыпается раз в sample_interval — ждем его вне loop
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    # ---------- сторожевой поток ----------
+    def _watch(self):
+        while not self._stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._loop_thread_id)
+            self._sample(frame)
+            if frame is not None:
+                self._check_block(frame)
+
+    def _walk(self, frame) -> List[object]:
+        codes = []
+        while frame is not None and len(codes) < MAX_STACK_DEPTH:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        return codes
+
+    def _sample(self, frame):
+        if _is_idle(frame):
+            return
+        codes = self._walk(frame)
+        self.total_samples += 1
+
+        route = "<loop>"
+        for code in codes:
+            if code in self._route_codes:
+                route = self._route_codes[code]
+                break
+        self.route_samples[route] += 1
+
+        collapsed = ";".join(_frame_label(code) for code in codes)
+        if collapsed in self.stacks or len(self.stacks) < MAX_STACKS:
+            self.stacks[collapsed] += 1
+
+    def _check_block(self, frame):
+        stalled = time.monotonic() - self._beat
+        if stalled < self.block_threshold + HEARTBEAT_INTERVAL:
+            if self._current_block is not None:
+                self._current_block = None
+            return
+
+        if self._current_block is None:
+            codes = self._walk(frame)
+            route = next((self._route_codes[c] for c in codes if c in self._route_codes), None)
+            self._current_block = {
+                "detected_at": time.time(),
+                "blocked_ms": round(stalled * 1000, 1),
+                "route": route,
+                "stack": [_frame_label(code) for code in codes],
+            }
+            self.block_events.append(self._current_block)
+            logger.warning(f"🐌 Event loop заблокирован {stalled * 1000:.0f} мс в {route or 'неизвестном месте'}")
+        else:
+            self._current_block["blocked_ms"] = round(stalled * 1000, 1)
+
+    # ---------- отчеты ----------
+    def report(self, top: int = 10) -> dict:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            "sample_interval_ms": self.sample_interval * 1000,
+            "loop": self.loop_type,
+            "total_samples": self.total_samples,
+            "busy_ratio": round(self.total_samples * self.sample_interval / elapsed, 4),
+            "top_routes": [
+                {"route": route, "samples": count, "cpu_ms": round(count * self.sample_interval * 1000, 1)}
+                for route, count in self.route_samples.most_common(top)
+            ],
+            "top_stacks": [
+                {"stack": stack, "samples": count}
+                for stack, count in self.stacks.most_common(top)
+            ],
+            "blocking_events": list(self.block_events)[-top:],
+        }
+
+    def collapsed(self) -> str:
+        """Свернутые стеки в формате flamegraph.pl / speedscope"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+watchdog = LoopWatchdog()
+
+
+def install(app: FastAPI, lag_monitor=None):
+    """Подключает диагностику к приложению, если она включена"""
+    if not DIAGNOSTICS_ENABLED:
+        return
+
+    @app.on_event("startup")
+    async def start_watchdog():
+        watchdog.start(app)
+
+    @app.on_event("shutdown")
+    async def stop_watchdog():
+        await watchdog.stop()
+
+    @app.get("/debug/slow")
+    async def debug_slow(format: str = "json", top: int = 10):
+        """Самые медленные маршруты, блокировки loop и свернутые стеки"""
+        if format == "collapsed":
+            return PlainTextResponse(watchdog.collapsed())
+        report = watchdog.report(top)
+        if lag_monitor is not None:
+            report["loop_lag_ms"] = round(lag_monitor.lag * 1000, 1)
+            report["max_loop_lag_ms"] = round(lag_monitor.max_lag * 1000, 1)
+        return report
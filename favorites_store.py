@@ -0,0 +1,171 @@
+"""Хранилище избранного в SQLite: дедупликация по хэшу, лимит на пользователя, курсорная пагинация"""
+import os
+import json
+import base64
+import hashlib
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ============ НАСТРОЙКИ ============
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "database.db")
+FAVORITES_PER_USER = int(os.environ.get("FAVORITES_PER_USER", 200))
+FAVORITES_PAGE_SIZE = 20
+FAVORITES_MAX_PAGE_SIZE = 100
+
+
+def content_hash(content_type: str, content: Any) -> str:
+    payload = json.dumps(content, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(f"{content_type}\0{payload}".encode()).hexdigest()
+
+
+def encode_cursor(added_at: str, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{added_at}|{row_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    added_at, row_id = base64.urlsafe_b64decode(padded.encode()).decode().rsplit("|", 1)
+    return added_at, int(row_id)
+
+
+class FavoritesStore:
+    """Избранное пользователей: дубли отсекает уникальный индекс базы, размер ограничен.
+
+    Импорт модуля базу не трогает: соединение и миграция схемы — в init() при старте.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH, per_user_cap: int = FAVORITES_PER_USER):
+        self.per_user_cap = per_user_cap
+        self._lock = threading.Lock()
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def init(self):
+        """Открыть соединение в текущем процессе и привести схему к актуальной.
+
+        Вызывается при старте каждого воркера — соединение SQLite нельзя делить
+        между процессами после fork.
+        """
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock, self._conn:
+            # Воркеры стартуют одновременно — миграцию выполняет только один
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS favorites (
+                    id INTEGER PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    content_type TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    added_at TEXT NOT NULL
+                )
+            """)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(favorites)")}
+            if "content_hash" not in columns:
+                self._conn.execute("ALTER TABLE favorites ADD COLUMN content_hash TEXT")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_favorites_user_added ON favorites(user_id, added_at, id)"
+            )
+            unique = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_favorites_user_hash'"
+            ).fetchone()
+            if unique is None:
+                self._migrate_hashes()
+
+    def _migrate_hashes(self):
+        """Однократно: хэши старых записей, удаление накопившихся дублей, уникальный индекс"""
+        rows = self._conn.execute(
+            "SELECT id, content_type, content FROM favorites WHERE content_hash IS NULL"
+        ).fetchall()
+        self._conn.executemany(
+            "UPDATE favorites SET content_hash = ? WHERE id = ?",
+            [(content_hash(content_type, _decode(content)), row_id) for row_id, content_type, content in rows]
+        )
+        removed = self._conn.execute(
+            "DELETE FROM favorites WHERE id NOT IN "
+            "(SELECT MIN(id) FROM favorites GROUP BY user_id, content_hash)"
+        ).rowcount
+        self._conn.execute(
+            "CREATE UNIQUE INDEX idx_favorites_user_hash ON favorites(user_id, content_hash)"
+        )
+        logger.info(f"🗂️ Избранное: посчитано {len(rows)} хэшей, удалено {removed} дублей")
+
+    def _count(self, user_id: int) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM favorites WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def add(self, user_id: int, content_type: str, content: Any) -> Tuple[bool, int]:
+        """Добавить запись. Возвращает (добавлено ли, всего записей у пользователя)"""
+        digest = content_hash(content_type, content)
+        with self._lock, self._conn:
+            # Уникальный индекс работает и для других процессов, пишущих в ту же базу
+            cursor = self._conn.execute(
+                "INSERT INTO favorites (user_id, content_type, content, added_at, content_hash) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(user_id, content_hash) DO NOTHING",
+                (user_id, content_type, json.dumps(content, ensure_ascii=False),
+                 datetime.now(timezone.utc).isoformat(), digest)
+            )
+            added = cursor.rowcount > 0
+            total = self._count(user_id)
+
+            # Вытесняем самые старые записи сверх лимита
+            excess = total - self.per_user_cap
+            if added and excess > 0:
+                self._conn.execute(
+                    "DELETE FROM favorites WHERE id IN (SELECT id FROM favorites WHERE user_id = ? "
+                    "ORDER BY added_at, id LIMIT ?)",
+                    (user_id, excess)
+                )
+                total -= excess
+                logger.info(f"🧹 Удалено {excess} старых записей избранного пользователя {user_id}")
+            return added, total
+
+    def page(self, user_id: int, cursor: Optional[str] = None,
+             limit: int = FAVORITES_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[str], int]:
+        """Страница избранного от новых к старым: (записи, следующий курсор, всего)"""
+        limit = max(1, min(limit, FAVORITES_MAX_PAGE_SIZE))
+        with self._lock, self._conn:
+            total = self._count(user_id)
+            if cursor:
+                added_at, row_id = decode_cursor(cursor)
+                rows = self._conn.execute(
+                    "SELECT id, content_type, content, added_at FROM favorites "
+                    "WHERE user_id = ? AND (added_at < ? OR (added_at = ? AND id < ?)) "
+                    "ORDER BY added_at DESC, id DESC LIMIT ?",
+                    (user_id, added_at, added_at, row_id, limit + 1)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT id, content_type, content, added_at FROM favorites "
+                    "WHERE user_id = ? ORDER BY added_at DESC, id DESC LIMIT ?",
+                    (user_id, limit + 1)
+                ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+
+        favorites = [
+            {"type": content_type, "content": _decode(content), "added_at": added_at}
+            for _, content_type, content, added_at in rows
+        ]
+        return favorites, next_cursor, total
+
+
+def _decode(content: str) -> Any:
+    """Содержимое записи; старые записи могли сохраниться не в JSON — отдаем строку как есть"""
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content
+
+
+favorites_store = FavoritesStore()
@@ -0,0 +1,185 @@
+"""Матрицы ответов и попарная совместимость игроков групповых комнат.
+
+Ответы хранятся кодами вариантов в numpy-матрице игроки × вопросы
+(-1 — ответа нет); сами строки вариантов интернируются в список комнаты.
+Совместимость всех пар считается одной операцией над массивами —
+без вложенных циклов Python по игрокам и вопросам.
+"""
+import base64
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MISSING = -1
+BEST_PAIRS = 5
+# Начальная емкость матрицы: комната на двоих помещается без перевыделений
+MIN_ROWS = 4
+MIN_COLUMNS = 16
+_EMPTY = np.full((0, 0), MISSING, dtype=np.int32)
+
+
+class AnswerMatrix:
+    """Матрица ответов строки × столбцы, растущая по мере записи"""
+
+    def __init__(self, rows: int = 0, columns: int = 0):
+        self.codes = np.full((rows, columns), MISSING, dtype=np.int32) if rows and columns else _EMPTY
+        # Занятая часть матрицы — остальное запас емкости
+        self.rows = 0
+        self.columns = 0
+        self.options: List[str] = []
+        self._option_codes: Dict[str, int] = {}
+        # Запись из снапшота журнала: разбирается при первом обращении, так как
+        # большинство восстановленных комнат больше не читаются
+        self._record: Optional[Dict[str, Any]] = None
+
+    def _unpack(self):
+        record, self._record = self._record, None
+        rows, columns = record["shape"]
+        if rows and columns:
+            codes = np.frombuffer(base64.b64decode(record["codes"]), dtype="<i4")
+            self.codes = codes.astype(np.int32).reshape(rows, columns)
+        self.rows, self.columns = rows, columns
+        self.options = list(record["options"])
+        self._option_codes = {option: code for code, option in enumerate(self.options)}
+
+    def _reserve(self, row: int, column: int):
+        rows, columns = self.codes.shape
+        if row < rows and column < columns:
+            return
+        # Удвоение емкости, чтобы запись оставалась O(1) в среднем
+        grown = np.full(
+            (max(row + 1, rows * 2, MIN_ROWS) if row >= rows else rows,
+             max(column + 1, columns * 2, MIN_COLUMNS) if column >= columns else columns),
+            MISSING, dtype=np.int32
+        )
+        grown[:rows, :columns] = self.codes
+        self.codes = grown
+
+    def set(self, row: int, column: int, value: str):
+        if self._record is not None:
+            self._unpack()
+        code = self._option_codes.get(value)
+        if code is None:
+            code = self._option_codes[value] = len(self.options)
+            self.options.append(value)
+        self._reserve(row, column)
+        self.codes[row, column] = code
+        if row >= self.rows:
+            self.rows = row + 1
+        if column >= self.columns:
+            self.columns = column + 1
+
+    def get(self, row: int, column: int) -> Optional[str]:
+        if self._record is not None:
+            self._unpack()
+        if row >= self.codes.shape[0] or column >= self.codes.shape[1]:
+            return None
+        code = self.codes[row, column]
+        return None if code == MISSING else self.options[code]
+
+    def has(self, row: int, column: int) -> bool:
+        return self.get(row, column) is not None
+
+    def view(self, rows: int, columns: int) -> np.ndarray:
+        """Коды первых rows × columns ячеек, недостающие дополнены MISSING"""
+        if self._record is not None:
+            self._unpack()
+        self._reserve(max(rows - 1, 0), max(columns - 1, 0))
+        return self.codes[:rows, :columns]
+
+    def decode(self, codes: np.ndarray) -> List[Optional[str]]:
+        options = self.options
+        return [None if code == MISSING else options[code] for code in codes.tolist()]
+
+    def copy(self) -> "AnswerMatrix":
+        matrix = AnswerMatrix()
+        if self._record is not None:
+            matrix._record = self._record
+            return matrix
+        matrix.codes = self.codes.copy()
+        matrix.rows, matrix.columns = self.rows, self.columns
+        matrix.options = list(self.options)
+        matrix._option_codes = dict(self._option_codes)
+        return matrix
+
+    def to_json(self) -> Dict[str, Any]:
+        """Занятая часть матрицы; коды — base64 от int32, чтобы снапшот быстро разбирался"""
+        if self._record is not None:
+            return self._record
+        codes = np.ascontiguousarray(self.codes[:self.rows, :self.columns], dtype="<i4")
+        return {
+            "options": self.options,
+            "shape": [self.rows, self.columns],
+            "codes": base64.b64encode(codes.tobytes()).decode("ascii")
+        }
+
+    @classmethod
+    def from_json(cls, record: Dict[str, Any]) -> "AnswerMatrix":
+        matrix = cls()
+        matrix._record = record
+        return matrix
+
+
+# ============ СОВМЕСТИМОСТЬ ============
+def agreement_counts(answers: np.ndarray):
+    """Совпадения собственных ответов для всех пар: (совпало, сравнено), обе N × N"""
+    valid = answers != MISSING
+    both = valid[:, None, :] & valid[None, :, :]
+    same = (answers[:, None, :] == answers[None, :, :]) & both
+    return same.sum(axis=2), both.sum(axis=2)
+
+
+def guess_counts(answers: np.ndarray, guesses: np.ndarray):
+    """Угаданные ответы: guesses[g, t, q] — догадка g об ответе t.
+
+    Возвращает (угадано, попыток), обе N × N, строка — угадывающий.
+    """
+    valid = (guesses != MISSING) & (answers != MISSING)[None, :, :]
+    correct = (guesses == answers[None, :, :]) & valid
+    return correct.sum(axis=2), valid.sum(axis=2)
+
+
+def pair_percent(hits: np.ndarray, totals: np.ndarray) -> np.ndarray:
+    """Симметричный процент совместимости пар; пары без данных и диагональ — 0"""
+    hits = hits + hits.T
+    totals = totals + totals.T
+    percent = np.zeros(hits.shape, dtype=np.float64)
+    np.divide(hits * 100.0, totals, out=percent, where=totals > 0)
+    np.fill_diagonal(percent, 0.0)
+    return percent
+
+
+@lru_cache(maxsize=64)
+def pair_indices(players: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Индексы всех пар i < j; np.triu_indices дорог для маленьких комнат, кэшируем"""
+    first, second = np.triu_indices(players, k=1)
+    first.flags.writeable = False
+    second.flags.writeable = False
+    return first, second
+
+
+def group_percent(percent: np.ndarray) -> float:
+    """Средняя совместимость по всем парам"""
+    if len(percent) < 2:
+        return 0.0
+    return float(percent[pair_indices(len(percent))].mean())
+
+
+def best_pairs(percent: np.ndarray, names: Sequence[str], limit: int = BEST_PAIRS) -> List[Dict[str, Any]]:
+    """Пары с наибольшей совместимостью"""
+    first, second = pair_indices(len(names))
+    scores = percent[first, second]
+    order = np.argsort(-scores, kind="stable")[:limit]
+    return [
+        {"players": [names[first[i]], names[second[i]]], "compatibility_percent": round(float(scores[i]), 1)}
+        for i in order.tolist()
+    ]
+
+
+def compatibility_report(percent: np.ndarray, names: Sequence[str]) -> Dict[str, Any]:
+    return {
+        "players": list(names),
+        "compatibility_matrix": np.round(percent, 1).tolist(),
+        "best_pairs": best_pairs(percent, names)
+    }
@@ -1,17 +1,32 @@
 import os
 import json
+import asyncio
 import random
 import logging
 import uuid
+import zlib
 import traceback
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from typing import Dict, Any, List, Optional
 
+from admission import AdmissionMiddleware, lag_monitor
+import diagnostics
+import memory_diagnostics
+from telegram_auth import InitDataError, init_data_verifier
+from favorites_store import FAVORITES_PAGE_SIZE, favorites_store
+import room_engine
+import group_scoring
+from room_journal import room_journal
+from answer_stats import answer_stats
+import mercury_ephemeris
+from cache_warmer import cache_warmer
+
 # ============ НАСТРОЙКА ЛОГИРОВАНИЯ ============
 logging.basicConfig(
     level=logging.INFO,
@@ -26,6 +41,18 @@ app = FastAPI(
     description="🧙‍♂️ API для мини-приложения Гномий Гороскоп"
 )
 
+# ============ КОНТРОЛЬ ДОПУСКА ============
+# Добавляется до CORS, чтобы ответы 429/503 тоже получали CORS-заголовки
+app.add_middleware(AdmissionMiddleware, monitor=lag_monitor)
+
+@app.on_event("startup")
+async def start_lag_monitor():
+    lag_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_lag_monitor():
+    await lag_monitor.stop()
+
 # ============ CORS НАСТРОЙКА ============
 app.add_middleware(
     CORSMiddleware,
@@ -59,6 +86,12 @@ class FavoriteRequest(BaseModel):
 class CreateRoomRequest(BaseModel):
     game_type: str
     creator_name: str
+    max_players: int = Field(room_engine.DEFAULT_PLAYERS, ge=2, le=room_engine.MAX_PLAYERS)
+    initData: str = ""
+
+class StartGameRequest(BaseModel):
+    room_id: str
+    player_name: str
     initData: str = ""
 
 class JoinRoomRequest(BaseModel):
@@ -71,8 +104,25 @@ class AnswerRequest(BaseModel):
     player_name: str
     question_id: int
     answer: str
+    # Фаза, к которой относится ответ (поле phase из /api/game-question):
+    # без нее повтор после смены фазы был бы принят как ответ в новой фазе
+    phase: int
+    initData: str = ""
+
+class AnswerItem(BaseModel):
+    question_id: int
+    answer: str
+    phase: int
+
+class AnswerBatchRequest(BaseModel):
+    room_id: str
+    player_name: str
+    answers: List[AnswerItem]
     initData: str = ""
 
+# Сколько ответов можно отправить одним пакетом
+MAX_ANSWER_BATCH = 64
+
 # ============ ДАННЫЕ ПРИЛОЖЕНИЯ ============
 HOROSCOPE_TEMPLATES = [
     "Звезды советуют вам проявить инициативу! Сегодня удачный день для новых начинаний.",
@@ -105,50 +155,9 @@ DAY_CARDS = [
 ]
 
 # ============ РЕТРОГРАДНЫЙ МЕРКУРИЙ ============
-MERCURY_RETROGRADE_2025 = [
-    {
-        "phase": "Mercury Retrograde #1",
-        "pre_shadow_start": "2025-02-28",
-        "retrograde_start": "2025-03-14", 
-        "retrograde_end": "2025-04-07",
-        "post_shadow_end": "2025-04-26",
-        "signs": ["Aries", "Pisces"],
-        "influences": {
-            "communication": "Будьте осторожны в переписке, перечитывайте сообщения дважды",
-            "travel": "Планы поездок могут измениться, проверяйте билеты",
-            "technology": "Делайте резервные копии данных, технические сбои возможны",
-            "relationships": "Старые знакомые могут неожиданно выйти на связь"
-        }
-    },
-    {
-        "phase": "Mercury Retrograde #2", 
-        "pre_shadow_start": "2025-06-29",
-        "retrograde_start": "2025-07-17",
-        "retrograde_end": "2025-08-11", 
-        "post_shadow_end": "2025-08-25",
-        "signs": ["Leo"],
-        "influences": {
-            "creativity": "Пересмотрите творческие проекты, вдохновение найдет новые пути",
-            "self_expression": "Осторожнее с публичными заявлениями и самопрезентацией", 
-            "romance": "В отношениях возможны недопонимания из-за гордости",
-            "performance": "Выступления и презентации требуют особой подготовки"
-        }
-    },
-    {
-        "phase": "Mercury Retrograde #3",
-        "pre_shadow_start": "2025-10-21", 
-        "retrograde_start": "2025-11-09",
-        "retrograde_end": "2025-11-29",
-        "post_shadow_end": "2025-12-16", 
-        "signs": ["Sagittarius"],
-        "influences": {
-            "learning": "Пересмотрите планы обучения, возможны задержки в учебе",
-            "travel": "Дальние поездки требуют особого внимания к деталям",
-            "beliefs": "Время переосмыслить свои взгляды и философию жизни", 
-            "legal": "Юридические вопросы лучше отложить на более поздний срок"
-        }
-    }
-]
+# Периоды вычисляются по орбитальным элементам и кэшируются по годам
+_current_year = datetime.now(timezone.utc).year
+mercury_ephemeris.preload(range(_current_year - 1, _current_year + 3))
 
 def get_mercury_status(date_str: str = None):
     """Проверяет статус Меркурия на указанную дату"""
@@ -157,7 +166,12 @@ def get_mercury_status(date_str: str = None):
     else:
         check_date = date_str
     
-    for period in MERCURY_RETROGRADE_2025:
+    try:
+        year = int(check_date[:4])
+    except ValueError:
+        year = datetime.now().year
+    
+    for period in mercury_ephemeris.periods_around(year):
         if period["retrograde_start"] <= check_date <= period["retrograde_end"]:
             return {
                 "status": "retrograde",
@@ -200,17 +214,21 @@ def get_mercury_status(date_str: str = None):
         }
     }
 
-def get_weekly_mercury_forecast():
+def get_weekly_mercury_forecast(start_date: str = None):
     """Получить прогноз влияния Меркурия на неделю"""
-    today = datetime.now()
+    today = datetime.now() if start_date is None else datetime.strptime(start_date, "%Y-%m-%d")
     forecast = []
     
     for i in range(7):
-        date = (today + timedelta(days=i)).strftime("%Y-%m-%d")
+        day = today + timedelta(days=i)
+        # За границами эфемерид прогноза нет: неделя в конце диапазона короче
+        if not mercury_ephemeris.MIN_YEAR <= day.year <= mercury_ephemeris.MAX_YEAR:
+            continue
+        date = day.strftime("%Y-%m-%d")
         status = get_mercury_status(date)
         forecast.append({
             "date": date,
-            "day_name": (today + timedelta(days=i)).strftime("%A"), 
+            "day_name": day.strftime("%A"), 
             "mercury_status": status["status"],
             "message": status["message"],
             "key_influences": list(status["influences"].keys())[:2] if "influences" in status else []
@@ -277,9 +295,103 @@ def load_questions_from_file():
 load_questions_from_file()
 
 # ============ ХРАНИЛИЩА ДАННЫХ ============
-user_favorites = {}
 game_rooms: Dict[str, Dict[str, Any]] = {}
 daily_cards_cache = {}
+horoscope_cache: Dict[tuple, Dict[str, Any]] = {}
+mercury_payload_cache: Dict[tuple, Dict[str, Any]] = {}
+# Кэшируются только даты рядом с сегодняшней: произвольные даты из запросов
+# считаются заново и не раздувают кэши (прошедшие дни чистит прогрев)
+CACHE_DAYS_AHEAD = 7
+# Знаки, которые запрашивали клиенты, — их гороскопы прогреваем заранее
+requested_signs: Dict[str, None] = {}
+SIGNS_BY_NAME = {sign.lower(): sign for sign in mercury_ephemeris.ZODIAC_SIGNS}
+
+# Списки вопросов по типу игры и смещение первого вопроса в общем каталоге
+_question_sets: Dict[str, Any] = {"catalog": None, "sets": {}}
+
+def question_set(game_type: str):
+    """Вопросы игры и смещение их id в каталоге; пересобирается, если каталог заменили"""
+    if _question_sets["catalog"] is not COUPLE_GAMES_DATA:
+        sets, all_questions, categories = {}, [], []
+        for category, questions in COUPLE_GAMES_DATA.items():
+            sets[category] = (questions, len(all_questions))
+            all_questions.extend(questions)
+            categories.extend([category] * len(questions))
+        sets["mixed"] = (all_questions, 0)
+        _question_sets.update(catalog=COUPLE_GAMES_DATA, sets=sets)
+        answer_stats.configure(all_questions, categories)
+    return _question_sets["sets"].get(game_type, ([], 0))
+
+# ============ ЖУРНАЛ КОМНАТ ============
+# Как часто удаляем из памяти завершенные и брошенные комнаты
+ROOM_PRUNE_INTERVAL = float(os.environ.get("ROOM_PRUNE_INTERVAL_S", 600))
+_room_pruner: Dict[str, Optional[asyncio.Task]] = {"task": None}
+
+def prune_game_rooms() -> int:
+    """Удалить комнаты, срок которых вышел; журнал их тоже не восстановит"""
+    now = datetime.now(timezone.utc)
+    expired = [room_id for room_id, room in game_rooms.items() if room_engine.is_expired(room, now)]
+    for room_id in expired:
+        del game_rooms[room_id]
+    if expired:
+        logger.info(f"🧹 Удалено {len(expired)} завершенных и брошенных комнат")
+    return len(expired)
+
+async def _prune_game_rooms_periodically():
+    while True:
+        await asyncio.sleep(ROOM_PRUNE_INTERVAL)
+        prune_game_rooms()
+
+@app.on_event("startup")
+async def restore_game_rooms():
+    game_rooms.update(room_journal.recover())
+    room_journal.start()
+    _room_pruner["task"] = asyncio.get_running_loop().create_task(_prune_game_rooms_periodically())
+
+@app.on_event("shutdown")
+async def flush_room_journal():
+    if _room_pruner["task"] is not None:
+        _room_pruner["task"].cancel()
+        _room_pruner["task"] = None
+    await room_journal.stop()
+
+# ============ СТАТИСТИКА ОТВЕТОВ ============
+@app.on_event("startup")
+async def start_answer_stats():
+    question_set("mixed")
+    await answer_stats.start()
+
+@app.on_event("shutdown")
+async def flush_answer_stats():
+    await answer_stats.stop()
+
+def record_answer_stats(room: Dict[str, Any], answerer: str, player_name: str,
+                        question_id: int, answer: str, round_complete: bool):
+    """Счетчики глобальной статистики для принятого ответа — O(1), без I/O"""
+    questions, offset = question_set(room["game_type"])
+    if not questions:
+        return
+    catalog_id = offset + (question_id // 2) % len(questions)
+    if player_name == answerer:
+        answer_stats.record_pick(catalog_id, answer)
+    if round_complete:
+        # Раунд закрыт: все догадки об ответе отвечавшего уже известны
+        players = room["players"]
+        target = players.index(answerer)
+        own_answer = room["answers"].get(target, question_id)
+        guesses = [
+            room["guesses"].get(room_engine.guess_row(room, guesser, target), question_id)
+            for guesser in range(len(players)) if guesser != target
+        ]
+        answer_stats.record_guesses(catalog_id, len(guesses), guesses.count(own_answer))
+
+def resolve_user_id(init_data: str) -> int:
+    """Проверенный числовой id пользователя Telegram (0 — аноним)"""
+    try:
+        return init_data_verifier.user_id(init_data)
+    except InitDataError as e:
+        logger.warning(f"🔒 Отклонены initData: {e}")
+        raise HTTPException(status_code=401, detail="Неверные данные авторизации Telegram")
 
 # ============ ОСНОВНЫЕ МАРШРУТЫ ============
 @app.get("/")
@@ -294,9 +406,10 @@ async def root():
         "endpoints": [
             "GET /health",
             "GET /api/questions", 
+            "GET /api/questions/{question_id}/stats",
             "GET /api/horoscope?sign=ЗНАК",
             "POST /api/day-card",
-            "GET /api/favorites",
+            "GET /api/favorites?cursor=&limit=",
             "POST /api/favorites",
             "GET /api/mercury-status",
             "POST /api/create-room",
@@ -304,6 +417,7 @@ async def root():
             "GET /api/room-status/{room_id}",
             "GET /api/game-question/{room_id}",
             "POST /api/submit-answer",
+            "POST /api/submit-answers",
             "GET /api/game-results/{room_id}"
         ]
     }
@@ -314,27 +428,96 @@ async def health():
         "status": "ok",
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "service": "Gnome Horoscope API",
-        "rooms_count": len(game_rooms)
+        "rooms_count": len(game_rooms),
+        "loop_lag_ms": round(lag_monitor.lag * 1000, 1)
+    }
+
+def stable_seed(text: str) -> int:
+    """Одинаковый во всех процессах и запусках: hash() строк зависит от PYTHONHASHSEED"""
+    return zlib.crc32(text.encode("utf-8"))
+
+def build_horoscope(sign: str, date: str) -> Dict[str, Any]:
+    """Гороскоп знака на дату"""
+    seed = stable_seed(f"{sign}{date}") % len(HOROSCOPE_TEMPLATES)
+    return {
+        "sign": sign,
+        "date": date,
+        "text": HOROSCOPE_TEMPLATES[seed],
+        "source": "Gnome Horoscope API"
     }
 
+def build_day_card(current_date: str) -> Dict[str, Any]:
+    """Карта дня на дату"""
+    date_seed = stable_seed(current_date) % len(DAY_CARDS)
+    selected_card = DAY_CARDS[date_seed]
+    return {
+        "title": selected_card["название"],
+        "text": selected_card["совет"],
+        "reused": False,
+        "date": current_date,
+        "source": "Gnome Horoscope API"
+    }
+
+def build_mercury_payload(date: str, today: str) -> Dict[str, Any]:
+    """Статус Меркурия на дату и недельный прогноз от сегодняшнего дня"""
+    return {
+        "success": True,
+        "current_status": get_mercury_status(date),
+        "weekly_forecast": get_weekly_mercury_forecast(today)
+    }
+
+def parse_date(value: str) -> str:
+    """Дата из запроса в виде ГГГГ-ММ-ДД; 400 — если это не дата"""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Дата должна быть в формате ГГГГ-ММ-ДД")
+
+def cacheable_date(date: str) -> bool:
+    """Дата в окне кэширования: от вчера (часовые пояса клиентов) до CACHE_DAYS_AHEAD дней вперед"""
+    today = datetime.now(timezone.utc).date()
+    return (today - timedelta(days=1)).isoformat() <= date <= (today + timedelta(days=CACHE_DAYS_AHEAD)).isoformat()
+
+def _cache_horoscope(sign: str, date: str) -> Dict[str, Any]:
+    horoscope = horoscope_cache.get((sign, date))
+    if horoscope is None:
+        horoscope = build_horoscope(sign, date)
+        if cacheable_date(date):
+            horoscope_cache[(sign, date)] = horoscope
+    return horoscope
+
+def _cache_day_card(current_date: str) -> Dict[str, Any]:
+    card_data = daily_cards_cache.get(current_date)
+    if card_data is None:
+        card_data = build_day_card(current_date)
+        daily_cards_cache[current_date] = card_data
+        logger.info(f"🆕 Новая карта дня для {current_date}: {card_data['title']}")
+    return card_data
+
+def _cache_mercury_payload(date: str, today: str) -> Dict[str, Any]:
+    payload = mercury_payload_cache.get((date, today))
+    if payload is None:
+        payload = build_mercury_payload(date, today)
+        if cacheable_date(date):
+            mercury_payload_cache[(date, today)] = payload
+    return payload
+
 @app.get("/api/horoscope")
 async def get_horoscope(sign: str, date: str = None):
+    # Проверяем до кэшей: в них попадают только настоящие знаки и даты
+    canonical = SIGNS_BY_NAME.get(sign.lower())
+    if canonical is None:
+        raise HTTPException(status_code=400, detail=f"Неизвестный знак зодиака: {sign}")
+    sign = canonical
+    date = parse_date(date) if date is not None else datetime.now(timezone.utc).strftime("%Y-%m-%d")
     try:
-        if date is None:
-            date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        
         logger.info(f"Запрос гороскопа для {sign} на {date}")
         
-        seed = hash(f"{sign}{date}") % len(HOROSCOPE_TEMPLATES)
-        horoscope_text = HOROSCOPE_TEMPLATES[seed]
+        requested_signs.setdefault(sign, None)
         
-        return {
-            "sign": sign,
-            "date": date,
-            "text": horoscope_text,
-            "cached": False,
-            "source": "Gnome Horoscope API"
-        }
+        cached = (sign, date) in horoscope_cache
+        horoscope = _cache_horoscope(sign, date)
+        return {**horoscope, "cached": cached}
     except Exception as e:
         logger.error(f"Ошибка при получении гороскопа: {str(e)}")
         raise HTTPException(status_code=500, detail="Ошибка при получении гороскопа")
@@ -347,23 +530,11 @@ async def get_day_card(request: Dict[str, Any] = {}):
         
         current_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
         
-        if current_date in daily_cards_cache:
-            card_data = daily_cards_cache[current_date]
+        card_data = daily_cards_cache.get(current_date)
+        if card_data is not None:
             logger.info(f"📦 Карта дня из кэша для {current_date}")
         else:
-            date_seed = hash(current_date) % len(DAY_CARDS)
-            selected_card = DAY_CARDS[date_seed]
-            
-            card_data = {
-                "title": selected_card["название"],
-                "text": selected_card["совет"],
-                "reused": False,
-                "date": current_date,
-                "source": "Gnome Horoscope API"
-            }
-            
-            daily_cards_cache[current_date] = card_data
-            logger.info(f"🆕 Новая карта дня для {current_date}: {selected_card['название']}")
+            card_data = _cache_day_card(current_date)
         
         return card_data
         
@@ -371,47 +542,49 @@ async def get_day_card(request: Dict[str, Any] = {}):
         logger.error(f"Ошибка при получении карты дня: {str(e)}")
         raise HTTPException(status_code=500, detail="Ошибка при получении карты дня")
 
+@app.on_event("startup")
+async def init_favorites():
+    await run_in_threadpool(favorites_store.init)
+
 @app.get("/api/favorites")
-async def get_favorites(initData: str = ""):
+async def get_favorites(initData: str = "", cursor: str = None, limit: int = FAVORITES_PAGE_SIZE):
+    user_id = resolve_user_id(initData)
     try:
-        user_id = initData or "anonymous"
-        favorites = user_favorites.get(user_id, [])
+        favorites, next_cursor, total = await run_in_threadpool(
+            favorites_store.page, user_id, cursor, limit
+        )
         return {
             "favorites": favorites,
             "success": True,
             "message": "Избранное загружено",
-            "count": len(favorites)
+            "count": len(favorites),
+            "total": total,
+            "next_cursor": next_cursor
         }
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный курсор")
     except Exception as e:
         logger.error(f"Ошибка при получении избранного: {str(e)}")
         raise HTTPException(status_code=500, detail="Ошибка при получении избранного")
 
 @app.post("/api/favorites")
 async def add_favorite(request: FavoriteRequest):
+    user_id = resolve_user_id(request.initData)
     try:
-        user_id = request.initData or "anonymous"
-        if user_id not in user_favorites:
-            user_favorites[user_id] = []
-        
-        favorite_item = {
-            "type": request.type,
-            "content": request.content,
-            "added_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        user_favorites[user_id].append(favorite_item)
+        added, total = await run_in_threadpool(
+            favorites_store.add, user_id, request.type, request.content
+        )
         return {
             "success": True,
-            "message": "Добавлено в избранное",
-            "total_favorites": len(user_favorites[user_id])
+            "message": "Добавлено в избранное" if added else "Уже в избранном",
+            "duplicate": not added,
+            "total_favorites": total
         }
     except Exception as e:
         logger.error(f"Ошибка при добавлении в избранное: {str(e)}")
         raise HTTPException(status_code=500, detail="Ошибка при добавлении в избранное")
 
-@app.get("/api/questions")
-async def get_all_questions():
-    """Отдаем все загруженные вопросы"""
+def build_questions_payload() -> Dict[str, Any]:
     return {
         "success": True,
         "questions": COUPLE_GAMES_DATA,
@@ -419,48 +592,90 @@ async def get_all_questions():
         "categories": list(COUPLE_GAMES_DATA.keys())
     }
 
+@app.get("/api/questions")
+async def get_all_questions():
+    """Отдаем все загруженные вопросы"""
+    return build_questions_payload()
+
+@app.get("/api/questions/{question_id}/stats")
+async def get_question_stats(question_id: int):
+    """Что чаще всего выбирают пары и как часто угадывают друг друга; id — индекс в /api/questions"""
+    question_set("mixed")
+    stats = answer_stats.stats(question_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Вопрос не найден")
+    return stats
+
 @app.get("/api/mercury-status")
 async def get_mercury_retrograde_status(date: str = None):
     """Получить текущий статус ретроградного Меркурия"""
+    if date is not None:
+        date = parse_date(date)
+        if not mercury_ephemeris.MIN_YEAR <= int(date[:4]) <= mercury_ephemeris.MAX_YEAR:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Статус Меркурия доступен для {mercury_ephemeris.MIN_YEAR}–{mercury_ephemeris.MAX_YEAR} годов"
+            )
     try:
         logger.info(f"Запрос статуса Меркурия на дату: {date}")
         
-        mercury_info = get_mercury_status(date)
-        weekly_forecast = get_weekly_mercury_forecast()
+        now = datetime.now(timezone.utc)
+        today = now.strftime("%Y-%m-%d")
+        key = (date or today, today)
         
-        return {
-            "success": True,
-            "current_status": mercury_info,
-            "weekly_forecast": weekly_forecast,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
+        payload = _cache_mercury_payload(*key)
+        
+        return {**payload, "timestamp": now.isoformat()}
         
     except Exception as e:
         logger.error(f"Ошибка получения статуса Меркурия: {str(e)}")
         raise HTTPException(status_code=500, detail="Ошибка получения статуса Меркурия")
 
+# ============ ПРОГРЕВ КЭШЕЙ ============
+def _prune_date_caches(oldest_date: str):
+    """Убрать из кэшей данные за прошедшие дни"""
+    for key in [key for key in horoscope_cache if key[1] < oldest_date]:
+        del horoscope_cache[key]
+    for key in [key for key in mercury_payload_cache if key[1] < oldest_date]:
+        del mercury_payload_cache[key]
+    for key in [key for key in daily_cards_cache if key < oldest_date]:
+        del daily_cards_cache[key]
+
+@cache_warmer.job
+async def warm_date_caches(date: str):
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    _prune_date_caches(today)
+    for sign in list(requested_signs):
+        _cache_horoscope(sign, date)
+    _cache_day_card(date)
+    _cache_mercury_payload(date, date)
+
+@app.on_event("startup")
+async def start_cache_warmer():
+    cache_warmer.start()
+
+@app.on_event("shutdown")
+async def stop_cache_warmer():
+    await cache_warmer.stop()
+
 # ============ МАРШРУТЫ ДЛЯ ИГР ============
 @app.post("/api/create-room")
 async def create_room(request: CreateRoomRequest):
     """Создать игровую комнату с новой логикой"""
     try:
         room_id = str(uuid.uuid4())[:8].upper()
+        created_at = datetime.now(timezone.utc)
         
-        room = {
-            "room_id": room_id,
-            "created_at": datetime.now(timezone.utc),
-            "players": [request.creator_name],
-            "game_type": request.game_type,
-            "current_question": 0,
-            "current_phase": 1,
-            "current_answerer": request.creator_name,
-            "answers": {},
-            "guesses": {},
-            "status": "waiting"
-        }
+        room = room_engine.new_room(
+            room_id, request.game_type, request.creator_name, created_at, request.max_players
+        )
         
         game_rooms[room_id] = room
-        logger.info(f"✅ Создана комната {room_id} для игры {request.game_type}")
+        room_journal.record(
+            room_engine.EVENT_CREATE, room_id, request.game_type, request.creator_name,
+            created_at.isoformat(), request.max_players
+        )
+        logger.info(f"✅ Создана комната {room_id} для игры {request.game_type} на {request.max_players} игроков")
         
         return {
             "success": True,
@@ -480,16 +695,16 @@ async def join_room(request: JoinRoomRequest):
             logger.warning(f"❌ Комната {request.room_id} не найдена")
             return {"success": False, "message": "Комната не найдена"}
         
-        if len(room["players"]) >= 2:
-            logger.warning(f"❌ Комната {request.room_id} полна")
-            return {"success": False, "message": "Комната полна"}
+        was_waiting = room["status"] == "waiting"
+        error = room_engine.add_player(room, request.player_name)
+        if error:
+            logger.warning(f"❌ Не удалось войти в комнату {request.room_id}: {error}")
+            return {"success": False, "message": error}
         
-        if request.player_name not in room["players"]:
-            room["players"].append(request.player_name)
-            logger.info(f"✅ Игрок {request.player_name} присоединился к комнате {request.room_id}")
+        room_journal.record(room_engine.EVENT_JOIN, request.room_id, request.player_name)
+        logger.info(f"✅ Игрок {request.player_name} присоединился к комнате {request.room_id}")
         
-        if len(room["players"]) == 2:
-            room["status"] = "playing"
+        if was_waiting and room["status"] == "playing":
             logger.info(f"🎮 Игра началась в комнате {request.room_id}")
         
         return {
@@ -505,6 +720,35 @@ async def join_room(request: JoinRoomRequest):
 
 
 
+@app.post("/api/start-game")
+async def start_game(request: StartGameRequest):
+    """Начать групповую игру, не дожидаясь заполнения комнаты (только создатель)"""
+    room = game_rooms.get(request.room_id)
+    if not room:
+        raise HTTPException(status_code=404, detail="Комната не найдена")
+    if room["players"][0] != request.player_name:
+        raise HTTPException(status_code=403, detail="Начать игру может только создатель комнаты")
+    
+    error = room_engine.start_game(room)
+    if error:
+        return {"success": False, "message": error}
+    
+    room_journal.record(room_engine.EVENT_START, request.room_id)
+    logger.info(f"🎮 Игра началась в комнате {request.room_id} ({len(room['players'])} игроков)")
+    return {"success": True, "players": room["players"], "status": room["status"]}
+
+def room_state(room_id: str, room: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "room_id": room_id,
+        "players": room["players"],
+        "status": room["status"],
+        "current_question": room["current_question"],
+        "current_phase": room["current_phase"],
+        "current_answerer": room["current_answerer"],
+        "player_count": len(room["players"]),
+        "max_players": room["max_players"]
+    }
+
 @app.get("/api/room-status/{room_id}")
 async def get_room_status(room_id: str):
     """Получить статус комнаты"""
@@ -513,13 +757,7 @@ async def get_room_status(room_id: str):
         if not room:
             raise HTTPException(status_code=404, detail="Комната не найдена")
         
-        return {
-            "room_id": room_id,
-            "players": room["players"],
-            "status": room["status"],
-            "current_question": room["current_question"],
-            "player_count": len(room["players"])
-        }
+        return room_state(room_id, room)
     except Exception as e:
         logger.error(f"❌ Ошибка получения статуса комнаты: {str(e)}")
         raise HTTPException(status_code=500, detail="Ошибка получения статуса")
@@ -532,17 +770,15 @@ async def get_game_question(room_id: str):
         if not room:
             raise HTTPException(status_code=404, detail="Комната не найдена")
         
-        game_questions = []
-        if room["game_type"] == "mixed":
-            for category in COUPLE_GAMES_DATA.values():
-                game_questions.extend(category)
-        else:
-            game_questions = COUPLE_GAMES_DATA.get(room["game_type"], [])
+        game_questions, _ = question_set(room["game_type"])
         
         total_rounds = len(game_questions) * 2
         
         if room["current_question"] >= total_rounds:
-            room["status"] = "completed"
+            if room["status"] != "completed":
+                completed_at = datetime.now(timezone.utc)
+                room_engine.mark_completed(room, completed_at)
+                room_journal.record(room_engine.EVENT_COMPLETE, room_id, completed_at.isoformat())
             return {"completed": True, "message": "Игра завершена!"}
         
         question_index = (room["current_question"] // 2) % len(game_questions)
@@ -552,24 +788,16 @@ async def get_game_question(room_id: str):
         
         question_data = game_questions[question_index]
         
-        if current_answerer == players[0]:
-            if phase == 1:
-                question_text = question_data["question"].replace("партнер", "вы").replace("ваш партнер", "вы")
-                instruction = f"({players[0]} отвечает за себя)"
-                role = "answering"
-            else:
-                question_text = question_data["question"].replace("партнер", players[1])
-                instruction = f"({players[0]} угадывает предпочтения {players[1]})"
-                role = "guessing"
+        # В фазе k за себя отвечает k-й игрок, остальные угадывают его ответ
+        phase_player = players[phase - 1]
+        if current_answerer == phase_player:
+            question_text = question_data["question"].replace("партнер", "вы").replace("ваш партнер", "вы")
+            instruction = f"({current_answerer} отвечает за себя)"
+            role = "answering"
         else:
-            if phase == 1:
-                question_text = question_data["question"].replace("партнер", players[0])
-                instruction = f"({players[1]} угадывает предпочтения {players[0]})"
-                role = "guessing"
-            else:
-                question_text = question_data["question"].replace("партнер", "вы").replace("ваш партнер", "вы")
-                instruction = f"({players[1]} отвечает за себя)"
-                role = "answering"
+            question_text = question_data["question"].replace("партнер", phase_player)
+            instruction = f"({current_answerer} угадывает предпочтения {phase_player})"
+            role = "guessing"
         
         return {
             "question_id": room["current_question"],
@@ -593,57 +821,98 @@ async def get_game_question(room_id: str):
 async def submit_answer(request: AnswerRequest):
     """Отправить ответ с новой логикой"""
     try:
+        error = room_engine.answer_key_error(request.question_id, request.phase)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+        
         room = game_rooms.get(request.room_id)
         if not room:
             raise HTTPException(status_code=404, detail="Комната не найдена")
         
-        players = room["players"]
-        current_answerer = room["current_answerer"]
-        phase = room["current_phase"]
+        if room_engine.is_duplicate(room, request.player_name, request.question_id, request.phase):
+            # Повтор уже принятого ответа (например, ретрай после обрыва связи)
+            still_current = (request.question_id, request.phase) == (room["current_question"], room["current_phase"])
+            return {
+                "success": True,
+                "duplicate": True,
+                "waiting_for_partner": still_current,
+                "message": "Ответ уже был принят"
+            }
         
-        if request.player_name == current_answerer:
-            if phase == 1 and current_answerer == players[0]:
-                room["answers"][f"{request.question_id}_{players[0]}"] = request.answer
-            elif phase == 2 and current_answerer == players[1]:
-                room["answers"][f"{request.question_id}_{players[1]}"] = request.answer
-            else:
-                target_player = players[1] if request.player_name == players[0] else players[0]
-                room["guesses"][f"{request.question_id}_{request.player_name}_about_{target_player}"] = request.answer
-        else:
-            target_player = current_answerer
-            room["guesses"][f"{request.question_id}_{request.player_name}_about_{target_player}"] = request.answer
-        
-        round_complete = False
-        if phase == 1:
-            answer_key = f"{request.question_id}_{current_answerer}"
-            guesser = players[1] if current_answerer == players[0] else players[0]
-            guess_key = f"{request.question_id}_{guesser}_about_{current_answerer}"
-            round_complete = answer_key in room["answers"] and guess_key in room["guesses"]
-        else:
-            answer_key = f"{request.question_id}_{current_answerer}"
-            guesser = players[0] if current_answerer == players[1] else players[1]
-            guess_key = f"{request.question_id}_{guesser}_about_{current_answerer}"
-            round_complete = answer_key in room["answers"] and guess_key in room["guesses"]
-        
-        if round_complete:
-            if phase == 1:
-                room["current_phase"] = 2
-                room["current_answerer"] = players[1] if current_answerer == players[0] else players[0]
-            else:
-                room["current_question"] += 1
-                room["current_phase"] = 1
-                room["current_answerer"] = players[0]
+        error = room_engine.answer_error(room, request.player_name, request.question_id, request.phase)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+        
+        answerer = room["current_answerer"]
+        round_complete = room_engine.apply_answer(
+            room, request.player_name, request.question_id, request.answer
+        )
+        room_journal.record(
+            room_engine.EVENT_ANSWER, request.room_id, request.player_name, request.question_id, request.answer
+        )
+        record_answer_stats(room, answerer, request.player_name, request.question_id, request.answer, round_complete)
         
         return {
             "success": True,
             "waiting_for_partner": not round_complete,
-            "message": "Ответ сохранен!" if not round_complete else "Оба ответили! Следующий этап."
+            "message": "Ответ сохранен!" if not round_complete else "Все ответили! Следующий этап."
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Ошибка отправки ответа: {str(e)}")
         raise HTTPException(status_code=500, detail="Ошибка отправки ответа")
 
+@app.post("/api/submit-answers")
+async def submit_answers(request: AnswerBatchRequest):
+    """Пакет ответов игрока по порядку: применяется целиком или не применяется вовсе.
+
+    Уже принятые ответы (тот же вопрос и фаза) пропускаются, поэтому
+    пакет можно безопасно повторять. Возвращает итоговое состояние комнаты.
+    """
+    room = game_rooms.get(request.room_id)
+    if not room:
+        raise HTTPException(status_code=404, detail="Комната не найдена")
+    if not 0 < len(request.answers) <= MAX_ANSWER_BATCH:
+        raise HTTPException(status_code=400, detail=f"В пакете должно быть от 1 до {MAX_ANSWER_BATCH} ответов")
+    for index, item in enumerate(request.answers):
+        error = room_engine.answer_key_error(item.question_id, item.phase)
+        if error:
+            raise HTTPException(status_code=400, detail={"message": error, "index": index})
+    
+    # Пробное применение к копии: при ошибке комната остается нетронутой
+    draft = room_engine.copy_room(room)
+    applied, duplicates = [], 0
+    for index, item in enumerate(request.answers):
+        if room_engine.is_duplicate(draft, request.player_name, item.question_id, item.phase):
+            duplicates += 1
+            continue
+        error = room_engine.answer_error(draft, request.player_name, item.question_id, item.phase)
+        if error:
+            raise HTTPException(status_code=409, detail={
+                "message": error,
+                "index": index,
+                "room": room_state(request.room_id, room)
+            })
+        answerer = draft["current_answerer"]
+        round_complete = room_engine.apply_answer(draft, request.player_name, item.question_id, item.answer)
+        applied.append((answerer, item, round_complete))
+    
+    room.update(draft)
+    for answerer, item, round_complete in applied:
+        room_journal.record(
+            room_engine.EVENT_ANSWER, request.room_id, request.player_name, item.question_id, item.answer
+        )
+        record_answer_stats(room, answerer, request.player_name, item.question_id, item.answer, round_complete)
+    
+    return {
+        "success": True,
+        "applied": len(applied),
+        "duplicates": duplicates,
+        "room": room_state(request.room_id, room)
+    }
+
 @app.get("/api/game-results/{room_id}")
 async def get_game_results(room_id: str):
     """Получить результаты игры с новой логикой подсчета"""
@@ -656,46 +925,53 @@ async def get_game_results(room_id: str):
             return {"completed": False, "message": "Игра еще не завершена"}
         
         players = room["players"]
-        answers = room.get("answers", {})
-        guesses = room.get("guesses", {})
         
-        correct_guesses = 0
-        total_guesses = 0
-        results = []
+        game_questions, _ = question_set(room["game_type"])
         
-        game_questions = []
-        if room["game_type"] == "mixed":
-            for category in COUPLE_GAMES_DATA.values():
-                game_questions.extend(category)
+        # Матрицы кодов: ответы игроки × вопросы, догадки угадывающий × цель × вопросы
+        count, total_questions = len(players), len(game_questions)
+        answers = room["answers"].view(count, total_questions)
+        guess_rows = [room_engine.guess_row(room, g, t) for g in range(count) for t in range(count)]
+        guesses = room["guesses"].view(max(guess_rows) + 1, total_questions)[guess_rows].reshape(
+            count, count, total_questions
+        )
+        hits, attempts = group_scoring.guess_counts(answers, guesses)
+        correct_guesses = int(hits.sum())
+        total_guesses = int(attempts.sum())
+        percent = group_scoring.pair_percent(hits, attempts)
+        
+        answer_rows = [room["answers"].decode(row) for row in answers]
+        if count == 2:
+            guess_1 = room["guesses"].decode(guesses[1, 0])
+            guess_2 = room["guesses"].decode(guesses[0, 1])
+            results = [
+                {
+                    "question_id": q_id,
+                    "question": game_questions[q_id]["question"],
+                    "player1_answer": answer_rows[0][q_id],
+                    "player2_guess_about_player1": guess_1[q_id],
+                    "player2_answer": answer_rows[1][q_id],
+                    "player1_guess_about_player2": guess_2[q_id],
+                    "p2_guessed_p1_correctly": bool(answer_rows[0][q_id]) and answer_rows[0][q_id] == guess_1[q_id],
+                    "p1_guessed_p2_correctly": bool(answer_rows[1][q_id]) and answer_rows[1][q_id] == guess_2[q_id]
+                }
+                for q_id in range(total_questions)
+            ]
         else:
-            game_questions = COUPLE_GAMES_DATA.get(room["game_type"], [])
-        
-        for q_id in range(len(game_questions)):
-            p1_answer = answers.get(f"{q_id}_{players[0]}")
-            p2_guess_about_p1 = guesses.get(f"{q_id}_{players[1]}_about_{players[0]}")
-            p2_answer = answers.get(f"{q_id}_{players[1]}")
-            p1_guess_about_p2 = guesses.get(f"{q_id}_{players[0]}_about_{players[1]}")
-            
-            if p1_answer and p2_guess_about_p1:
-                total_guesses += 1
-                if p1_answer == p2_guess_about_p1:
-                    correct_guesses += 1
-                    
-            if p2_answer and p1_guess_about_p2:
-                total_guesses += 1
-                if p2_answer == p1_guess_about_p2:
-                    correct_guesses += 1
-            
-            results.append({
-                "question_id": q_id,
-                "question": game_questions[q_id]["question"],
-                "player1_answer": p1_answer,
-                "player2_guess_about_player1": p2_guess_about_p1,
-                "player2_answer": p2_answer,
-                "player1_guess_about_player2": p1_guess_about_p2,
-                "p2_guessed_p1_correctly": p1_answer == p2_guess_about_p1 if p1_answer and p2_guess_about_p1 else False,
-                "p1_guessed_p2_correctly": p2_answer == p1_guess_about_p2 if p2_answer and p1_guess_about_p2 else False
-            })
+            # В групповой игре догадок слишком много для ответа — по вопросу только
+            # ответы игроков и число верных догадок
+            correct_by_question = (
+                (guesses == answers[None, :, :]) & (guesses != group_scoring.MISSING)
+            ).sum(axis=(0, 1)).tolist()
+            results = [
+                {
+                    "question_id": q_id,
+                    "question": game_questions[q_id]["question"],
+                    "answers": {name: row[q_id] for name, row in zip(players, answer_rows)},
+                    "correct_guesses": correct_by_question[q_id]
+                }
+                for q_id in range(total_questions)
+            ]
         
         compatibility_percent = (correct_guesses / total_guesses * 100) if total_guesses > 0 else 0
         gnome_analysis = get_gnome_compatibility_analysis(compatibility_percent)
@@ -706,6 +982,7 @@ async def get_game_results(room_id: str):
             "total_guesses": total_guesses,
             "compatibility_percent": compatibility_percent,
             "results": results,
+            **group_scoring.compatibility_report(percent, players),
             "gnome_analysis": gnome_analysis,
             "explanation": f"Из {total_guesses} попыток угадать предпочтения партнера правильными оказались {correct_guesses}"
         }
@@ -754,6 +1031,40 @@ def get_gnome_compatibility_analysis(percent: float) -> dict:
 async def robots_txt():
     return "User-agent: *\nDisallow: /"
 
+# ============ ДИАГНОСТИКА ============
+diagnostics.install(app, lag_monitor)
+memory_diagnostics.install(app, {
+    "game_rooms": lambda: game_rooms,
+    "daily_cards_cache": lambda: daily_cards_cache,
+    "horoscope_cache": lambda: horoscope_cache,
+    "mercury_payload_cache": lambda: mercury_payload_cache,
+    "question_catalog": lambda: COUPLE_GAMES_DATA,
+    "init_data_cache": lambda: init_data_verifier.cache,
+    "room_journal_buffer": lambda: room_journal,
+    "answer_stats": lambda: answer_stats,
+}, deep_types=(group_scoring.AnswerMatrix,))
+
+# ============ ПРЕДЗАГРУЗКА ДЛЯ serve.py ============
+def preload(reload: bool = False):
+    """Выполняется в мастере до fork: воркеры получают каталог и таблицы общими страницами"""
+    if reload:
+        load_questions_from_file()
+    question_set("mixed")
+    today = datetime.now(timezone.utc)
+    for day in (today, today + timedelta(days=1)):
+        date = day.strftime("%Y-%m-%d")
+        _cache_day_card(date)
+        _cache_mercury_payload(date, date)
+
+# Комнаты HTTP-игр, журнал комнат, лимиты запросов и кэши принадлежат одному
+# процессу, а ядро не привязывает клиента к воркеру. Для нескольких воркеров
+# комнаты нужно было бы держать в общем для процессов состоянии (как шина
+# комнат у websocket_server) — его нет, поэтому serve.py запустит один воркер
+MAX_WORKERS = 1
+# Журнал комнат пишет один процесс: при SIGHUP новый воркер запускает
+# приложение и восстанавливает комнаты только после выхода старого
+RESTART_HANDOFF = True
+
 # ============ ЗАПУСК ПРИЛОЖЕНИЯ ============
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,239 @@
+"""Учет памяти хранилищ и сравнение снимков tracemalloc.
+
+Включается переменной окружения GNOME_MEMORY_DIAGNOSTICS=1.
+GET  /debug/memory                 — примерный глубокий размер и число записей по хранилищам
+POST /debug/memory/snapshot        — снять снимок tracemalloc (трассировка включается при первом снимке)
+GET  /debug/memory/diff?base=&target= — самые растущие места выделения между снимками
+POST /debug/memory/stop            — выключить трассировку и забыть снимки
+"""
+import os
+import gc
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# ============ НАСТРОЙКИ ============
+MEMORY_DIAGNOSTICS_ENABLED = os.environ.get("GNOME_MEMORY_DIAGNOSTICS", "0") == "1"
+TRACEMALLOC_FRAMES = int(os.environ.get("TRACEMALLOC_FRAMES", 10))
+SAMPLE_ENTRIES = 200
+MAX_DEPTH = 8
+MAX_SNAPSHOTS = 5
+
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+
+
+# Классы, чьи атрибуты считаются частью записи (см. install). Атрибуты прочих
+# объектов не обходим: у WebSocket через scope видно все приложение
+DEEP_TYPES: Set[type] = set()
+
+
+# ============ ГЛУБОКИЙ РАЗМЕР ============
+def deep_sizeof(obj: Any, seen: Optional[set] = None, depth: int = 0) -> int:
+    """Размер объекта вместе со вложенными контейнерами (общие объекты считаются один раз).
+
+    Контейнеры копируются одним вызовом перед обходом: подсчет идет в потоке,
+    пока цикл событий меняет хранилища.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or depth > MAX_DEPTH:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in list(obj.items()):
+            size += deep_sizeof(key, seen, depth + 1) + deep_sizeof(value, seen, depth + 1)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in list(obj):
+            size += deep_sizeof(item, seen, depth + 1)
+    elif type(obj) in DEEP_TYPES:
+        size += deep_sizeof(vars(obj), seen, depth + 1)
+    elif hasattr(obj, "nbytes"):
+        # Массивы numpy хранят данные вне getsizeof, если это представление
+        size += 0 if obj.base is None else obj.nbytes
+    return size
+
+
+def estimate_store(store: Any) -> Dict[str, Any]:
+    """Оценка размера хранилища по выборке записей.
+
+    Объект с методом memory_usage(sizeof) сам сообщает, что в нем считать.
+    """
+    memory_usage = getattr(store, "memory_usage", None)
+    if callable(memory_usage):
+        return {**memory_usage(deep_sizeof), "sampled": False}
+    if isinstance(store, dict):
+        items = store.items()
+        # Пара (ключ, значение) создается при обходе — считаем только ее содержимое
+        entry_size = lambda item, seen: deep_sizeof(item[0], seen) + deep_sizeof(item[1], seen)
+    elif isinstance(store, (list, tuple, set)):
+        items = store
+        entry_size = deep_sizeof
+    else:
+        return {"entries": None, "approx_bytes": deep_sizeof(store), "sampled": False}
+
+    entries = len(store)
+    container = sys.getsizeof(store)
+    if entries <= SAMPLE_ENTRIES:
+        seen = set()
+        return {"entries": entries, "approx_bytes": container + sum(entry_size(item, seen) for item in list(items)),
+                "sampled": False}
+
+    # Равномерная выборка с шагом: проход по итератору идет в C и дешев
+    sample = list(islice(items, 0, None, entries // SAMPLE_ENTRIES))[:SAMPLE_ENTRIES]
+    seen = set()
+    per_entry = sum(entry_size(item, seen) for item in sample) / len(sample)
+    return {"entries": entries, "approx_bytes": int(container + per_entry * entries), "sampled": True}
+
+
+def process_rss() -> Optional[int]:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def process_memory(pid: Any = "self") -> Dict[str, int]:
+    """RSS процесса и его разбивка на общие и собственные страницы, байты.
+
+    pss делит общие страницы поровну между процессами, которые их видят, —
+    по нему видно, сколько воркер стоит на самом деле. Пустой словарь вне Linux.
+    """
+    fields = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared", "Shared_Dirty": "shared",
+              "Private_Clean": "private", "Private_Dirty": "private"}
+    memory: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                key = fields.get(name)
+                if key is not None:
+                    memory[key] = memory.get(key, 0) + int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return memory
+
+
+# ============ СНИМКИ TRACEMALLOC ============
+class SnapshotStore:
+    """Последние снимки tracemalloc с номерами"""
+
+    def __init__(self, limit: int = MAX_SNAPSHOTS):
+        self.limit = limit
+        self.snapshots: "OrderedDict[int, tuple]" = OrderedDict()
+        self._next_id = 0
+        # Снимки снимаются и сравниваются в пуле потоков
+        self._lock = threading.Lock()
+
+    def take(self) -> Dict[str, Any]:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                logger.info(f"🧠 tracemalloc включен ({TRACEMALLOC_FRAMES} кадров)")
+            snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            self._next_id += 1
+            snapshot_id = self._next_id
+            self.snapshots[snapshot_id] = (time.time(), snapshot)
+            if len(self.snapshots) > self.limit:
+                self.snapshots.popitem(last=False)
+        current, peak = tracemalloc.get_traced_memory()
+        return {"snapshot_id": snapshot_id, "traced_bytes": current, "traced_peak_bytes": peak}
+
+    def get(self, snapshot_id: int):
+        entry = self.snapshots.get(snapshot_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail=f"Снимок {snapshot_id} не найден")
+        return entry[1]
+
+    def diff(self, base_id: int, target_id: Optional[int], top: int, group_by: str) -> Dict[str, Any]:
+        if target_id is None:
+            target_id = self.take()["snapshot_id"]
+        stats = self.get(target_id).compare_to(self.get(base_id), group_by)
+        growing = [stat for stat in stats if stat.size_diff > 0][:top]
+        return {
+            "base": base_id,
+            "target": target_id,
+            "total_size_diff": sum(stat.size_diff for stat in stats),
+            "top_growth": [
+                {
+                    "site": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                    "size_diff": stat.size_diff,
+                    "size": stat.size,
+                    "count_diff": stat.count_diff,
+                    "count": stat.count,
+                }
+                for stat in growing
+            ],
+        }
+
+    def stop(self):
+        with self._lock:
+            self.snapshots.clear()
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+
+snapshots = SnapshotStore()
+
+
+def install(app: FastAPI, stores: Dict[str, Callable[[], Any]], deep_types: Iterable[type] = ()):
+    """Подключает диагностику памяти к приложению, если она включена.
+
+    deep_types — классы из записей хранилищ, атрибуты которых нужно считать.
+    """
+    if not MEMORY_DIAGNOSTICS_ENABLED:
+        return
+    DEEP_TYPES.update(deep_types)
+
+    def measure_stores() -> Dict[str, Any]:
+        return {name: estimate_store(getter()) for name, getter in stores.items()}
+
+    @app.get("/debug/memory")
+    async def debug_memory():
+        """Размеры хранилищ в памяти процесса"""
+        started = time.perf_counter()
+        # Обход тысяч записей не должен останавливать цикл событий
+        report = await run_in_threadpool(measure_stores)
+        return {
+            "stores": report,
+            "rss_bytes": process_rss(),
+            "gc_counts": gc.get_count(),
+            "tracemalloc": tracemalloc.is_tracing(),
+            "snapshots": list(snapshots.snapshots),
+            "sampling_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    @app.post("/debug/memory/snapshot")
+    async def debug_memory_snapshot():
+        return await run_in_threadpool(snapshots.take)
+
+    @app.get("/debug/memory/diff")
+    async def debug_memory_diff(base: int, target: int = None, top: int = 20, group_by: str = "lineno"):
+        """Места выделения, которые выросли сильнее всего между снимками"""
+        if group_by not in ("lineno", "filename", "traceback"):
+            raise HTTPException(status_code=400, detail="group_by: lineno, filename или traceback")
+        return await run_in_threadpool(snapshots.diff, base, target, top, group_by)
+
+    @app.post("/debug/memory/stop")
+    async def debug_memory_stop():
+        await run_in_threadpool(snapshots.stop)
+        return {"tracemalloc": False}
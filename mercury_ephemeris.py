@@ -0,0 +1,240 @@
+"""Эфемериды ретроградного Меркурия, вычисленные по орбитальным элементам.
+
+Геоцентрическая долгота Меркурия считается векторно для всех дней года
+(кеплеровские элементы JPL для Меркурия и барицентра Земля-Луна).
+По смене знака суточного движения находятся станции, по долготам станций —
+даты теневых периодов. Результаты кэшируются по годам в памяти; на диск
+сохраняются только годы, посчитанные при предзагрузке.
+"""
+import os
+import json
+import logging
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ============ НАСТРОЙКИ ============
+EPHEMERIS_PATH = os.environ.get("MERCURY_EPHEMERIS_PATH", "mercury_ephemeris.json")
+# Годы, для которых годятся элементы орбит ниже (Standish: 1800–2050 н. э.);
+# вне диапазона периоды не считаются, поэтому и кэши по годам ограничены им
+MIN_YEAR = 1800
+MAX_YEAR = 2050
+
+# Элементы орбит на J2000 и их вековые изменения (Standish, JPL):
+# a [а.е.], e, I [°], L [°], долгота перигелия [°], долгота узла [°]
+ELEMENTS = {
+    "mercury": (
+        (0.38709927, 0.20563593, 7.00497902, 252.25032350, 77.45779628, 48.33076593),
+        (0.00000037, 0.00001906, -0.00594749, 149472.67411175, 0.16047689, -0.12534081),
+    ),
+    "earth": (
+        (1.00000261, 0.01671123, -0.00001531, 100.46457166, 102.93768193, 0.0),
+        (0.00000562, -0.00004392, -0.01294668, 35999.37244981, 0.32327364, 0.0),
+    ),
+}
+
+J2000 = date(2000, 1, 1)
+# Общая прецессия по долготе, °/столетие — перевод в тропическую долготу даты
+PRECESSION = 1.396971
+
+ZODIAC_SIGNS = [
+    "Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo",
+    "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"
+]
+
+SIGN_ELEMENTS = {
+    "Aries": "fire", "Leo": "fire", "Sagittarius": "fire",
+    "Taurus": "earth", "Virgo": "earth", "Capricorn": "earth",
+    "Gemini": "air", "Libra": "air", "Aquarius": "air",
+    "Cancer": "water", "Scorpio": "water", "Pisces": "water",
+}
+
+# Влияния по знаку начала ретрограда; для остальных знаков — по стихии
+SIGN_INFLUENCES = {
+    "Aries": {
+        "communication": "Будьте осторожны в переписке, перечитывайте сообщения дважды",
+        "travel": "Планы поездок могут измениться, проверяйте билеты",
+        "technology": "Делайте резервные копии данных, технические сбои возможны",
+        "relationships": "Старые знакомые могут неожиданно выйти на связь"
+    },
+    "Leo": {
+        "creativity": "Пересмотрите творческие проекты, вдохновение найдет новые пути",
+        "self_expression": "Осторожнее с публичными заявлениями и самопрезентацией",
+        "romance": "В отношениях возможны недопонимания из-за гордости",
+        "performance": "Выступления и презентации требуют особой подготовки"
+    },
+    "Sagittarius": {
+        "learning": "Пересмотрите планы обучения, возможны задержки в учебе",
+        "travel": "Дальние поездки требуют особого внимания к деталям",
+        "beliefs": "Время переосмыслить свои взгляды и философию жизни",
+        "legal": "Юридические вопросы лучше отложить на более поздний срок"
+    },
+}
+
+ELEMENT_INFLUENCES = {
+    "fire": SIGN_INFLUENCES["Aries"],
+    "earth": {
+        "finances": "Перепроверяйте счета и платежи, ошибки в цифрах вероятны",
+        "work": "Рабочие планы могут сдвинуться, оставляйте запас времени",
+        "purchases": "Крупные покупки лучше отложить до окончания ретрограда",
+        "health": "Вернитесь к полезным привычкам, которые были заброшены"
+    },
+    "air": {
+        "communication": "Слова легко понять неправильно, уточняйте договоренности",
+        "contracts": "Внимательно читайте договоры перед подписанием",
+        "technology": "Гаджеты и связь капризничают, сохраняйте важные данные",
+        "social": "Старые друзья и идеи возвращаются в вашу жизнь"
+    },
+    "water": {
+        "emotions": "Чувства обострены, не принимайте решений сгоряча",
+        "family": "Семейные разговоры требуют терпения и мягкости",
+        "intuition": "Сны и предчувствия подсказывают, что нужно завершить",
+        "relationships": "Прошлые отношения могут напомнить о себе"
+    },
+}
+
+_year_cache: Dict[int, List[Dict[str, Any]]] = {}
+_around_cache: Dict[int, List[Dict[str, Any]]] = {}
+
+
+# ============ ВЫЧИСЛЕНИЕ ============
+def _heliocentric(planet: str, T: np.ndarray) -> np.ndarray:
+    """Гелиоцентрические эклиптические координаты J2000, форма (3, len(T))"""
+    base, rate = ELEMENTS[planet]
+    a, e, inc, L, varpi, node = (b + r * T for b, r in zip(base, rate))
+    inc, L, varpi, node = (np.radians(x) for x in (inc, L, varpi, node))
+
+    M = np.remainder(L - varpi, 2 * np.pi)
+    E = M + e * np.sin(M)
+    for _ in range(6):
+        E -= (E - e * np.sin(E) - M) / (1 - e * np.cos(E))
+
+    x_orb = a * (np.cos(E) - e)
+    y_orb = a * np.sqrt(1 - e * e) * np.sin(E)
+
+    w = varpi - node
+    cw, sw, cn, sn, ci, si = np.cos(w), np.sin(w), np.cos(node), np.sin(node), np.cos(inc), np.sin(inc)
+    x = (cw * cn - sw * sn * ci) * x_orb + (-sw * cn - cw * sn * ci) * y_orb
+    y = (cw * sn + sw * cn * ci) * x_orb + (-sw * sn + cw * cn * ci) * y_orb
+    z = (sw * si) * x_orb + (cw * si) * y_orb
+    return np.stack((x, y, z))
+
+
+def geocentric_longitude(days: np.ndarray) -> np.ndarray:
+    """Геоцентрическая тропическая долгота Меркурия в градусах (без свертки по 360)"""
+    T = days / 36525.0
+    vector = _heliocentric("mercury", T) - _heliocentric("earth", T)
+    longitude = np.degrees(np.unwrap(np.arctan2(vector[1], vector[0])))
+    return longitude + PRECESSION * T
+
+
+def _sign(longitude: float) -> str:
+    return ZODIAC_SIGNS[int(longitude % 360 // 30)]
+
+
+def compute_year(year: int) -> List[Dict[str, Any]]:
+    """Ретроградные периоды, начинающиеся в указанном году"""
+    start = date(year - 1, 10, 1)
+    offset = (start - J2000).days
+    # Полночь UTC каждого дня; эпоха J2000 — полдень 1 января 2000
+    days = np.arange(offset, offset + 550, dtype=np.float64) - 0.5
+    longitude = geocentric_longitude(days)
+
+    retrograde = np.diff(longitude) < 0
+    # Индексы дней, с которых движение меняет направление
+    stations_r = np.flatnonzero(~retrograde[:-1] & retrograde[1:]) + 1
+    stations_d = np.flatnonzero(retrograde[:-1] & ~retrograde[1:]) + 1
+
+    periods = []
+    for station_r in stations_r.tolist():
+        later = stations_d[stations_d > station_r]
+        if not len(later):
+            continue
+        station_d = int(later[0])
+        retrograde_start = start + timedelta(days=station_r)
+        if retrograde_start.year != year:
+            continue
+
+        # Тень до: последний день перед станцией R, когда Меркурий был до долготы станции D
+        below = np.flatnonzero(longitude[:station_r] < longitude[station_d])
+        # Тень после: первый день после станции D, когда он вернулся к долготе станции R
+        above = np.flatnonzero(longitude[station_d:] >= longitude[station_r])
+        if not len(below) or not len(above):
+            continue
+        pre_shadow = int(below[-1]) + 1
+        post_shadow = station_d + int(above[0])
+
+        signs = list(dict.fromkeys(_sign(x) for x in longitude[station_r:station_d + 1]))
+        periods.append({
+            "phase": f"Mercury Retrograde #{len(periods) + 1}",
+            "pre_shadow_start": (start + timedelta(days=pre_shadow)).isoformat(),
+            "retrograde_start": retrograde_start.isoformat(),
+            "retrograde_end": (start + timedelta(days=int(station_d))).isoformat(),
+            "post_shadow_end": (start + timedelta(days=post_shadow)).isoformat(),
+            "signs": signs,
+            "influences": SIGN_INFLUENCES.get(signs[0]) or ELEMENT_INFLUENCES[SIGN_ELEMENTS[signs[0]]]
+        })
+    return periods
+
+
+# ============ КЭШ ============
+def _load_disk() -> Dict[int, List[Dict[str, Any]]]:
+    path = Path(EPHEMERIS_PATH)
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return {int(year): periods for year, periods in json.load(f).items()}
+    except (ValueError, OSError) as e:
+        logger.warning(f"⚠️ Не удалось прочитать кэш эфемерид {path}: {e}")
+        return {}
+
+
+def _save_disk():
+    path = Path(EPHEMERIS_PATH)
+    tmp_path = path.with_suffix(".tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({str(year): periods for year, periods in sorted(_year_cache.items())}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"⚠️ Не удалось сохранить кэш эфемерид {path}: {e}")
+
+
+def periods_for_year(year: int) -> List[Dict[str, Any]]:
+    """Периоды года из кэша; при промахе — вычислить.
+
+    Промах случается в обработчике запроса, поэтому результат остается только
+    в памяти: файл целиком переписывается лишь в preload().
+    """
+    periods = _year_cache.get(year)
+    if periods is None:
+        periods = compute_year(year)
+        _year_cache[year] = periods
+    return periods
+
+
+def periods_around(year: int) -> List[Dict[str, Any]]:
+    """Периоды, тени которых могут задевать даты указанного года"""
+    if not MIN_YEAR <= year <= MAX_YEAR:
+        raise ValueError(f"Эфемериды считаются для {MIN_YEAR}–{MAX_YEAR} годов, а не для {year}")
+    periods = _around_cache.get(year)
+    if periods is None:
+        periods = periods_for_year(year - 1) + periods_for_year(year) + periods_for_year(year + 1)
+        _around_cache[year] = periods
+    return periods
+
+
+def preload(years: Iterable[int]):
+    """Загрузить кэш с диска и досчитать недостающие годы"""
+    _year_cache.update(_load_disk())
+    missing = [year for year in years if year not in _year_cache]
+    for year in missing:
+        _year_cache[year] = compute_year(year)
+    if missing:
+        _save_disk()
+    logger.info(f"🪐 Эфемериды Меркурия готовы для {len(_year_cache)} лет")
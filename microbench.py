@@ -0,0 +1,369 @@
+"""Микробенчмарки горячих функций игр и астро-API с порогами регрессии.
+
+Каждая функция прогоняется на синтетических комнатах и каталогах вопросов
+растущего размера. Для каждого случая пишется время на операцию и пик
+выделенной памяти (tracemalloc) на одну операцию. Результаты сравниваются
+с bench_thresholds.json; превышение допуска — код выхода 1.
+
+Время зависит от машины, поэтому в том же процессе меряется калибровочная
+нагрузка (словари, строки, JSON — как в обработчиках). Базовое время случая
+масштабируется отношением текущей калибровки к записанной вместе с порогами.
+
+    python microbench.py              # прогнать и сравнить с порогами
+    python microbench.py --update     # полный прогон, записать результаты как базовые
+    python microbench.py --quick      # только малые размеры
+    python microbench.py -k finish    # только случаи, содержащие подстроку
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Бенчмарк не должен трогать рабочую базу, журнал и кэш эфемерид
+_scratch = tempfile.mkdtemp(prefix="gnome-microbench-")
+os.environ.setdefault("DATABASE_PATH", os.path.join(_scratch, "database.db"))
+os.environ.setdefault("ROOM_JOURNAL_DIR", os.path.join(_scratch, "room_journal"))
+os.environ.setdefault("MERCURY_EPHEMERIS_PATH", os.path.join(_scratch, "mercury_ephemeris.json"))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import main
+import websocket_server
+from room_bus import InProcessRoomBus
+
+THRESHOLDS_PATH = Path(__file__).with_name("bench_thresholds.json")
+# Имя калибровочного замера в результатах и в порогах
+CALIBRATION = "calibration"
+# Допуск по умолчанию: на какую долю можно превысить базовое значение.
+# Время шумит сильнее памяти; пороги снимаются на той машине, где идет проверка
+DEFAULT_TIME_TOLERANCE = 1.0
+DEFAULT_MEMORY_TOLERANCE = 0.25
+MIN_BENCH_TIME = 0.5
+REPEATS = 5
+MAX_ITERATIONS = 10_000
+
+ROOM_SIZES = [1, 1_000, 100_000]
+QUESTION_SIZES = [75, 1_000, 100_000]
+QUICK_ROOM_SIZES = [1, 1_000]
+QUICK_QUESTION_SIZES = [75, 1_000]
+
+
+# ============ СИНТЕТИЧЕСКИЕ ДАННЫЕ ============
+def make_catalog(total_questions: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Каталог из трех категорий, как в questions.json"""
+    categories = ["fruit_game", "preference_test", "date_ideas"]
+    catalog = {category: [] for category in categories}
+    for i in range(total_questions):
+        catalog[categories[i % 3]].append({
+            "question": f"Вопрос {i}: что выберет ваш партнер?",
+            "options": [f"Вариант {j}" for j in range(6)],
+            "category": "bench"
+        })
+    return catalog
+
+
+def make_http_room(room_id: str, created_at: datetime) -> Dict[str, Any]:
+    """Комната HTTP-движка на двоих, игра идет"""
+    room = main.room_engine.new_room(room_id, "mixed", "Аня", created_at)
+    main.room_engine.add_player(room, "Боря")
+    return room
+
+
+def make_http_rooms(count: int, completed: bool = False) -> List[str]:
+    """Комнаты HTTP-движка на двоих; completed — с ответами на все вопросы"""
+    main.game_rooms.clear()
+    created_at = datetime.now(timezone.utc)
+    total = sum(len(category) for category in main.COUPLE_GAMES_DATA.values())
+    room_ids = []
+    for i in range(count):
+        room_id = f"B{i:07d}"
+        room = make_http_room(room_id, created_at)
+        if completed:
+            for q in range(total):
+                room["answers"].set(0, q, "Вариант 1")
+                room["answers"].set(1, q, "Вариант 2")
+                room["guesses"].set(main.room_engine.guess_row(room, 1, 0), q, "Вариант 1")
+                room["guesses"].set(main.room_engine.guess_row(room, 0, 1), q, "Вариант 3")
+            room["status"] = "completed"
+        main.game_rooms[room_id] = room
+        room_ids.append(room_id)
+    return room_ids
+
+
+def make_group_room(players: int) -> str:
+    """Завершенная групповая комната: все ответили и угадали все вопросы"""
+    main.game_rooms.clear()
+    total = sum(len(category) for category in main.COUPLE_GAMES_DATA.values())
+    room = main.room_engine.new_room("G0000000", "mixed", "Игрок 0", datetime.now(timezone.utc), players)
+    for p in range(1, players):
+        main.room_engine.add_player(room, f"Игрок {p}")
+    for q in range(total):
+        for p in range(players):
+            room["answers"].set(p, q, f"Вариант {(p + q) % 6}")
+            for target in range(players):
+                if target != p:
+                    room["guesses"].set(main.room_engine.guess_row(room, p, target), q, f"Вариант {(p * target + q) % 6}")
+    room["status"] = "completed"
+    main.game_rooms[room["room_id"]] = room
+    return room["room_id"]
+
+
+class NullWebSocket:
+    """Сокет, который ничего не отправляет — меряем только работу сервера"""
+
+    async def send_text(self, data: str):
+        pass
+
+
+async def make_ws_manager(count: int, questions: int) -> websocket_server.GameManager:
+    manager = websocket_server.GameManager(InProcessRoomBus())
+    await manager.start()
+    question = {"id": 1, "question": "Какой фрукт выберет ваш партнер?",
+                "options": [{"id": "apple", "name": "Яблоко", "emoji": "🍎"}]}
+    for i in range(count):
+        room_code = f"{i:06d}"
+        await manager.bus.claim(room_code)
+        players = {}
+        answers = websocket_server.group_scoring.AnswerMatrix()
+        for row, name in enumerate(("Аня", "Боря")):
+            player_id = f"{room_code}-{name}"
+            players[player_id] = {"name": name, "ready": False, "row": row}
+            for q in range(questions):
+                answers.set(row, q, "apple")
+            await manager.attach(room_code, player_id, NullWebSocket())
+        manager.rooms[room_code] = {
+            "room_code": room_code,
+            "players": players,
+            "max_players": 2,
+            "answers": answers,
+            "game_state": "playing",
+            "current_question": 0,
+            "questions": [question] * questions,
+            "created_at": datetime.now().isoformat()
+        }
+        manager.track_room(room_code)
+    return manager
+
+
+# ============ ИЗМЕРЕНИЕ ============
+_CALIBRATION_OPTIONS = [f"Вариант {j}" for j in range(6)]
+
+
+def calibration_op(i: int):
+    """Эталонная нагрузка на интерпретатор: скорость машины, а не кода приложения"""
+    room = {"room_id": f"C{i:07d}", "players": {name: {"score": i % 7} for name in ("Аня", "Боря", "Вера")}}
+    room["options"] = [option for option in _CALIBRATION_OPTIONS if option != room["room_id"]]
+    return json.dumps(room, ensure_ascii=False)
+
+
+async def measure(op: Callable[[int], Awaitable[Any]]) -> Dict[str, float]:
+    """Время и пик памяти на одну операцию; op(i) — i-я операция"""
+    await op(0)  # прогрев
+
+    # Калибровка размера серии, затем лучшая из REPEATS серий — как в timeit
+    iterations, elapsed = 0, 0.0
+    started = time.perf_counter()
+    while elapsed < MIN_BENCH_TIME / REPEATS and iterations < MAX_ITERATIONS:
+        await op(iterations)
+        iterations += 1
+        elapsed = time.perf_counter() - started
+
+    best = elapsed
+    for _ in range(REPEATS - 1):
+        started = time.perf_counter()
+        for i in range(iterations):
+            await op(i)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    samples = min(iterations, 20)
+    peak = 0
+    for i in range(samples):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        await op(i)
+        peak += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    return {
+        "ns_per_op": round(best / iterations * 1e9),
+        "peak_bytes_per_op": round(peak / samples),
+        "iterations": iterations
+    }
+
+
+def _sync(fn: Callable[..., Any]) -> Callable[..., Awaitable[Any]]:
+    async def wrapper(*args):
+        return fn(*args)
+    return wrapper
+
+
+async def run_cases(quick: bool, pattern: Optional[str]) -> Dict[str, Dict[str, float]]:
+    room_sizes = QUICK_ROOM_SIZES if quick else ROOM_SIZES
+    question_sizes = QUICK_QUESTION_SIZES if quick else QUESTION_SIZES
+    results: Dict[str, Dict[str, float]] = {}
+    calibration = await measure(_sync(calibration_op))
+    print(f"{'калибровка':<58} {calibration['ns_per_op'] / 1000:>12.1f} мкс/оп")
+    original_catalog = main.COUPLE_GAMES_DATA
+    # Открытый журнал: record() в обработчиках стоит столько же, сколько в проде
+    main.room_journal.recover()
+
+    async def case(name: str, op: Callable[[int], Awaitable[Any]]):
+        if pattern and pattern not in name:
+            return
+        results[name] = await measure(op)
+        # Накопленные события уходят в журнал во временном каталоге между случаями
+        await main.room_journal.flush()
+        r = results[name]
+        print(f"{name:<58} {r['ns_per_op'] / 1000:>12.1f} мкс/оп {r['peak_bytes_per_op'] / 1024:>10.1f} КиБ/оп")
+
+    # ---------- астро ----------
+    dates = ["2025-03-20", "2025-06-01", "2026-10-30", "2027-01-15"]
+    await case("get_mercury_status",
+               _sync(lambda i: main.get_mercury_status(dates[i % len(dates)])))
+    await case("get_weekly_mercury_forecast",
+               _sync(lambda i: main.get_weekly_mercury_forecast("2026-10-19")))
+    await case("get_gnome_compatibility_analysis",
+               _sync(lambda i: main.get_gnome_compatibility_analysis(i % 101)))
+
+    # ---------- HTTP-движок: комнаты и каталоги ----------
+    grid = [(rooms, 75) for rooms in room_sizes] + [(1_000, q) for q in question_sizes if q != 75]
+    for rooms, questions in grid:
+        main.COUPLE_GAMES_DATA = make_catalog(questions)
+        suffix = f"[rooms={rooms},questions={questions}]"
+
+        room_ids = make_http_rooms(rooms)
+        await case(f"get_game_question{suffix}",
+                   lambda i: main.get_game_question(room_ids[i % rooms]))
+
+        # Свой счетчик операций: measure повторяет i в каждой серии, а комнаты
+        # помнят принятые ответы. Комната получает каждый rooms-й ход; на вопрос
+        # четыре хода (Аня отвечает — Боря угадывает, затем наоборот), поэтому
+        # каждый ответ новый, а не дубликат. Пройденную игру начинаем заново
+        steps = itertools.count()
+        turns_per_game = 4 * questions
+
+        async def submit(i: int):
+            step = next(steps)
+            room_id = room_ids[step % rooms]
+            turn = step // rooms % turns_per_game
+            if turn == 0 and step >= rooms:
+                main.game_rooms[room_id] = make_http_room(room_id, datetime.now(timezone.utc))
+            await main.submit_answer(main.AnswerRequest(
+                room_id=room_id, player_name="Аня" if turn % 2 == 0 else "Боря",
+                question_id=turn // 4, phase=1 if turn % 4 < 2 else 2, answer="Вариант 1"
+            ))
+        await case(f"submit_answer{suffix}", submit)
+
+        # Завершенные комнаты хранят все ответы — ограничиваем их число по памяти
+        room_ids = make_http_rooms(min(rooms, 100, max(1, 200_000 // questions)), completed=True)
+        await case(f"get_game_results{suffix}",
+                   lambda i: main.get_game_results(room_ids[i % len(room_ids)]))
+    # ---------- групповые комнаты ----------
+    main.COUPLE_GAMES_DATA = make_catalog(75)
+    for players in (10, 50):
+        room_id = make_group_room(players)
+        await case(f"get_game_results[players={players},questions=75]",
+                   lambda i: main.get_game_results(room_id))
+    main.game_rooms.clear()
+    main.COUPLE_GAMES_DATA = original_catalog
+
+    # ---------- WebSocket-движок ----------
+    for rooms, questions in [(rooms, 2) for rooms in room_sizes] + [(10, q) for q in question_sizes]:
+        manager = await make_ws_manager(rooms, questions)
+        codes = list(manager.rooms)
+        suffix = f"[rooms={rooms},questions={questions}]"
+        if questions == 2:
+            message = {"type": "answer_received", "player_id": "x", "answered_count": 1, "total_players": 2}
+            await case(f"GameManager.broadcast_to_room{suffix}",
+                       lambda i: manager.broadcast_to_room(codes[i % rooms], message))
+        await case(f"GameManager.finish_game{suffix}",
+                   lambda i: manager.finish_game(codes[i % rooms]))
+        # finish_game откладывает закрытие комнаты на каждой операции — снимаем
+        # эти задачи, чтобы они не копились в цикле событий следующих случаев
+        await manager.stop()
+
+    await main.room_journal.stop()
+    results[CALIBRATION] = calibration
+    return results
+
+
+# ============ СРАВНЕНИЕ С ПОРОГАМИ ============
+def compare(results: Dict[str, Dict[str, float]], stored: Dict[str, Any]) -> List[str]:
+    time_tolerance = stored.get("time_tolerance", DEFAULT_TIME_TOLERANCE)
+    memory_tolerance = stored.get("memory_tolerance", DEFAULT_MEMORY_TOLERANCE)
+    # Во сколько раз эта машина сейчас медленнее той, где снимали пороги
+    speed = 1.0
+    if CALIBRATION in results and stored.get("calibration_ns_per_op"):
+        speed = results[CALIBRATION]["ns_per_op"] / stored["calibration_ns_per_op"]
+    failures = []
+    for name, result in results.items():
+        baseline = stored.get("cases", {}).get(name)
+        if baseline is None:
+            continue
+        expected = round(baseline["ns_per_op"] * speed)
+        if result["ns_per_op"] > expected * (1 + time_tolerance):
+            failures.append(
+                f"{name}: {result['ns_per_op']} нс/оп > {expected} нс/оп "
+                f"(базовые {baseline['ns_per_op']} × калибровка {speed:.2f}) +{time_tolerance:.0%}"
+            )
+        # Мелкие выделения шумят — проверяем память только от 1 КиБ
+        limit = max(baseline["peak_bytes_per_op"] * (1 + memory_tolerance), 1024)
+        if result["peak_bytes_per_op"] > limit:
+            failures.append(
+                f"{name}: {result['peak_bytes_per_op']} Б/оп > {baseline['peak_bytes_per_op']} Б/оп +{memory_tolerance:.0%}"
+            )
+    return failures
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Микробенчмарки Gnome Horoscope API")
+    parser.add_argument("--update", action="store_true", help="записать результаты как базовые")
+    parser.add_argument("--quick", action="store_true", help="только малые размеры")
+    parser.add_argument("-k", dest="pattern", help="только случаи с этой подстрокой")
+    args = parser.parse_args()
+    # Все пороги масштабируются одной калибровкой — снимаем их одним полным прогоном
+    if args.update and (args.quick or args.pattern):
+        parser.error("--update записывает все пороги: без --quick и -k")
+
+    results = asyncio.run(run_cases(args.quick, args.pattern))
+
+    stored: Dict[str, Any] = {}
+    if THRESHOLDS_PATH.exists():
+        with open(THRESHOLDS_PATH, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+
+    if args.update:
+        stored.setdefault("time_tolerance", DEFAULT_TIME_TOLERANCE)
+        stored.setdefault("memory_tolerance", DEFAULT_MEMORY_TOLERANCE)
+        stored["calibration_ns_per_op"] = results.pop(CALIBRATION)["ns_per_op"]
+        cases = stored["cases"] = {}
+        for name, result in results.items():
+            cases[name] = {"ns_per_op": result["ns_per_op"], "peak_bytes_per_op": result["peak_bytes_per_op"]}
+        with open(THRESHOLDS_PATH, "w", encoding="utf-8") as f:
+            json.dump(stored, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"💾 Базовые значения записаны в {THRESHOLDS_PATH.name}")
+        return 0
+
+    failures = compare(results, stored)
+    if failures:
+        print("\n❌ Регрессии производительности:")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+    print("\n✅ Регрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,382 @@
+"""Шина комнат для WebSocket: события и команды между воркерами.
+
+Состояние комнаты живет в воркере-владельце (тот, где ее создали).
+Команды игроков (join/start/answer) идут владельцу, события комнаты —
+всем воркерам, где есть сокеты игроков этой комнаты.
+
+InProcessRoomBus — все в одном процессе.
+UnixSocketRoomBus — воркеры подключаются к брокеру по Unix-сокету.
+Брокер запускается отдельно: python room_bus.py /tmp/gnome-rooms.sock
+Если брокер перезапустился, воркеры переподключаются к нему и занимают
+свои комнаты заново. Если отключился воркер, брокер сообщает владельцам
+комнат, где были его игроки, командой worker_gone — иначе игроки упавшего
+воркера навсегда остались бы «на связи» и комната не закрылась бы.
+"""
+import abc
+import os
+import sys
+import json
+import uuid
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ============ НАСТРОЙКИ ============
+# inprocess или unix:/путь/к/сокету
+ROOM_BUS_URL = os.environ.get("ROOM_BUS", "inprocess")
+FRAME_LIMIT = 1024 * 1024
+# Пауза между попытками переподключиться к брокеру: от первой до последней, удваиваясь
+RECONNECT_DELAY = 0.1
+RECONNECT_MAX_DELAY = 5.0
+
+EventHandler = Callable[[str, dict, Optional[str]], Awaitable[None]]
+CommandHandler = Callable[[str, dict], Awaitable[None]]
+
+# detach — воркер игрока отвязывает его сокет от комнаты перед отправкой
+ROOM_NOT_FOUND = {"type": "error", "message": "Комната не найдена", "detach": True}
+BUS_UNAVAILABLE = {"type": "error", "message": "Сервер комнат недоступен, повторите позже"}
+
+
+class RoomBus(abc.ABC):
+    """Интерфейс шины комнат.
+
+    Каждая команда получает поле worker — id воркера, где подключен ее отправитель.
+    """
+
+    def __init__(self):
+        self.on_event: Optional[EventHandler] = None
+        self.on_command: Optional[CommandHandler] = None
+        self.owned: Set[str] = set()
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    async def start(self, on_event: EventHandler, on_command: CommandHandler):
+        self.on_event = on_event
+        self.on_command = on_command
+
+    async def stop(self):
+        pass
+
+    @abc.abstractmethod
+    async def claim(self, room_code: str) -> bool:
+        """Занять код комнаты; True — комната теперь принадлежит этому воркеру"""
+
+    @abc.abstractmethod
+    async def release(self, room_code: str):
+        """Освободить код закрытой комнаты"""
+
+    @abc.abstractmethod
+    async def subscribe(self, room_code: str):
+        """Получать события комнаты — здесь есть сокеты ее игроков"""
+
+    @abc.abstractmethod
+    async def unsubscribe(self, room_code: str):
+        """Отписаться: в этом воркере не осталось сокетов игроков комнаты"""
+
+    @abc.abstractmethod
+    async def publish(self, room_code: str, message: dict, to: Optional[str] = None):
+        """Событие всем игрокам комнаты или одному игроку (to=player_id)"""
+
+    @abc.abstractmethod
+    async def send_command(self, room_code: str, command: dict, reply_to: Optional[str] = None):
+        """Команда владельцу комнаты; если владельца нет — ошибка игроку reply_to"""
+
+
+class InProcessRoomBus(RoomBus):
+    """Шина внутри одного процесса: все комнаты и сокеты здесь же"""
+
+    async def claim(self, room_code: str) -> bool:
+        if room_code in self.owned:
+            return False
+        self.owned.add(room_code)
+        return True
+
+    async def release(self, room_code: str):
+        self.owned.discard(room_code)
+
+    async def subscribe(self, room_code: str):
+        pass
+
+    async def unsubscribe(self, room_code: str):
+        pass
+
+    async def publish(self, room_code: str, message: dict, to: Optional[str] = None):
+        await self.on_event(room_code, message, to)
+
+    async def send_command(self, room_code: str, command: dict, reply_to: Optional[str] = None):
+        if room_code in self.owned:
+            await self.on_command(room_code, {**command, "worker": self.worker_id})
+        elif reply_to is not None:
+            await self.on_event(room_code, ROOM_NOT_FOUND, reply_to)
+
+
+# ============ БРОКЕР НА UNIX-СОКЕТЕ ============
+async def _send_frame(writer: asyncio.StreamWriter, frame: dict):
+    writer.write(json.dumps(frame, ensure_ascii=False, separators=(",", ":")).encode() + b"\n")
+    await writer.drain()
+
+
+class UnixSocketRoomBus(RoomBus):
+    """Клиент брокера: локальные события доставляются сразу, остальным воркерам — через брокер"""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_request = 0
+        self._subscriptions: Dict[str, int] = {}
+
+    async def start(self, on_event: EventHandler, on_command: CommandHandler):
+        await super().start(on_event, on_command)
+        await self._connect()
+        self._reader_task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"🔌 Воркер {self.worker_id} подключен к шине комнат {self.path}")
+
+    async def stop(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    async def _connect(self):
+        """Подключиться к брокеру и восстановить на нем свои комнаты и подписки"""
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path, limit=FRAME_LIMIT)
+        await _send_frame(self._writer, {"op": "hello", "worker": self.worker_id})
+        # Брокер забывает комнаты отключившегося воркера — занимаем их заново
+        for room_code in list(self.owned):
+            request_id, future = self._request()
+            future.add_done_callback(lambda done, room_code=room_code: self._reclaimed(room_code, done))
+            await _send_frame(self._writer, {"op": "claim", "room": room_code, "req": request_id})
+        for room_code in self._subscriptions:
+            await _send_frame(self._writer, {"op": "sub", "room": room_code})
+
+    def _reclaimed(self, room_code: str, future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None or future.result():
+            return
+        # Код успел занять другой воркер: наша комната ему больше не доступна
+        self.owned.discard(room_code)
+        logger.error(f"❌ Комнату {room_code} не удалось вернуть после переподключения к брокеру")
+
+    def _disconnected(self):
+        """Связь потеряна: ожидающие claim() получают ошибку, отправка кадров — отказ"""
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Нет связи с брокером комнат"))
+
+    async def _run(self):
+        delay = RECONNECT_DELAY
+        while True:
+            if self._reader is not None:
+                await self._read_loop()
+                logger.error("❌ Соединение с брокером комнат потеряно")
+                self._disconnected()
+            await asyncio.sleep(delay)
+            try:
+                await self._connect()
+            except OSError as e:
+                self._disconnected()
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                logger.warning(f"⚠️ Брокер комнат недоступен ({e}), повтор через {delay:.1f} с")
+                continue
+            delay = RECONNECT_DELAY
+            logger.info(f"🔌 Воркер {self.worker_id} снова подключен к шине комнат")
+
+    async def _read_loop(self):
+        while True:
+            try:
+                line = await self._reader.readline()
+            except (ConnectionError, ValueError) as e:
+                logger.error(f"❌ Ошибка чтения из шины комнат: {e}")
+                return
+            if not line:
+                return
+            op = None
+            try:
+                frame = json.loads(line)
+                op = frame["op"]
+                if op == "event":
+                    await self.on_event(frame["room"], frame["msg"], frame.get("to"))
+                elif op == "cmd":
+                    await self.on_command(frame["room"], frame["msg"])
+                elif op == "claimed":
+                    future = self._pending.pop(frame["req"], None)
+                    if future is not None and not future.done():
+                        future.set_result(frame["ok"])
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработки кадра шины {op}: {e}")
+
+    def _request(self) -> Tuple[int, asyncio.Future]:
+        self._next_request += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_request] = future
+        return self._next_request, future
+
+    async def _send(self, frame: dict) -> bool:
+        """Отправить кадр брокеру; False — связи нет, кадр потерян"""
+        if self._writer is None:
+            return False
+        try:
+            await _send_frame(self._writer, frame)
+        except ConnectionError as e:
+            logger.warning(f"⚠️ Кадр {frame['op']} не отправлен в шину комнат: {e}")
+            return False
+        return True
+
+    async def claim(self, room_code: str) -> bool:
+        request_id, future = self._request()
+        if not await self._send({"op": "claim", "room": room_code, "req": request_id}):
+            self._pending.pop(request_id, None)
+            return False
+        try:
+            ok = await future
+        except ConnectionError:
+            return False
+        if ok:
+            self.owned.add(room_code)
+        return ok
+
+    async def release(self, room_code: str):
+        self.owned.discard(room_code)
+        await self._send({"op": "release", "room": room_code})
+
+    async def subscribe(self, room_code: str):
+        count = self._subscriptions.get(room_code, 0)
+        self._subscriptions[room_code] = count + 1
+        if count == 0:
+            await self._send({"op": "sub", "room": room_code})
+
+    async def unsubscribe(self, room_code: str):
+        count = self._subscriptions.get(room_code, 0) - 1
+        if count > 0:
+            self._subscriptions[room_code] = count
+            return
+        self._subscriptions.pop(room_code, None)
+        await self._send({"op": "unsub", "room": room_code})
+
+    async def publish(self, room_code: str, message: dict, to: Optional[str] = None):
+        await self.on_event(room_code, message, to)
+        await self._send({"op": "pub", "room": room_code, "msg": message, "to": to})
+
+    async def send_command(self, room_code: str, command: dict, reply_to: Optional[str] = None):
+        command = {**command, "worker": self.worker_id}
+        if room_code in self.owned:
+            await self.on_command(room_code, command)
+            return
+        sent = await self._send({"op": "cmd", "room": room_code, "msg": command, "reply_to": reply_to})
+        if not sent and reply_to is not None:
+            await self.on_event(room_code, BUS_UNAVAILABLE, reply_to)
+
+
+class RoomBroker:
+    """Брокер: помнит владельцев комнат и подписки воркеров, пересылает кадры"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.workers: Dict[str, asyncio.StreamWriter] = {}
+        self.owners: Dict[str, str] = {}
+        self.subscribers: Dict[str, Set[str]] = {}
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self._handle, self.path, limit=FRAME_LIMIT)
+        logger.info(f"🛰️ Брокер комнат слушает {self.path}")
+        async with server:
+            await server.serve_forever()
+
+    async def _send(self, worker_id: str, frame: dict):
+        writer = self.workers.get(worker_id)
+        if writer is not None:
+            try:
+                await _send_frame(writer, frame)
+            except ConnectionError:
+                pass
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker_id = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                frame = json.loads(line)
+                op = frame["op"]
+                room = frame.get("room")
+
+                if op == "hello":
+                    worker_id = frame["worker"]
+                    self.workers[worker_id] = writer
+                elif op == "claim":
+                    ok = room not in self.owners
+                    if ok:
+                        self.owners[room] = worker_id
+                    await _send_frame(writer, {"op": "claimed", "req": frame["req"], "ok": ok})
+                elif op == "release":
+                    if self.owners.get(room) == worker_id:
+                        del self.owners[room]
+                elif op == "sub":
+                    self.subscribers.setdefault(room, set()).add(worker_id)
+                elif op == "unsub":
+                    subscribers = self.subscribers.get(room)
+                    if subscribers is not None:
+                        subscribers.discard(worker_id)
+                        if not subscribers:
+                            del self.subscribers[room]
+                elif op == "pub":
+                    event = {"op": "event", "room": room, "msg": frame["msg"], "to": frame.get("to")}
+                    for subscriber in list(self.subscribers.get(room, ())):
+                        if subscriber != worker_id:
+                            await self._send(subscriber, event)
+                elif op == "cmd":
+                    owner = self.owners.get(room)
+                    if owner is not None:
+                        await self._send(owner, {"op": "cmd", "room": room, "msg": frame["msg"]})
+                    elif frame.get("reply_to"):
+                        await _send_frame(writer, {
+                            "op": "event", "room": room, "msg": ROOM_NOT_FOUND, "to": frame["reply_to"]
+                        })
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"⚠️ Воркер {worker_id} отключился с ошибкой: {e}")
+        finally:
+            if worker_id is not None:
+                await self._forget(worker_id, writer)
+            writer.close()
+
+    async def _forget(self, worker_id: str, writer: asyncio.StreamWriter):
+        """Воркер отключился: его комнаты свободны, его игроки для владельцев — не на связи"""
+        # Воркер мог уже переподключиться новым соединением — тогда он жив
+        if self.workers.get(worker_id) is not writer:
+            return
+        del self.workers[worker_id]
+        for room in [room for room, owner in self.owners.items() if owner == worker_id]:
+            del self.owners[room]
+        for room in list(self.subscribers):
+            subscribers = self.subscribers[room]
+            if worker_id not in subscribers:
+                continue
+            subscribers.discard(worker_id)
+            if not subscribers:
+                del self.subscribers[room]
+            owner = self.owners.get(room)
+            if owner is not None:
+                await self._send(owner, {"op": "cmd", "room": room,
+                                         "msg": {"type": "worker_gone", "worker": worker_id}})
+
+
+def create_room_bus(url: str = ROOM_BUS_URL) -> RoomBus:
+    if url.startswith("unix:"):
+        return UnixSocketRoomBus(url[len("unix:"):])
+    return InProcessRoomBus()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(RoomBroker(sys.argv[1] if len(sys.argv) > 1 else "/tmp/gnome-rooms.sock").serve())
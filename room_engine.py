@@ -0,0 +1,252 @@
+"""Движок игровых комнат: чистые мутации состояния комнаты.
+
+Все изменения комнат проходят через эти функции — и обработчики API,
+и восстановление из журнала после перезапуска.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from group_scoring import AnswerMatrix
+
+# Комнаты на двоих — по умолчанию; групповые комнаты — до MAX_PLAYERS
+DEFAULT_PLAYERS = 2
+MAX_PLAYERS = int(os.environ.get("MAX_ROOM_PLAYERS", 50))
+# Сколько живет комната с момента создания и завершенная игра с момента завершения
+ROOM_TTL = timedelta(hours=float(os.environ.get("ROOM_TTL_H", 24)))
+FINISHED_ROOM_TTL = timedelta(hours=float(os.environ.get("FINISHED_ROOM_TTL_H", 1)))
+
+
+def new_room(room_id: str, game_type: str, creator_name: str, created_at: datetime,
+             max_players: int = DEFAULT_PLAYERS) -> Dict[str, Any]:
+    """Новая комната в статусе ожидания.
+
+    answers — матрица игроки × вопросы; guesses — догадки, строка
+    guesser * max_players + target, столбец — вопрос.
+    """
+    return {
+        "room_id": room_id,
+        "created_at": created_at,
+        "players": [creator_name],
+        "max_players": max_players,
+        "game_type": game_type,
+        "current_question": 0,
+        "current_phase": 1,
+        "current_answerer": creator_name,
+        "answers": AnswerMatrix(),
+        "guesses": AnswerMatrix(),
+        "status": "waiting"
+    }
+
+
+def add_player(room: Dict[str, Any], player_name: str) -> Optional[str]:
+    """Добавить игрока. Возвращает текст ошибки или None"""
+    if player_name in room["players"]:
+        return None
+
+    if len(room["players"]) >= room["max_players"]:
+        return "Комната полна"
+    if room["status"] != "waiting":
+        return "Игра уже началась"
+
+    room["players"].append(player_name)
+
+    if len(room["players"]) == room["max_players"]:
+        room["status"] = "playing"
+    return None
+
+
+def start_game(room: Dict[str, Any]) -> Optional[str]:
+    """Начать игру, не дожидаясь заполнения комнаты. Возвращает текст ошибки или None"""
+    if room["status"] != "waiting":
+        return "Игра уже началась"
+    if len(room["players"]) < DEFAULT_PLAYERS:
+        return "Нужно хотя бы два игрока"
+    room["status"] = "playing"
+    return None
+
+
+def answer_key_error(question_id: int, phase: int) -> Optional[str]:
+    """Проверка номера вопроса и фазы до обращения к комнате"""
+    if question_id < 0:
+        return "question_id не может быть отрицательным"
+    if phase < 1:
+        return "Фазы нумеруются с 1"
+    return None
+
+
+def answer_error(room: Dict[str, Any], player_name: str, question_id: int, phase: int) -> Optional[str]:
+    """Проверка ответа до записи. Возвращает текст ошибки или None"""
+    if room["status"] != "playing":
+        return "Игра не идет"
+    if player_name not in room["players"]:
+        return "Игрок не в комнате"
+    if question_id != room["current_question"]:
+        return "Это не текущий вопрос"
+    if phase != room["current_phase"]:
+        return "Это не текущая фаза"
+    return None
+
+
+def is_duplicate(room: Dict[str, Any], player_name: str, question_id: int, phase: int) -> bool:
+    """Ответ игрока на этот вопрос и фазу уже принят — повтор можно пропустить.
+
+    Пройденные вопросы и фазы закрываются только когда ответили все,
+    поэтому повтор для них всегда дубликат. question_id и phase должны
+    пройти answer_key_error: отрицательные значения выглядели бы пройденными.
+    """
+    if player_name not in room["players"]:
+        return False
+    if question_id != room["current_question"]:
+        return question_id < room["current_question"]
+    if phase != room["current_phase"]:
+        return phase < room["current_phase"]
+
+    players = room["players"]
+    player = players.index(player_name)
+    answerer = players.index(room["current_answerer"])
+    if player == answerer:
+        return room["answers"].has(player, question_id)
+    return room["guesses"].has(guess_row(room, player, answerer), question_id)
+
+
+def copy_room(room: Dict[str, Any]) -> Dict[str, Any]:
+    """Копия комнаты для пробного применения пакета ответов"""
+    return {
+        **room,
+        "players": list(room["players"]),
+        "answers": room["answers"].copy(),
+        "guesses": room["guesses"].copy()
+    }
+
+
+def guess_row(room: Dict[str, Any], guesser: int, target: int) -> int:
+    return guesser * room["max_players"] + target
+
+
+def apply_answer(room: Dict[str, Any], player_name: str, question_id: int, answer: str) -> bool:
+    """Записать ответ или догадку. Возвращает True, если раунд завершен.
+
+    Фазы вопроса идут по кругу: в фазе k отвечает за себя игрок k,
+    остальные угадывают его ответ. После последней фазы — следующий вопрос.
+    """
+    players = room["players"]
+    answerer = players.index(room["current_answerer"])
+    player = players.index(player_name)
+
+    if player == answerer:
+        room["answers"].set(player, question_id, answer)
+    else:
+        room["guesses"].set(guess_row(room, player, answerer), question_id, answer)
+
+    round_complete = room["answers"].has(answerer, question_id) and all(
+        room["guesses"].has(guess_row(room, guesser, answerer), question_id)
+        for guesser in range(len(players)) if guesser != answerer
+    )
+
+    if round_complete:
+        phase = room["current_phase"]
+        if phase < len(players):
+            room["current_phase"] = phase + 1
+            room["current_answerer"] = players[phase]
+        else:
+            room["current_question"] += 1
+            room["current_phase"] = 1
+            room["current_answerer"] = players[0]
+
+    return round_complete
+
+
+def mark_completed(room: Dict[str, Any], completed_at: Optional[datetime] = None):
+    room["status"] = "completed"
+    room["completed_at"] = completed_at or room["created_at"]
+
+
+def _aware(moment: datetime) -> datetime:
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+
+def is_expired(room: Dict[str, Any], now: datetime) -> bool:
+    """Комната больше не нужна: игра завершена давно или комнату бросили"""
+    if room["status"] == "completed":
+        return now - _aware(room.get("completed_at") or room["created_at"]) > FINISHED_ROOM_TTL
+    return now - _aware(room["created_at"]) > ROOM_TTL
+
+
+# ============ СОБЫТИЯ ЖУРНАЛА ============
+# Компактные события: [seq, тип, room_id, ...аргументы]
+EVENT_CREATE = "c"
+EVENT_JOIN = "j"
+EVENT_ANSWER = "a"
+EVENT_COMPLETE = "x"
+EVENT_START = "s"
+
+
+def apply_event(rooms: Dict[str, Dict[str, Any]], event: list):
+    """Применить событие журнала к словарю комнат"""
+    kind, room_id, args = event[1], event[2], event[3:]
+    if kind == EVENT_CREATE:
+        game_type, creator_name, created_at = args[:3]
+        # Старые события без max_players — комнаты на двоих
+        max_players = args[3] if len(args) > 3 else DEFAULT_PLAYERS
+        rooms[room_id] = new_room(room_id, game_type, creator_name, datetime.fromisoformat(created_at), max_players)
+        return
+
+    room = rooms.get(room_id)
+    if room is None:
+        return
+    if kind == EVENT_JOIN:
+        add_player(room, args[0])
+    elif kind == EVENT_ANSWER:
+        apply_answer(room, args[0], args[1], args[2])
+    elif kind == EVENT_COMPLETE:
+        # Старые события без времени завершения — считаем от создания комнаты
+        mark_completed(room, datetime.fromisoformat(args[0]) if args else None)
+    elif kind == EVENT_START:
+        start_game(room)
+
+
+def dump_room(room: Dict[str, Any]) -> Dict[str, Any]:
+    """Комната в JSON-совместимом виде для снапшота"""
+    return {
+        **room,
+        "created_at": room["created_at"].isoformat(),
+        **({"completed_at": room["completed_at"].isoformat()} if room.get("completed_at") else {}),
+        "answers": room["answers"].to_json(),
+        "guesses": room["guesses"].to_json()
+    }
+
+
+def load_room(record: Dict[str, Any]) -> Dict[str, Any]:
+    if "max_players" not in record:
+        return _load_legacy_room(record)
+    return {
+        **record,
+        "created_at": datetime.fromisoformat(record["created_at"]),
+        **({"completed_at": datetime.fromisoformat(record["completed_at"])} if record.get("completed_at") else {}),
+        "answers": AnswerMatrix.from_json(record["answers"]),
+        "guesses": AnswerMatrix.from_json(record["guesses"])
+    }
+
+
+def _load_legacy_room(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Снапшот комнаты на двоих с ключами "{вопрос}_{игрок}" и "{вопрос}_{игрок}_about_{игрок}\""""
+    room = {
+        **record,
+        "created_at": datetime.fromisoformat(record["created_at"]),
+        "max_players": DEFAULT_PLAYERS,
+        "answers": AnswerMatrix(),
+        "guesses": AnswerMatrix()
+    }
+    players = room["players"]
+    for key, answer in record["answers"].items():
+        question_id, player_name = key.split("_", 1)
+        if player_name in players:
+            room["answers"].set(players.index(player_name), int(question_id), answer)
+    for key, guess in record["guesses"].items():
+        question_id, pair = key.split("_", 1)
+        guesser, target = pair.rsplit("_about_", 1)
+        if guesser in players and target in players:
+            row = guess_row(room, players.index(guesser), players.index(target))
+            room["guesses"].set(row, int(question_id), guess)
+    return room
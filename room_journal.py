@@ -0,0 +1,293 @@
+"""Журнал событий игровых комнат с пакетной записью и компактирующими снапшотами.
+
+Обработчики вызывают record() — это только добавление строки в буфер, без I/O.
+Фоновая задача раз в JOURNAL_FLUSH_MS отдает накопленный пакет потоку-писателю.
+Журнал делится на сегменты; закрытые сегменты сворачиваются в снапшот
+в отдельном потоке — он читает файлы, а не живые комнаты, поэтому не
+требует блокировок. При старте читается снапшот и только хвост журнала.
+
+Бенчмарк на 100k комнатах: python room_journal.py
+"""
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from room_engine import apply_event, dump_room, is_expired, load_room
+
+logger = logging.getLogger(__name__)
+
+# ============ НАСТРОЙКИ ============
+JOURNAL_DIR = os.environ.get("ROOM_JOURNAL_DIR", "room_journal")
+JOURNAL_FLUSH_INTERVAL = float(os.environ.get("JOURNAL_FLUSH_MS", 50)) / 1000
+JOURNAL_SEGMENT_EVENTS = int(os.environ.get("JOURNAL_SEGMENT_EVENTS", 100_000))
+JOURNAL_FSYNC = os.environ.get("JOURNAL_FSYNC", "0") == "1"
+# Сколько закрытых сегментов копим перед компактированием
+JOURNAL_COMPACT_SEGMENTS = 2
+
+
+def _segment_name(first_seq: int) -> str:
+    return f"journal-{first_seq:012d}.log"
+
+
+def _snapshot_name(seq: int) -> str:
+    return f"snapshot-{seq:012d}.json"
+
+
+def _seq_of(path: Path) -> int:
+    return int(path.stem.split("-")[1])
+
+
+class RoomJournal:
+    """Append-only журнал мутаций комнат"""
+
+    def __init__(self, directory: str = JOURNAL_DIR, flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+                 segment_events: int = JOURNAL_SEGMENT_EVENTS, fsync: bool = JOURNAL_FSYNC):
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.segment_events = segment_events
+        self.fsync = fsync
+        self.seq = 0
+        self._buffer: List[str] = []
+        self._segment = None
+        self._segment_count = 0
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-writer")
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-compactor")
+        self._compacting = False
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- восстановление ----------
+    def _snapshots(self) -> List[Path]:
+        return sorted(self.directory.glob("snapshot-*.json"), key=_seq_of)
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.directory.glob("journal-*.log"), key=_seq_of)
+
+    def _load(self, segments: List[Path]) -> Tuple[Dict[str, Dict[str, Any]], int]:
+        """Снапшот + события из сегментов после него"""
+        rooms: Dict[str, Dict[str, Any]] = {}
+        seq = 0
+        snapshots = self._snapshots()
+        if snapshots:
+            with open(snapshots[-1], "r", encoding="utf-8") as f:
+                data = json.load(f)
+            seq = data["seq"]
+            rooms = {room_id: load_room(record) for room_id, record in data["rooms"].items()}
+
+        for segment in segments:
+            with open(segment, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Оборванная последняя строка после падения
+                        logger.warning(f"⚠️ Пропущена поврежденная запись в {segment.name}")
+                        continue
+                    if event[0] > seq:
+                        apply_event(rooms, event)
+                        seq = event[0]
+
+        # Завершенные и брошенные комнаты не восстанавливаются и не попадают в снапшот
+        now = datetime.now(timezone.utc)
+        return {room_id: room for room_id, room in rooms.items() if not is_expired(room, now)}, seq
+
+    def recover(self) -> Dict[str, Dict[str, Any]]:
+        """Восстановить комнаты и открыть новый сегмент для записи"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        segments = self._segments()
+        # При старте создаются сотни тысяч объектов без циклов — сборщик мусора
+        # только обходил бы их снова и снова
+        gc.disable()
+        try:
+            rooms, self.seq = self._load(segments)
+        finally:
+            gc.enable()
+        for segment in segments:
+            if segment.stat().st_size == 0:
+                segment.unlink()
+        self._open_segment()
+        logger.info(
+            f"📼 Восстановлено {len(rooms)} комнат из журнала (seq {self.seq}) "
+            f"за {(time.perf_counter() - started) * 1000:.0f} мс"
+        )
+        return rooms
+
+    # ---------- запись ----------
+    def record(self, *event):
+        """Добавить событие в буфер; на диск оно попадет со следующим пакетом.
+
+        До recover() и после stop() журнал закрыт и события отбрасываются:
+        иначе буфер без писателя рос бы без ограничений (тесты, бенчмарки, preload).
+        """
+        if self._segment is None:
+            return
+        self.seq += 1
+        self._buffer.append(json.dumps([self.seq, *event], ensure_ascii=False, separators=(",", ":")))
+
+    def memory_usage(self, sizeof: Callable[[Any], int] = sys.getsizeof) -> Dict[str, int]:
+        """События в буфере, еще не отданные писателю"""
+        buffer = list(self._buffer)
+        return {"entries": len(buffer), "approx_bytes": sizeof(buffer)}
+
+    def _open_segment(self):
+        self._segment = open(self.directory / _segment_name(self.seq + 1), "a", encoding="utf-8")
+        self._segment_count = 0
+
+    def _write(self, lines: List[str]) -> bool:
+        """Поток-писатель: дописать пакет, при необходимости сменить сегмент"""
+        self._segment.write("\n".join(lines) + "\n")
+        self._segment.flush()
+        if self.fsync:
+            os.fsync(self._segment.fileno())
+        self._segment_count += len(lines)
+        if self._segment_count >= self.segment_events:
+            self._segment.close()
+            last_seq = json.loads(lines[-1])[0]
+            self._segment = open(self.directory / _segment_name(last_seq + 1), "a", encoding="utf-8")
+            self._segment_count = 0
+            return True
+        return False
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        rotated = await asyncio.get_running_loop().run_in_executor(self._writer, self._write, lines)
+        if rotated:
+            self._maybe_compact()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи журнала комнат: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._segment is None:
+            return
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(self._writer, self._segment.close)
+        self._segment = None
+        self._buffer = []
+
+    # ---------- компактирование ----------
+    def _maybe_compact(self):
+        if not self._compacting:
+            self._compacting = True
+            self._compactor.submit(self._compact_pending)
+
+    def _compact_pending(self):
+        try:
+            while True:
+                # Последний сегмент открыт писателем — его не трогаем
+                closed = self._segments()[:-1]
+                if len(closed) < JOURNAL_COMPACT_SEGMENTS:
+                    return
+                self.compact(closed)
+        except Exception as e:
+            logger.error(f"❌ Ошибка компактирования журнала комнат: {e}")
+        finally:
+            self._compacting = False
+
+    def compact(self, closed: List[Path]):
+        """Свернуть снапшот и закрытые сегменты в новый снапшот"""
+        started = time.perf_counter()
+        old_snapshots = self._snapshots()
+        rooms, seq = self._load(closed)
+
+        path = self.directory / _snapshot_name(seq)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(
+                {"seq": seq, "rooms": {room_id: dump_room(room) for room_id, room in rooms.items()}},
+                ensure_ascii=False, separators=(",", ":")
+            ))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        for stale in old_snapshots + closed:
+            if stale != path:
+                stale.unlink(missing_ok=True)
+        logger.info(
+            f"🗜️ Снапшот комнат {path.name}: {len(rooms)} комнат "
+            f"за {(time.perf_counter() - started) * 1000:.0f} мс"
+        )
+
+
+room_journal = RoomJournal()
+
+
+# ============ БЕНЧМАРК ============
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    from datetime import datetime, timezone
+    from room_engine import EVENT_ANSWER, EVENT_CREATE, EVENT_JOIN
+
+    ROOMS = 100_000
+    ANSWERS_PER_ROOM = 4
+
+    async def bench():
+        directory = tempfile.mkdtemp(prefix="room-journal-bench-")
+        try:
+            journal = RoomJournal(directory, segment_events=JOURNAL_SEGMENT_EVENTS)
+            journal.recover()
+            created_at = datetime.now(timezone.utc).isoformat()
+
+            started = time.perf_counter()
+            for i in range(ROOMS):
+                room_id = f"R{i:07d}"
+                journal.record(EVENT_CREATE, room_id, "fruit_game", "Аня", created_at)
+                journal.record(EVENT_JOIN, room_id, "Боря")
+                # Вопрос на двоих: ответ и догадка в каждой из двух фаз
+                for q in range(ANSWERS_PER_ROOM // 4):
+                    journal.record(EVENT_ANSWER, room_id, "Аня", q, "🍎 Яблоко")
+                    journal.record(EVENT_ANSWER, room_id, "Боря", q, "🍌 Банан")
+                    journal.record(EVENT_ANSWER, room_id, "Боря", q, "🍌 Банан")
+                    journal.record(EVENT_ANSWER, room_id, "Аня", q, "🍎 Яблоко")
+                if i % 10_000 == 0:
+                    await journal.flush()
+            record_time = time.perf_counter() - started
+            events = journal.seq
+
+            started = time.perf_counter()
+            await journal.flush()
+            journal._compactor.shutdown(wait=True)
+            flush_time = time.perf_counter() - started
+            await journal.stop()
+
+            size = sum(p.stat().st_size for p in Path(directory).iterdir())
+            tail = len(list(Path(directory).glob("journal-*.log")))
+
+            started = time.perf_counter()
+            rooms = RoomJournal(directory).recover()
+            recover_time = time.perf_counter() - started
+            assert len(rooms) == ROOMS
+
+            print(f"событий: {events}, комнат: {ROOMS}")
+            print(f"record(): {record_time / events * 1e6:.2f} мкс/событие на event loop")
+            print(f"дозапись и компактирование: {flush_time * 1000:.0f} мс")
+            print(f"на диске: {size / 1e6:.1f} МБ, сегментов в хвосте: {tail}")
+            print(f"восстановление: {recover_time * 1000:.0f} мс")
+        finally:
+            shutil.rmtree(directory)
+
+    asyncio.run(bench())
@@ -0,0 +1,69 @@
+"""Версионированное состояние комнаты для синхронизации клиентов дельтами.
+
+Клиент видит состояние комнаты как JSON-объект. Каждое изменение — патч
+в формате JSON Merge Patch (RFC 7386): вложенные объекты сливаются,
+null удаляет ключ. Патч получает номер версии и попадает в кольцевой
+буфер последних изменений. Переподключившийся клиент присылает последнюю
+увиденную версию и получает недостающие патчи, а если они уже вытеснены
+из буфера — полный снимок.
+"""
+import os
+import copy
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+# ============ НАСТРОЙКИ ============
+ROOM_SYNC_HISTORY = int(os.environ.get("ROOM_SYNC_HISTORY", 32))
+
+
+def merge_patch(target: Dict[str, Any], patch: Dict[str, Any]):
+    """Применить патч к состоянию на месте.
+
+    Вложенные объекты патча копируются в новые словари, так что патч
+    остается неизменным в буфере истории; списки и строки не копируются.
+    """
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict):
+            current = target.get(key)
+            if not isinstance(current, dict):
+                current = target[key] = {}
+            merge_patch(current, value)
+        else:
+            target[key] = value
+
+
+class RoomState:
+    """Состояние комнаты для клиентов, номер версии и буфер последних патчей"""
+
+    def __init__(self, state: Dict[str, Any], history: int = ROOM_SYNC_HISTORY):
+        self.state = state
+        self.version = 0
+        self.history: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=history)
+
+    def apply(self, event: str, patch: Dict[str, Any]) -> Dict[str, Any]:
+        """Применить патч и вернуть сообщение-дельту для рассылки"""
+        merge_patch(self.state, patch)
+        self.version += 1
+        self.history.append((self.version, patch))
+        return {"type": "state_delta", "event": event, "v": self.version, "d": patch}
+
+    def snapshot(self, message_type: str = "state_sync") -> Dict[str, Any]:
+        # Копия: сообщение может уйти в шину уже после следующего изменения
+        return {"type": message_type, "v": self.version, "s": copy.deepcopy(self.state)}
+
+    def since(self, version: Optional[int]) -> Dict[str, Any]:
+        """Сообщение, догоняющее клиента с версии version до текущей"""
+        if version is None or version > self.version:
+            return self.snapshot()
+        if version == self.version:
+            return {"type": "state_deltas", "v": self.version, "deltas": []}
+        # В буфере должны быть все патчи начиная с version + 1
+        if not self.history or self.history[0][0] > version + 1:
+            return self.snapshot()
+        return {
+            "type": "state_deltas",
+            "v": self.version,
+            "deltas": [[v, patch] for v, patch in self.history if v > version]
+        }
@@ -0,0 +1,433 @@
+"""Продакшен-запуск: мастер загружает приложение один раз и форкает воркеров.
+
+Мастер импортирует приложение, вызывает его preload() (каталог вопросов,
+эфемериды, таблицы на сегодня) и перед каждым fork замораживает кучу
+gc.freeze() — воркеры делят эти страницы copy-on-write, а сборщик мусора
+их не трогает и не копирует. Сам мастер после fork кучу размораживает и
+собирает мусор как обычно. Слушающий сокет открывает мастер, воркеры его
+наследуют: соединения, пришедшие пока воркер перезапускается, ждут в
+очереди сокета, а не получают отказ. Цикл событий и HTTP-парсер — самые
+быстрые из установленных (uvloop, httptools).
+
+Сигналы мастеру:
+  SIGHUP  — перечитать каталог (preload(reload=True)) и перезапустить
+            воркеров по одному: новый воркер слота запускается и сообщает
+            о готовности, только потом старый получает SIGTERM и дорабатывает
+            запросы. Если новый не запустился, старый продолжает работать.
+  SIGUSR1 — записать в лог память воркеров.
+  SIGTERM/SIGINT — мягко остановить всех.
+
+Приложение, которое пишет файлы состояния из одного процесса (журнал комнат
+main:app), объявляет RESTART_HANDOFF = True. Тогда новый воркер готовится
+до запуска приложения (fork, init_worker, сервер) и ждет; приложение
+стартует и восстанавливает журнал после выхода старого воркера. Соединения
+за это время ждут в очереди сокета.
+
+По умолчанию воркер один. Приложение объявляет MAX_WORKERS, если его
+состояние не делится между процессами: ядро раздает соединения воркерам
+без привязки к клиенту, и игрок попал бы не в тот, где живет его комната.
+Несколько воркеров возможны только когда состояние комнат общее для всех
+процессов. У websocket_server:app это шина комнат ROOM_BUS=unix:...,
+без нее он ограничен одним воркером. У main:app общего состояния нет:
+комнаты HTTP-игр, журнал комнат и лимиты запросов принадлежат одному
+процессу, поэтому воркер всегда один.
+
+Запуск: python serve.py [main:app] --port 8000
+        ROOM_BUS=unix:/tmp/gnome-rooms.sock python serve.py websocket_server:app --workers 4
+"""
+import os
+import gc
+import sys
+import time
+import errno
+import signal
+import socket
+import select
+import asyncio
+import logging
+import argparse
+import importlib
+from typing import Any, Dict, Optional, Tuple
+
+import uvicorn
+
+from memory_diagnostics import process_memory
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("serve")
+
+# ============ НАСТРОЙКИ ============
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", 1))
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 8000))
+# Сколько воркер дорабатывает открытые соединения при остановке
+GRACEFUL_TIMEOUT = int(os.environ.get("GRACEFUL_TIMEOUT_S", 30))
+# Сколько ждем готовности нового воркера
+STARTUP_TIMEOUT = float(os.environ.get("WORKER_STARTUP_TIMEOUT_S", 60))
+BACKLOG = 2048
+
+
+def _available(module: str) -> bool:
+    try:
+        importlib.import_module(module)
+        return True
+    except ImportError:
+        return False
+
+
+EVENT_LOOP = "uvloop" if _available("uvloop") else "asyncio"
+HTTP_PARSER = "httptools" if _available("httptools") else "h11"
+# Байты в канале готовности воркера
+READY = b"1"
+STANDBY = b"s"
+
+
+def listen(host: str, port: int) -> socket.socket:
+    """Слушающий сокет мастера, общий для всех воркеров.
+
+    Не SO_REUSEPORT: у сокета на каждого воркера очередь принятых ядром
+    соединений закрывается вместе с воркером, и при перезапуске они
+    получали бы отказ.
+    """
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    return sock
+
+
+def _mib(value: Optional[int]) -> str:
+    return f"{value / 2**20:.1f}" if value is not None else "?"
+
+
+class Master:
+    """Мастер-процесс: держит загруженное приложение и слоты воркеров"""
+
+    def __init__(self, target: str, workers: int, host: str, port: int):
+        self.target = target
+        self.workers = max(1, workers)
+        self.host = host
+        self.port = port
+        self.module: Any = None
+        self.app: Any = None
+        # slot -> pid
+        self.slots: Dict[int, int] = {}
+        # Воркеры в ожидании запуска приложения: pid -> (канал готовности, канал запуска)
+        self.standby: Dict[int, Tuple[int, int]] = {}
+        self.socket: Optional[socket.socket] = None
+        self._stopping = False
+        self._restart = False
+        self._report = False
+
+    # ---------- мастер ----------
+    def load(self):
+        started = time.perf_counter()
+        module_name, _, attr = self.target.partition(":")
+        self.module = importlib.import_module(module_name)
+        self.app = getattr(self.module, attr or "app")
+        self.preload(reload=False)
+        logger.info(f"📦 Приложение {self.target} загружено в мастере за {time.perf_counter() - started:.2f} с")
+
+    def check_workers(self) -> bool:
+        """Приложение с состоянием в памяти воркера нельзя запускать в нескольких воркерах"""
+        limit = getattr(self.module, "MAX_WORKERS", None)
+        if limit is not None and self.workers > limit:
+            logger.error(f"❌ {self.target} допускает воркеров не больше {limit}, запрошено {self.workers}: "
+                         f"его состояние не делится между процессами")
+            return False
+        return True
+
+    def preload(self, reload: bool):
+        preload = getattr(self.module, "preload", None)
+        if preload is not None:
+            preload(reload=reload)
+
+    def run(self) -> int:
+        started = time.perf_counter()
+        # Пока загружается приложение, сборщик только гонял бы объекты между
+        # поколениями; после первых fork мастер собирает мусор как обычно
+        gc.disable()
+        self.load()
+        if not self.check_workers():
+            return 2
+        self.socket = listen(self.host, self.port)
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_restart)
+        signal.signal(signal.SIGUSR1, self._on_report)
+
+        logger.info(f"🚀 Запуск {self.workers} воркеров на {self.host}:{self.port} "
+                    f"(цикл {EVENT_LOOP}, HTTP {HTTP_PARSER})")
+        for slot in range(self.workers):
+            pid = self.spawn(slot)
+            if pid is None:
+                self.stop()
+                return 1
+            self.slots[slot] = pid
+        gc.enable()
+        logger.info(f"✅ Все воркеры готовы за {time.perf_counter() - started:.2f} с от старта мастера")
+        self.report_memory()
+
+        while not self._stopping:
+            if self._restart:
+                self._restart = False
+                self.rolling_restart()
+            if self._report:
+                self._report = False
+                self.report_memory()
+            self.reap()
+            time.sleep(0.5)
+        self.stop()
+        return 0
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_restart(self, signum, frame):
+        self._restart = True
+
+    def _on_report(self, signum, frame):
+        self._report = True
+
+    def spawn(self, slot: int, standby: bool = False) -> Optional[int]:
+        """Форкнуть воркер слота и дождаться его готовности; None — не запустился.
+
+        standby — воркер останавливается перед запуском приложения, пока
+        мастер не вызовет resume().
+        """
+        forked = time.perf_counter()
+        ready_read, ready_write = os.pipe()
+        resume_read, resume_write = os.pipe() if standby else (None, None)
+        # Все, что загружено до fork, уходит в постоянное поколение: сборщик
+        # в воркере не пишет в заголовки этих объектов и не копирует страницы
+        gc.freeze()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            if resume_write is not None:
+                os.close(resume_write)
+            code = 1
+            try:
+                self.worker(slot, ready_write, resume_read)
+                code = 0
+            except BaseException:
+                logger.exception(f"❌ Воркер {slot} упал")
+            finally:
+                os._exit(code)
+        gc.unfreeze()
+
+        os.close(ready_write)
+        if resume_read is not None:
+            os.close(resume_read)
+        if not self._wait_signal(ready_read, STANDBY if standby else READY):
+            logger.error(f"❌ Воркер {slot} (pid {pid}) не запустился за {STARTUP_TIMEOUT:.0f} с")
+            os.close(ready_read)
+            if resume_write is not None:
+                os.close(resume_write)
+            self.terminate(pid)
+            return None
+        if standby:
+            self.standby[pid] = (ready_read, resume_write)
+            logger.info(f"👷 Воркер {slot} (pid {pid}) ждет запуска приложения, "
+                        f"подготовлен за {time.perf_counter() - forked:.2f} с после fork")
+            return pid
+        os.close(ready_read)
+        logger.info(f"👷 Воркер {slot} (pid {pid}) готов за {time.perf_counter() - forked:.2f} с после fork")
+        return pid
+
+    def resume(self, slot: int, pid: int) -> bool:
+        """Запустить приложение в воркере из spawn(standby=True) и дождаться готовности"""
+        started = time.perf_counter()
+        ready_read, resume_write = self.standby.pop(pid)
+        try:
+            os.write(resume_write, READY)
+            ready = self._wait_signal(ready_read, READY)
+        except OSError:
+            ready = False
+        finally:
+            os.close(ready_read)
+            os.close(resume_write)
+        if not ready:
+            logger.error(f"❌ Воркер {slot} (pid {pid}) не запустил приложение за {STARTUP_TIMEOUT:.0f} с")
+            self.terminate(pid)
+            return False
+        logger.info(f"👷 Воркер {slot} (pid {pid}) готов за {time.perf_counter() - started:.2f} с после запуска")
+        return True
+
+    @staticmethod
+    def _wait_signal(fd: int, expected: bytes) -> bool:
+        readable, _, _ = select.select([fd], [], [], STARTUP_TIMEOUT)
+        return bool(readable) and os.read(fd, 1) == expected
+
+    def terminate(self, pid: int, timeout: float = GRACEFUL_TIMEOUT + 5) -> bool:
+        """SIGTERM и ожидание выхода; по таймауту — SIGKILL. False — процесса уже не было"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return False
+        self.wait_exit(pid, time.monotonic() + timeout)
+        return True
+
+    def wait_exit(self, pid: int, deadline: float):
+        """Дождаться выхода воркера до deadline (time.monotonic), затем SIGKILL"""
+        while time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if done:
+                return
+            time.sleep(0.05)
+        logger.warning(f"⚠️ Воркер pid {pid} не остановился вовремя — SIGKILL")
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+
+    def reap(self):
+        """Перезапустить воркеров, завершившихся без команды мастера, и занять пустые слоты"""
+        for slot, pid in list(self.slots.items()):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done, status = pid, 0
+            if done:
+                logger.error(f"❌ Воркер {slot} (pid {pid}) завершился (статус {status}) — перезапуск")
+                del self.slots[slot]
+        for slot in range(self.workers):
+            if slot in self.slots or self._stopping:
+                continue
+            pid = self.spawn(slot)
+            if pid is None:
+                # Повторим на следующем круге, не чаще раза в секунду
+                time.sleep(1)
+                continue
+            self.slots[slot] = pid
+
+    def rolling_restart(self):
+        """Перечитать данные и заменить воркеров по одному.
+
+        Новый воркер слота запускается, пока работает старый, и только после
+        его готовности старый получает SIGTERM. С RESTART_HANDOFF новый ждет
+        выхода старого перед запуском приложения: журнал комнат пишет один
+        процесс, и новый читает его уже дописанным. Соединения тем временем
+        ждут в очереди общего сокета.
+        """
+        started = time.perf_counter()
+        logger.info("🔄 Плавный перезапуск воркеров")
+        handoff = getattr(self.module, "RESTART_HANDOFF", False)
+        gc.disable()
+        self.preload(reload=True)
+        try:
+            for slot in sorted(self.slots):
+                pid = self.spawn(slot, standby=handoff)
+                if pid is None:
+                    logger.error(f"❌ Перезапуск остановлен на слоте {slot}: старый воркер продолжает работу")
+                    return
+                self.terminate(self.slots.pop(slot))
+                if handoff and not self.resume(slot, pid):
+                    logger.error(f"❌ Перезапуск остановлен на слоте {slot}, слот займет reap()")
+                    return
+                self.slots[slot] = pid
+        finally:
+            gc.enable()
+        logger.info(f"✅ Перезапуск завершен за {time.perf_counter() - started:.2f} с")
+        self.report_memory()
+
+    def stop(self):
+        logger.info("🛑 Остановка воркеров")
+        # Ожидающий запуска воркер выходит сам, увидев закрытый канал запуска
+        waiting = list(self.standby)
+        for ready_read, resume_write in self.standby.values():
+            os.close(ready_read)
+            os.close(resume_write)
+        self.standby.clear()
+        # SIGTERM всем сразу, по одному разу: воркеры дорабатывают запросы параллельно
+        pids = waiting
+        for pid in self.slots.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+                pids.append(pid)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT + 5
+        for pid in pids:
+            self.wait_exit(pid, deadline)
+        self.slots.clear()
+
+    def report_memory(self):
+        """RSS и PSS воркеров: PSS учитывает общие с мастером страницы долями"""
+        total_pss = 0
+        for slot, pid in sorted(self.slots.items()):
+            memory = process_memory(pid)
+            total_pss += memory.get("pss", 0)
+            logger.info(f"📊 Воркер {slot} (pid {pid}): RSS {_mib(memory.get('rss'))} МиБ, "
+                        f"общие {_mib(memory.get('shared'))} МиБ, собственные {_mib(memory.get('private'))} МиБ, "
+                        f"PSS {_mib(memory.get('pss'))} МиБ")
+        master = process_memory()
+        logger.info(f"📊 Мастер: RSS {_mib(master.get('rss'))} МиБ; "
+                    f"PSS всех воркеров {_mib(total_pss)} МиБ")
+
+    # ---------- воркер ----------
+    def worker(self, slot: int, ready_fd: int, resume_fd: Optional[int]):
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGUSR1):
+            signal.signal(sig, signal.SIG_DFL)
+        gc.enable()
+        init_worker = getattr(self.module, "init_worker", None)
+        if init_worker is not None:
+            init_worker(slot, self.workers)
+
+        config = uvicorn.Config(
+            self.app,
+            loop=EVENT_LOOP,
+            http=HTTP_PARSER,
+            log_config=None,
+            timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+            ws_per_message_deflate=getattr(self.module, "WS_PER_MESSAGE_DEFLATE", True),
+        )
+        server = uvicorn.Server(config)
+        config.setup_event_loop()
+        if resume_fd is not None:
+            # Ждем, пока старый воркер слота выйдет; EOF — мастер передумал или умер
+            os.write(ready_fd, STANDBY)
+            resumed = os.read(resume_fd, 1) == READY
+            os.close(resume_fd)
+            if not resumed:
+                os.close(ready_fd)
+                return
+        asyncio.run(self._serve(server, self.socket, ready_fd))
+
+    @staticmethod
+    async def _serve(server, sock: socket.socket, ready_fd: int):
+        task = asyncio.ensure_future(server.serve(sockets=[sock]))
+        while not server.started and not task.done():
+            await asyncio.sleep(0.01)
+        try:
+            if server.started:
+                os.write(ready_fd, READY)
+        except OSError as e:
+            # Мастер уже не ждет (например, сам остановлен)
+            if e.errno != errno.EPIPE:
+                raise
+        finally:
+            os.close(ready_fd)
+        await task
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Продакшен-запуск приложения с предзагрузкой и fork")
+    parser.add_argument("target", nargs="?", default="main:app", help="модуль:приложение")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    sys.path.insert(0, os.getcwd())
+    return Master(args.target, args.workers, args.host, args.port).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Статический экспорт ответов, которые зависят только от даты и каталога.
+
+Гороскопы, карта дня, статус Меркурия и список вопросов рендерятся теми же
+функциями, что и в main.py, в дерево JSON-файлов рядом с их сжатыми
+копиями (.gz, и .br, если установлен brotli). Обратный прокси отдает их
+с диска, а Python обрабатывает только игры и избранное:
+
+    api/questions.json
+    api/horoscope/{знак}/{дата}.json      GET /api/horoscope?sign=&date=
+    api/day-card/{дата}.json              POST /api/day-card в этот день
+    api/mercury-status/{дата}.json        GET /api/mercury-status в этот день
+
+Статус Меркурия экспортируется в том виде, в каком его отдают в сам день
+даты (недельный прогноз — от нее же). manifest.json хранит sha256 и размеры
+каждого файла: хэш годится как ETag, а повторный экспорт переписывает только
+изменившиеся файлы и удаляет те, что выпали из диапазона.
+
+    python static_export.py --days 30
+    python static_export.py --from 2026-01-01 --days 365 --out /var/www/gnome
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import logging
+import hashlib
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+# Экспорту не нужны избранное и статистика ответов — не трогаем рабочую базу.
+# Временный каталог удаляет main_cli (или финализатор при выходе интерпретатора)
+_scratch: Optional[tempfile.TemporaryDirectory] = None
+if "DATABASE_PATH" not in os.environ:
+    _scratch = tempfile.TemporaryDirectory(prefix="gnome-export-")
+    os.environ["DATABASE_PATH"] = os.path.join(_scratch.name, "database.db")
+
+import main
+from mercury_ephemeris import MAX_YEAR, MIN_YEAR, ZODIAC_SIGNS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# ============ НАСТРОЙКИ ============
+EXPORT_DIR = os.environ.get("STATIC_EXPORT_DIR", "static_export")
+EXPORT_DAYS = int(os.environ.get("STATIC_EXPORT_DAYS", 30))
+MANIFEST_NAME = "manifest.json"
+
+
+def encode(payload: Dict[str, Any]) -> bytes:
+    """Тот же JSON, что отдает FastAPI: UTF-8 без экранирования и пробелов"""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def compressed_copies(body: bytes) -> Dict[str, bytes]:
+    # mtime=0 — одинаковый вход дает одинаковый .gz, иначе менялся бы каждый экспорт
+    copies = {".gz": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        copies[".br"] = brotli.compress(body, quality=11)
+    return copies
+
+
+def entry_suffixes(entry: Dict[str, Any]) -> Set[str]:
+    """Суффиксы сжатых копий, записанных для файла манифеста ("gz_bytes" -> ".gz")"""
+    return {"." + key[:-len("_bytes")] for key in entry if key.endswith("_bytes")}
+
+
+# ============ РЕНДЕРИНГ ============
+def dates(start: str, days: int) -> List[str]:
+    first = datetime.strptime(start, "%Y-%m-%d")
+    return [(first + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+
+
+def render(start: str, days: int, signs: List[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Пары (путь, ответ) для всех экспортируемых эндпоинтов"""
+    yield "api/questions.json", main.build_questions_payload()
+    for date in dates(start, days):
+        for sign in signs:
+            yield f"api/horoscope/{sign}/{date}.json", {**main.build_horoscope(sign, date), "cached": True}
+        yield f"api/day-card/{date}.json", main.build_day_card(date)
+        # Живой эндпоинт ставит время запроса; здесь — начало дня, чтобы файл не менялся
+        yield f"api/mercury-status/{date}.json", {
+            **main.build_mercury_payload(date, date),
+            "timestamp": f"{date}T00:00:00+00:00"
+        }
+
+
+# ============ ЗАПИСЬ ============
+def write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(out: Path) -> Dict[str, Any]:
+    try:
+        with open(out / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+
+def export(out: Path, start: str, days: int, signs: List[str]) -> Dict[str, Any]:
+    """Отрендерить диапазон дат в out; возвращает новый манифест"""
+    started = time.perf_counter()
+    previous = load_manifest(out)["files"]
+    files: Dict[str, Dict[str, Any]] = {}
+    written = raw_bytes = gzip_bytes = 0
+
+    for relative, payload in render(start, days, signs):
+        body = encode(payload)
+        digest = hashlib.sha256(body).hexdigest()
+        copies = compressed_copies(body)
+        entry = {"sha256": digest, "bytes": len(body), **{
+            f"{suffix[1:]}_bytes": len(data) for suffix, data in copies.items()
+        }}
+        files[relative] = entry
+        raw_bytes += len(body)
+        gzip_bytes += entry["gz_bytes"]
+
+        path = out / relative
+        # Неизменившиеся файлы не переписываем: прокси и CDN сохраняют кэш
+        if previous.get(relative) == entry and path.exists():
+            continue
+        write_atomic(path, body)
+        for suffix, data in copies.items():
+            write_atomic(path.with_name(path.name + suffix), data)
+        # Копии, которые больше не создаются (например, пропал brotli), иначе
+        # прокси продолжил бы отдавать устаревший .br
+        for suffix in entry_suffixes(previous.get(relative, {})) - copies.keys():
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+        written += 1
+
+    removed = 0
+    for relative in previous.keys() - files.keys():
+        for suffix in ("", ".gz", ".br"):
+            try:
+                os.unlink(out / (relative + suffix))
+            except FileNotFoundError:
+                continue
+        removed += 1
+
+    manifest = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "range": {"from": start, "days": days},
+        "signs": signs,
+        "files": files
+    }
+    write_atomic(out / MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+    ratio = gzip_bytes / raw_bytes * 100 if raw_bytes else 0.0
+    logger.info(f"📦 Экспорт в {out}: {len(files)} файлов, записано {written}, удалено {removed}, "
+                f"{raw_bytes / 1024:.0f} КиБ JSON → {gzip_bytes / 1024:.0f} КиБ gzip ({ratio:.0f}%), "
+                f"за {time.perf_counter() - started:.2f} с")
+    return manifest
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    parser = argparse.ArgumentParser(description="Статический экспорт гороскопов, карт дня, Меркурия и вопросов")
+    parser.add_argument("--out", default=EXPORT_DIR, help="каталог экспорта")
+    parser.add_argument("--from", dest="start", default=today, help="первая дата, ГГГГ-ММ-ДД")
+    parser.add_argument("--days", type=int, default=EXPORT_DAYS, help="сколько дней экспортировать")
+    parser.add_argument("--signs", default=",".join(ZODIAC_SIGNS), help="знаки через запятую, как в ?sign=")
+    args = parser.parse_args(argv)
+
+    try:
+        first = datetime.strptime(args.start, "%Y-%m-%d")
+    except ValueError:
+        parser.error(f"неверная дата --from: {args.start}")
+    if args.days < 1:
+        parser.error("--days должно быть положительным")
+    # Статус Меркурия последнего дня несет недельный прогноз — эфемериды
+    # должны покрывать и его последние шесть дней
+    try:
+        last = first + timedelta(days=args.days - 1 + 6)
+    except OverflowError:
+        last = datetime.max
+    if first.year < MIN_YEAR or last.year > MAX_YEAR:
+        parser.error(f"эфемериды покрывают {MIN_YEAR}-{MAX_YEAR} годы: --from {args.start} "
+                     f"и --days {args.days} (с недельным прогнозом) выходят за них")
+    signs = []
+    for name in (sign.strip() for sign in args.signs.split(",")):
+        if not name:
+            continue
+        # Регистр как у ?sign= живого эндпоинта; файлы — под каноническим именем
+        sign = main.SIGNS_BY_NAME.get(name.lower())
+        if sign is None:
+            parser.error(f"неизвестный знак зодиака: {name} (допустимы {', '.join(ZODIAC_SIGNS)})")
+        signs.append(sign)
+
+    try:
+        export(Path(args.out), args.start, args.days, signs)
+    finally:
+        if _scratch is not None:
+            _scratch.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
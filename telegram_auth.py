@@ -0,0 +1,116 @@
+"""Проверка подписи initData мини-приложения Telegram с кэшированием результатов"""
+import os
+import hmac
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+# ============ НАСТРОЙКИ ============
+BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
+INIT_DATA_MAX_AGE = int(os.environ.get("INIT_DATA_MAX_AGE", 86400))
+INIT_DATA_CACHE_SIZE = int(os.environ.get("INIT_DATA_CACHE_SIZE", 50_000))
+
+# Пользователь без initData (открыл API не из Telegram)
+ANONYMOUS_USER_ID = 0
+
+
+class InitDataError(ValueError):
+    """initData повреждены, подделаны или устарели"""
+
+
+def _extract_hash(init_data: str) -> Optional[str]:
+    for part in init_data.split("&"):
+        if part.startswith("hash="):
+            return part[5:]
+    return None
+
+
+class InitDataVerifier:
+    """Проверяет HMAC initData и кэширует user.id по значению hash в ограниченном LRU.
+
+    Отклоненные initData тоже кэшируются — по дайджесту всей строки, а не по hash:
+    иначе подделка с чужим hash закрыла бы доступ настоящему владельцу.
+    """
+
+    def __init__(self, bot_token: str = BOT_TOKEN, max_age: int = INIT_DATA_MAX_AGE,
+                 cache_size: int = INIT_DATA_CACHE_SIZE):
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+        self.rejected: "OrderedDict[bytes, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if bot_token:
+            self._secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+        else:
+            self._secret = None
+            logger.warning("⚠️ BOT_TOKEN не задан — подпись initData не проверяется (режим разработки)")
+
+    def _check_age(self, auth_date: int):
+        if self.max_age and auth_date and time.time() - auth_date > self.max_age:
+            raise InitDataError("initData устарели")
+
+    def _verify(self, init_data: str) -> Tuple[int, int]:
+        fields = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+        received_hash = fields.pop("hash", "")
+
+        if self._secret is not None:
+            data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+            expected = hmac.new(self._secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, received_hash):
+                raise InitDataError("Неверная подпись initData")
+
+        try:
+            user_id = int(json.loads(fields["user"])["id"])
+            auth_date = int(fields.get("auth_date") or 0)
+        except (KeyError, ValueError, TypeError):
+            raise InitDataError("В initData нет корректного user.id")
+        return user_id, auth_date
+
+    def user_id(self, init_data: str) -> int:
+        """Числовой user.id из initData; повторные запросы не пересчитывают HMAC"""
+        if not init_data:
+            return ANONYMOUS_USER_ID
+
+        received_hash = _extract_hash(init_data)
+        if not received_hash and self._secret is not None:
+            raise InitDataError("В initData нет подписи")
+
+        cached = self.cache.get(received_hash) if received_hash else None
+        if cached is not None:
+            self.hits += 1
+            self.cache.move_to_end(received_hash)
+            self._check_age(cached[1])
+            return cached[0]
+
+        digest = hashlib.sha256(init_data.encode()).digest()
+        reason = self.rejected.get(digest)
+        if reason is not None:
+            self.hits += 1
+            self.rejected.move_to_end(digest)
+            raise InitDataError(reason)
+
+        self.misses += 1
+        try:
+            user_id, auth_date = self._verify(init_data)
+        except ValueError as e:
+            self.rejected[digest] = str(e)
+            if len(self.rejected) > self.cache_size:
+                self.rejected.popitem(last=False)
+            raise InitDataError(str(e)) from e
+        self._check_age(auth_date)
+
+        if received_hash:
+            self.cache[received_hash] = (user_id, auth_date)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return user_id
+
+
+init_data_verifier = InitDataVerifier()
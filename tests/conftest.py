@@ -0,0 +1,11 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Модули читают пути из окружения при импорте: тесты не трогают файлы в рабочем каталоге
+_scratch = tempfile.mkdtemp(prefix="gnome-tests-")
+atexit.register(shutil.rmtree, _scratch, ignore_errors=True)
+os.environ.setdefault("DATABASE_PATH", os.path.join(_scratch, "database.db"))
+os.environ.setdefault("ROOM_JOURNAL_DIR", os.path.join(_scratch, "room_journal"))
+os.environ.setdefault("MERCURY_EPHEMERIS_PATH", os.path.join(_scratch, "mercury_ephemeris.json"))
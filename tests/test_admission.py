@@ -0,0 +1,103 @@
+import asyncio
+import json
+
+import admission
+from admission import AdmissionMiddleware, TokenBucket, client_ip, read_body
+
+
+class IdleMonitor:
+    lag = 0.0
+
+
+def test_token_bucket_spends_capacity_then_refills():
+    bucket = TokenBucket(rate=2.0, capacity=3, now=0.0)
+    assert [bucket.acquire(0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire(0.0) == 0.5
+    # Через полсекунды набежал ровно один токен
+    assert bucket.acquire(0.5) == 0.0
+    assert bucket.acquire(0.5) > 0
+
+
+def test_token_bucket_does_not_exceed_capacity():
+    bucket = TokenBucket(rate=100.0, capacity=2, now=0.0)
+    bucket.acquire(0.0)
+    bucket.acquire(1000.0)
+    assert bucket.tokens == 1.0
+
+
+def test_client_ip_trusts_forwarded_only_behind_proxy(monkeypatch):
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", frozenset({"10.0.0.1"}))
+    forwarded = [(b"x-forwarded-for", b"6.6.6.6, 1.2.3.4, 10.0.0.1")]
+    assert client_ip({"client": ("10.0.0.1", 1), "headers": forwarded}) == "1.2.3.4"
+    assert client_ip({"client": ("5.5.5.5", 1), "headers": forwarded}) == "5.5.5.5"
+
+
+def chunks(*parts):
+    messages = [{"type": "http.request", "body": part, "more_body": True} for part in parts]
+    messages[-1]["more_body"] = False
+    received = []
+
+    async def receive():
+        message = messages[len(received)]
+        received.append(message)
+        return message
+
+    return receive, received
+
+
+def test_read_body_stops_at_limit():
+    receive, received = chunks(b"a" * 10, b"b" * 10, b"c" * 10, b"d" * 10)
+    assert asyncio.run(read_body(receive, limit=15)) is None
+    # Остаток тела не дочитывается
+    assert len(received) == 2
+
+
+def test_read_body_returns_all_messages_within_limit():
+    receive, _ = chunks(b"a" * 10, b"b" * 5)
+    messages = asyncio.run(read_body(receive, limit=15))
+    assert b"".join(m["body"] for m in messages) == b"a" * 10 + b"b" * 5
+
+
+def call(middleware, body: bytes, headers=()):
+    receive, _ = chunks(body)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/api/submit-answer",
+             "headers": list(headers), "client": ("1.2.3.4", 1), "query_string": b""}
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]["status"]
+
+
+async def ok_app(scope, receive, send):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    json.loads(body)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def test_oversized_post_is_rejected():
+    middleware = AdmissionMiddleware(ok_app, monitor=IdleMonitor())
+    body = json.dumps({"initData": "x" * admission.MAX_KEY_BODY}).encode()
+    assert call(middleware, body) == 413
+    assert call(middleware, b"{}", [(b"content-length", str(len(body)).encode())]) == 413
+    assert middleware.rejected_count == 2
+
+
+def test_post_body_is_replayed_to_app():
+    middleware = AdmissionMiddleware(ok_app, monitor=IdleMonitor())
+    assert call(middleware, json.dumps({"initData": ""}).encode()) == 200
+
+
+def test_post_limit_is_per_route_and_client():
+    middleware = AdmissionMiddleware(ok_app, monitor=IdleMonitor(),
+                                     limits={"/api/submit-answer": (0.001, 2)})
+    statuses = [call(middleware, b"{}") for _ in range(3)]
+    assert statuses == [200, 200, 429]
@@ -0,0 +1,111 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from answer_stats import AnswerStats
+
+# Одинаковый текст в двух играх не должен сливаться
+CATALOG = {
+    "fruit_game": [{"question": "Любимый фрукт?", "options": ["Яблоко", "Банан"], "category": "taste"}],
+    "date_ideas": [{"question": "Любимый фрукт?", "options": ["Яблоко", "Банан"], "category": "taste"},
+                   {"question": "Куда пойти?", "options": ["Кино", "Парк"], "category": "leisure"}],
+}
+
+
+def flat_catalog():
+    questions, categories = [], []
+    for category, items in CATALOG.items():
+        questions.extend(items)
+        categories.extend([category] * len(items))
+    return questions, categories
+
+
+def make_stats(path, refresh_interval=60.0) -> AnswerStats:
+    stats = AnswerStats(str(path), flush_interval=3600, refresh_interval=refresh_interval)
+    stats.configure(*flat_catalog())
+    return stats
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def db(tmp_path):
+    return tmp_path / "stats.db"
+
+
+def test_construction_does_not_touch_database(db):
+    make_stats(db)
+    assert not db.exists()
+
+
+def test_counts_are_keyed_by_game_category(db):
+    async def scenario():
+        stats = make_stats(db)
+        await stats.start()
+        stats.record_pick(0, "Банан")
+        stats.record_pick(1, "Яблоко")
+        stats.record_guesses(0, 2, 1)
+        await stats.stop()
+
+    run(scenario())
+    rows = sqlite3.connect(db).execute("SELECT category, question, option, picks FROM answer_picks ORDER BY 1").fetchall()
+    assert rows == [("date_ideas", "Любимый фрукт?", "Яблоко", 1), ("fruit_game", "Любимый фрукт?", "Банан", 1)]
+
+    async def reload():
+        stats = make_stats(db)
+        await stats.start()
+        await stats.stop()
+        return stats.stats(0), stats.stats(1)
+
+    fruit, dates = run(reload())
+    assert [o["picks"] for o in fruit["options"]] == [0, 1]
+    assert [o["picks"] for o in dates["options"]] == [1, 0]
+    assert fruit["match_rate"] == 0.5
+
+
+def test_flush_adds_own_deltas_without_rereading(db):
+    async def scenario():
+        stats = make_stats(db)
+        await stats.start()
+        # Другой воркер дописал в базу после нашего чтения
+        other = sqlite3.connect(db)
+        other.execute("INSERT INTO answer_picks VALUES ('date_ideas', 'Куда пойти?', 'Кино', 5)")
+        other.commit()
+
+        stats.record_pick(2, "Парк")
+        await stats.flush()
+        before_refresh = [o["picks"] for o in stats.stats(2)["options"]]
+
+        stats.refresh_interval = 0
+        await stats.flush()
+        after_refresh = [o["picks"] for o in stats.stats(2)["options"]]
+        await stats.stop()
+        return before_refresh, after_refresh
+
+    assert run(scenario()) == ([0, 1], [5, 1])
+
+
+def test_rows_without_game_category_fall_back_to_unique_text(db):
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE answer_picks (question TEXT, option TEXT, picks INTEGER)")
+    conn.execute("CREATE TABLE answer_matches (question TEXT, guesses INTEGER, correct INTEGER)")
+    conn.execute("INSERT INTO answer_picks VALUES ('Куда пойти?', 'Кино', 3)")
+    # Текст есть в двух играх — такие итоги не к чему отнести
+    conn.execute("INSERT INTO answer_picks VALUES ('Любимый фрукт?', 'Банан', 7)")
+    conn.commit()
+    conn.close()
+
+    async def scenario():
+        stats = make_stats(db)
+        await stats.start()
+        await stats.stop()
+        return stats
+
+    stats = run(scenario())
+    assert [o["picks"] for o in stats.stats(2)["options"]] == [3, 0]
+    assert stats.stats(0)["total_answers"] == 0
+    assert stats.stats(1)["total_answers"] == 0
+    assert stats.stats(3) is None
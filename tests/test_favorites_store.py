@@ -0,0 +1,72 @@
+import json
+import sqlite3
+
+import pytest
+
+from favorites_store import FavoritesStore, decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FavoritesStore(str(tmp_path / "favorites.db"), per_user_cap=3)
+    store.init()
+    return store
+
+
+def test_construction_does_not_touch_database(tmp_path):
+    FavoritesStore(str(tmp_path / "favorites.db"))
+    assert not (tmp_path / "favorites.db").exists()
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2024-01-02T03:04:05+00:00", 17)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == ("2024-01-02T03:04:05+00:00", 17)
+
+
+def test_duplicates_are_not_added(store):
+    assert store.add(1, "card", {"name": "Шут"}) == (True, 1)
+    assert store.add(1, "card", {"name": "Шут"}) == (False, 1)
+    # Тот же контент у другого пользователя — отдельная запись
+    assert store.add(2, "card", {"name": "Шут"}) == (True, 1)
+
+
+def test_cap_evicts_oldest(store):
+    for i in range(5):
+        store.add(1, "card", {"n": i})
+    favorites, _, total = store.page(1)
+    assert total == 3
+    assert [f["content"]["n"] for f in favorites] == [4, 3, 2]
+
+
+def test_pages_follow_cursor(store):
+    store.per_user_cap = 100
+    for i in range(7):
+        store.add(1, "card", {"n": i})
+    seen, cursor = [], None
+    while True:
+        favorites, cursor, _ = store.page(1, cursor, limit=3)
+        seen += [f["content"]["n"] for f in favorites]
+        if cursor is None:
+            break
+    assert seen == [6, 5, 4, 3, 2, 1, 0]
+
+
+def test_legacy_rows_are_hashed_and_deduplicated(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE favorites (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+                 "content_type TEXT NOT NULL, content TEXT NOT NULL, added_at TEXT NOT NULL)")
+    rows = [(1, "card", json.dumps({"n": 1}), "2024-01-01"),
+            (1, "card", json.dumps({"n": 1}), "2024-01-02"),
+            (1, "note", "не JSON", "2024-01-03")]
+    conn.executemany("INSERT INTO favorites (user_id, content_type, content, added_at) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+    store = FavoritesStore(path)
+    store.init()
+    favorites, _, total = store.page(1)
+    assert total == 2
+    assert [f["content"] for f in favorites] == ["не JSON", {"n": 1}]
+    assert store.add(1, "card", {"n": 1}) == (False, 2)
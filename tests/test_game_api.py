@@ -0,0 +1,69 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import admission
+import main
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Middleware держит ссылку на словарь лимитов — меняем его на месте
+    for route in admission.ROUTE_LIMITS:
+        monkeypatch.setitem(admission.ROUTE_LIMITS, route, (1e6, 10 ** 6))
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def room_id(client):
+    room_id = client.post("/api/create-room", json={"game_type": "fruit_game", "creator_name": "Аня"}).json()["room_id"]
+    assert client.post("/api/join-room", json={"room_id": room_id, "player_name": "Боря"}).json()["success"]
+    return room_id
+
+
+def batch(client, room_id, player_name, answers):
+    return client.post("/api/submit-answers", json={
+        "room_id": room_id, "player_name": player_name, "answers": answers
+    })
+
+
+def test_replayed_batch_is_not_applied_to_next_phase(client, room_id):
+    anya = [{"question_id": 0, "phase": 1, "answer": "🍎 Яблоко"}]
+    borya = [{"question_id": 0, "phase": 1, "answer": "🍌 Банан"}]
+    assert batch(client, room_id, "Аня", anya).json()["applied"] == 1
+    assert batch(client, room_id, "Боря", borya).json()["applied"] == 1
+    assert main.game_rooms[room_id]["current_phase"] == 2
+
+    # Ретрай пакета первой фазы после перехода во вторую — дубликат, а не догадка
+    replay = batch(client, room_id, "Аня", anya).json()
+    assert (replay["applied"], replay["duplicates"]) == (0, 1)
+    room = main.game_rooms[room_id]
+    assert not room["guesses"].has(main.room_engine.guess_row(room, 0, 1), 0)
+
+
+def test_replayed_answer_is_not_applied_to_next_phase(client, room_id):
+    answer = {"room_id": room_id, "player_name": "Аня", "question_id": 0, "phase": 1, "answer": "🍎 Яблоко"}
+    assert client.post("/api/submit-answer", json=answer).json()["waiting_for_partner"]
+    client.post("/api/submit-answer", json={**answer, "player_name": "Боря", "answer": "🍌 Банан"})
+    replay = client.post("/api/submit-answer", json=answer).json()
+    assert replay["duplicate"] and not replay["waiting_for_partner"]
+
+
+def test_phase_is_required(client, room_id):
+    assert batch(client, room_id, "Аня", [{"question_id": 0, "answer": "🍎 Яблоко"}]).status_code == 422
+    answer = {"room_id": room_id, "player_name": "Аня", "question_id": 0, "answer": "🍎 Яблоко"}
+    assert client.post("/api/submit-answer", json=answer).status_code == 422
+
+
+@pytest.mark.parametrize("question_id, phase", [(-1, 1), (0, 0), (0, -3)])
+def test_negative_keys_are_rejected(client, room_id, question_id, phase):
+    item = {"question_id": question_id, "phase": phase, "answer": "🍎 Яблоко"}
+    response = batch(client, room_id, "Аня", [{"question_id": 0, "phase": 1, "answer": "🍎 Яблоко"}, item])
+    assert response.status_code == 400
+    assert response.json()["detail"]["index"] == 1
+    # Пакет отклонен целиком
+    assert main.game_rooms[room_id]["current_phase"] == 1
+    assert not main.game_rooms[room_id]["answers"].has(0, 0)
+
+    response = client.post("/api/submit-answer", json={"room_id": room_id, "player_name": "Аня", **item})
+    assert response.status_code == 400
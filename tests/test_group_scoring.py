@@ -0,0 +1,69 @@
+import numpy as np
+
+from group_scoring import (
+    MISSING, AnswerMatrix, agreement_counts, best_pairs, group_percent, guess_counts, pair_percent
+)
+
+
+def test_matrix_grows_and_interns_options():
+    matrix = AnswerMatrix()
+    matrix.set(0, 0, "🍎 Яблоко")
+    matrix.set(5, 40, "🍌 Банан")
+    matrix.set(1, 0, "🍎 Яблоко")
+    assert matrix.options == ["🍎 Яблоко", "🍌 Банан"]
+    assert (matrix.rows, matrix.columns) == (6, 41)
+    assert matrix.get(5, 40) == "🍌 Банан" and matrix.has(1, 0)
+    assert not matrix.has(2, 3) and matrix.get(100, 100) is None
+
+
+def test_view_pads_with_missing():
+    matrix = AnswerMatrix()
+    matrix.set(0, 1, "да")
+    view = matrix.view(3, 4)
+    assert view.shape == (3, 4)
+    assert view[0, 1] == 0 and (view[1:] == MISSING).all()
+
+
+def test_json_round_trip_is_lazy():
+    matrix = AnswerMatrix()
+    matrix.set(0, 0, "да")
+    matrix.set(1, 2, "нет")
+    restored = AnswerMatrix.from_json(matrix.to_json())
+    assert restored.to_json() == matrix.to_json()
+    assert restored.get(1, 2) == "нет" and restored.get(0, 0) == "да"
+    assert (restored.view(2, 3) == matrix.view(2, 3)).all()
+
+
+def test_agreement_counts_only_shared_answers():
+    answers = np.array([
+        [0, 1, 2, MISSING],
+        [0, 1, 3, 1],
+        [MISSING, 1, 2, 1],
+    ], dtype=np.int32)
+    same, both = agreement_counts(answers)
+    assert same[0, 1] == 2 and both[0, 1] == 3
+    assert same[0, 2] == 2 and both[0, 2] == 2
+    assert same[1, 2] == 2 and both[1, 2] == 3
+
+
+def test_guess_counts_rows_are_guessers():
+    answers = np.array([[0, 1], [1, 1]], dtype=np.int32)
+    guesses = np.full((2, 2, 2), MISSING, dtype=np.int32)
+    guesses[0, 1] = [1, 0]
+    correct, tried = guess_counts(answers, guesses)
+    assert correct[0, 1] == 1 and tried[0, 1] == 2
+    assert tried[1, 0] == 0
+
+
+def test_pair_and_group_percent():
+    hits = np.array([[0, 2, 0], [1, 0, 0], [0, 0, 0]])
+    totals = np.array([[0, 2, 0], [2, 0, 0], [0, 0, 0]])
+    percent = pair_percent(hits, totals)
+    assert percent[0, 1] == percent[1, 0] == 75.0
+    # Пары без данных — 0, а не деление на ноль
+    assert percent[0, 2] == 0.0 and (np.diag(percent) == 0).all()
+    assert group_percent(percent) == 25.0
+    assert group_percent(np.zeros((1, 1))) == 0.0
+    assert best_pairs(percent, ["Аня", "Боря", "Вера"], limit=1) == [
+        {"players": ["Аня", "Боря"], "compatibility_percent": 75.0}
+    ]
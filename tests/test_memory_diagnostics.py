@@ -0,0 +1,33 @@
+import sys
+
+import numpy as np
+
+from answer_stats import AnswerStats
+from memory_diagnostics import SAMPLE_ENTRIES, deep_sizeof, estimate_store
+from room_journal import RoomJournal
+
+
+def test_shared_objects_are_counted_once():
+    shared = "x" * 1000
+    assert deep_sizeof([shared, shared]) == sys.getsizeof([shared, shared]) + sys.getsizeof(shared)
+
+
+def test_large_stores_are_sampled():
+    store = {i: f"{i:0100d}" for i in range(SAMPLE_ENTRIES * 10)}
+    report = estimate_store(store)
+    assert report["sampled"] and report["entries"] == len(store)
+    assert report["approx_bytes"] > len(store) * 100
+
+
+def test_stores_report_their_own_usage(tmp_path):
+    journal = RoomJournal(str(tmp_path))
+    journal.recover()
+    journal.record("c", "R1", "fruit_game", "Аня", "2024-01-01T00:00:00+00:00")
+    report = estimate_store(journal)
+    assert report["entries"] == 1 and report["approx_bytes"] > 0
+
+    stats = AnswerStats(str(tmp_path / "stats.db"))
+    stats.configure([{"question": "?", "options": ["a", "b"]}] * 100, ["game"] * 100)
+    report = estimate_store(stats)
+    assert report["entries"] == 0
+    assert report["approx_bytes"] >= 4 * np.zeros((100, 2), dtype=np.int64).nbytes
@@ -0,0 +1,40 @@
+from datetime import date
+
+import pytest
+
+import mercury_ephemeris
+
+# Станции Меркурия 2024 года по UTC (начало и конец ретроградного движения)
+STATIONS_2024 = [("2024-04-01", "2024-04-25"), ("2024-08-05", "2024-08-28"), ("2024-11-26", "2024-12-15")]
+
+
+def days_between(a: str, b: str) -> int:
+    return abs((date.fromisoformat(a) - date.fromisoformat(b)).days)
+
+
+def test_station_dates_match_almanac():
+    periods = mercury_ephemeris.compute_year(2024)
+    assert len(periods) == len(STATIONS_2024)
+    for period, (start, end) in zip(periods, STATIONS_2024):
+        assert days_between(period["retrograde_start"], start) <= 1
+        assert days_between(period["retrograde_end"], end) <= 1
+
+
+def test_shadows_surround_retrograde():
+    for period in mercury_ephemeris.compute_year(2024):
+        assert period["pre_shadow_start"] < period["retrograde_start"] < period["retrograde_end"]
+        assert period["retrograde_end"] < period["post_shadow_end"]
+        assert period["signs"] and set(period["signs"]) <= set(mercury_ephemeris.ZODIAC_SIGNS)
+
+
+def test_periods_around_rejects_years_out_of_range():
+    with pytest.raises(ValueError):
+        mercury_ephemeris.periods_around(mercury_ephemeris.MAX_YEAR + 1)
+    with pytest.raises(ValueError):
+        mercury_ephemeris.periods_around(mercury_ephemeris.MIN_YEAR - 1)
+
+
+def test_weekly_forecast_stops_at_end_of_range():
+    import main
+    forecast = main.get_weekly_mercury_forecast(f"{mercury_ephemeris.MAX_YEAR}-12-28")["week_forecast"]
+    assert [day["date"][-5:] for day in forecast] == ["12-28", "12-29", "12-30", "12-31"]
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import shutil
+import tempfile
+
+import pytest
+
+import websocket_server
+from room_bus import ROOM_NOT_FOUND, InProcessRoomBus, RoomBroker, RoomBus, UnixSocketRoomBus
+from websocket_server import GameManager
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+        self.commands = []
+
+    async def on_event(self, room_code, message, to):
+        self.events.append((room_code, message, to))
+
+    async def on_command(self, room_code, command):
+        self.commands.append((room_code, command))
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+
+async def settle(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_room_bus_is_abstract():
+    with pytest.raises(TypeError):
+        RoomBus()
+
+
+def test_in_process_bus_routes_commands_to_owner():
+    async def run():
+        bus, recorder = InProcessRoomBus(), Recorder()
+        await bus.start(recorder.on_event, recorder.on_command)
+        assert await bus.claim("1234")
+        assert not await bus.claim("1234")
+        await bus.send_command("1234", {"type": "start_game"})
+        await bus.send_command("9999", {"type": "start_game"}, reply_to="p1")
+        await bus.release("1234")
+        assert await bus.claim("1234")
+        return bus, recorder
+    bus, recorder = asyncio.run(run())
+    assert recorder.commands == [("1234", {"type": "start_game", "worker": bus.worker_id})]
+    assert recorder.events == [("9999", ROOM_NOT_FOUND, "p1")]
+
+
+def test_broker_reports_crashed_worker_to_room_owner():
+    directory = tempfile.mkdtemp(prefix="bus-")
+    path = f"{directory}/rooms.sock"
+
+    async def run():
+        broker = asyncio.get_running_loop().create_task(RoomBroker(path).serve())
+        await asyncio.sleep(0.05)
+        owner, remote = UnixSocketRoomBus(path), UnixSocketRoomBus(path)
+        owner_recorder, remote_recorder = Recorder(), Recorder()
+        await owner.start(owner_recorder.on_event, owner_recorder.on_command)
+        await remote.start(remote_recorder.on_event, remote_recorder.on_command)
+        assert await owner.claim("1234")
+        assert not await remote.claim("1234")
+        await remote.subscribe("1234")
+        await remote.send_command("1234", {"type": "submit_answer", "player_id": "p2"})
+        await settle(lambda: owner_recorder.commands)
+
+        # Воркер падает, не отписавшись и не прислав leave
+        remote._reader_task.cancel()
+        remote._writer.transport.abort()
+        await settle(lambda: len(owner_recorder.commands) == 2)
+
+        await owner.stop()
+        broker.cancel()
+        return owner_recorder.commands, remote.worker_id
+
+    try:
+        commands, remote_id = asyncio.run(run())
+    finally:
+        shutil.rmtree(directory)
+    assert commands[0][1]["worker"] == remote_id
+    assert commands[1] == ("1234", {"type": "worker_gone", "worker": remote_id})
+
+
+def test_room_closes_when_players_worker_is_gone(monkeypatch):
+    monkeypatch.setattr(websocket_server, "ROOM_CLOSE_DELAY", 0)
+
+    async def run():
+        manager = GameManager(InProcessRoomBus())
+        await manager.start()
+        room_code, _ = await manager.create_room(FakeSocket(), "Аня")
+        remote = FakeSocket()
+        _, player_id = await manager.join_room(remote, room_code, "Боря")
+        await settle(lambda: manager.actors[room_code].task is None)
+        assert set(manager.online[room_code]) == {player_id, *manager.rooms[room_code]["players"]}
+
+        # Первый игрок ушел сам, второй был на упавшем воркере
+        creator = next(pid for pid in manager.online[room_code] if pid != player_id)
+        await manager.handle_command(room_code, {"type": "leave", "player_id": creator})
+        manager.online[room_code][player_id] = "crashed-worker"
+        await manager.handle_command(room_code, {"type": "worker_gone", "worker": "crashed-worker"})
+        await settle(lambda: room_code not in manager.rooms)
+        return manager, room_code
+
+    manager, room_code = asyncio.run(run())
+    assert room_code not in manager.bus.owned
+    assert manager.online == {}
@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from room_engine import EVENT_ANSWER, EVENT_COMPLETE, EVENT_CREATE, EVENT_JOIN, EVENT_START
+from room_journal import RoomJournal
+
+
+def play(journal: RoomJournal, room_id: str, created_at: datetime):
+    journal.record(EVENT_CREATE, room_id, "fruit_game", "Аня", created_at.isoformat())
+    journal.record(EVENT_JOIN, room_id, "Боря")
+    journal.record(EVENT_START, room_id)
+    journal.record(EVENT_ANSWER, room_id, "Аня", 0, "🍎 Яблоко")
+    journal.record(EVENT_ANSWER, room_id, "Боря", 0, "🍌 Банан")
+
+
+def write(directory, rooms, segment_events=100_000):
+    async def run():
+        journal = RoomJournal(str(directory), segment_events=segment_events)
+        journal.recover()
+        for room_id, created_at in rooms:
+            play(journal, room_id, created_at)
+            await journal.flush()
+        journal._compactor.shutdown(wait=True)
+        await journal.stop()
+        return journal
+    return asyncio.run(run())
+
+
+def test_replay_restores_rooms(tmp_path):
+    now = datetime.now(timezone.utc)
+    write(tmp_path, [("R1", now), ("R2", now)])
+    rooms = RoomJournal(str(tmp_path)).recover()
+    assert sorted(rooms) == ["R1", "R2"]
+    assert rooms["R1"]["players"] == ["Аня", "Боря"]
+    assert rooms["R1"]["status"] == "playing"
+    assert rooms["R1"]["current_phase"] == 2
+
+
+def test_recovery_continues_sequence(tmp_path):
+    now = datetime.now(timezone.utc)
+    first = write(tmp_path, [("R1", now)])
+    second = write(tmp_path, [("R2", now)])
+    assert second.seq == 2 * first.seq
+    assert sorted(RoomJournal(str(tmp_path)).recover()) == ["R1", "R2"]
+
+
+def test_compaction_folds_closed_segments_into_snapshot(tmp_path):
+    now = datetime.now(timezone.utc)
+    write(tmp_path, [(f"R{i}", now) for i in range(20)], segment_events=10)
+    assert list(tmp_path.glob("snapshot-*.json"))
+    assert len(list(tmp_path.glob("journal-*.log"))) < 10
+    assert len(RoomJournal(str(tmp_path)).recover()) == 20
+
+
+def test_expired_rooms_are_not_recovered(tmp_path):
+    old = datetime.now(timezone.utc) - timedelta(days=30)
+    write(tmp_path, [("OLD", old), ("NEW", datetime.now(timezone.utc))])
+    assert list(RoomJournal(str(tmp_path)).recover()) == ["NEW"]
+
+
+def test_finished_rooms_expire_after_completion(tmp_path):
+    async def run():
+        journal = RoomJournal(str(tmp_path))
+        journal.recover()
+        play(journal, "DONE", datetime.now(timezone.utc))
+        journal.record(EVENT_COMPLETE, "DONE", (datetime.now(timezone.utc) - timedelta(days=1)).isoformat())
+        await journal.stop()
+    asyncio.run(run())
+    assert RoomJournal(str(tmp_path)).recover() == {}
+
+
+def test_record_is_dropped_until_recovered(tmp_path):
+    journal = RoomJournal(str(tmp_path))
+    play(journal, "R1", datetime.now(timezone.utc))
+    assert journal.seq == 0
+    assert journal._buffer == []
@@ -0,0 +1,55 @@
+import copy
+
+from room_sync import RoomState, merge_patch
+
+
+def replay(snapshot, deltas):
+    state = copy.deepcopy(snapshot)
+    for _, patch in deltas:
+        merge_patch(state, patch)
+    return state
+
+
+def test_merge_patch_merges_nested_and_deletes_null():
+    state = {"phase": "lobby", "players": {"Аня": {"ready": False}}, "round": 1}
+    merge_patch(state, {"phase": "playing", "players": {"Аня": {"ready": True}, "Боря": {"ready": False}},
+                        "round": None})
+    assert state == {"phase": "playing", "players": {"Аня": {"ready": True}, "Боря": {"ready": False}}}
+
+
+def test_merge_patch_leaves_patch_untouched():
+    patch = {"players": {"Аня": {"score": 1}}}
+    state = {}
+    merge_patch(state, patch)
+    state["players"]["Аня"]["score"] = 2
+    assert patch == {"players": {"Аня": {"score": 1}}}
+
+
+def test_since_returns_missing_deltas():
+    room = RoomState({"phase": "lobby"}, history=8)
+    seen = room.snapshot()
+    room.apply("join", {"players": {"Аня": True}})
+    room.apply("start", {"phase": "playing"})
+
+    message = room.since(seen["v"])
+    assert message["type"] == "state_deltas" and message["v"] == 2
+    assert replay(seen["s"], message["deltas"]) == room.state
+    assert room.since(2) == {"type": "state_deltas", "v": 2, "deltas": []}
+
+
+def test_since_resyncs_when_history_evicted_or_version_unknown():
+    room = RoomState({"n": 0}, history=2)
+    for n in range(1, 5):
+        room.apply("tick", {"n": n})
+    assert room.since(1)["type"] == "state_sync"
+    assert room.since(2)["deltas"] == [[3, {"n": 3}], [4, {"n": 4}]]
+    assert room.since(None)["type"] == "state_sync"
+    # Версия из будущего — клиент видел другую жизнь комнаты (перезапуск)
+    assert room.since(99) == {"type": "state_sync", "v": 4, "s": {"n": 4}}
+
+
+def test_snapshot_is_a_copy():
+    room = RoomState({"players": {"Аня": 0}})
+    snapshot = room.snapshot()
+    room.apply("score", {"players": {"Аня": 1}})
+    assert snapshot["s"] == {"players": {"Аня": 0}}
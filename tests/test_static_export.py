@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+import static_export
+
+
+@pytest.mark.parametrize("argv", [
+    ["--from", "1799-12-31"],
+    ["--from", "2050-12-31"],
+    # Последний день в диапазоне, но его недельный прогноз — уже нет
+    ["--from", "2050-12-20", "--days", "7"],
+    ["--from", "2026-01-01", "--days", "999999999"],
+    ["--signs", "Aries,Ophiuchus"],
+    ["--signs", "../etc"],
+])
+def test_rejects_arguments_out_of_range(argv, tmp_path, capsys):
+    with pytest.raises(SystemExit) as exc:
+        static_export.main_cli(["--out", str(tmp_path), *argv])
+    assert exc.value.code == 2
+    assert not any(tmp_path.iterdir())
+
+
+def test_exports_canonical_sign_names(tmp_path):
+    assert static_export.main_cli(["--out", str(tmp_path), "--from", "2050-12-25", "--days", "1",
+                                   "--signs", "aries, LEO"]) == 0
+    assert (tmp_path / "api/horoscope/Aries/2050-12-25.json").exists()
+    assert (tmp_path / "api/horoscope/Leo/2050-12-25.json").exists()
+    mercury = json.loads((tmp_path / "api/mercury-status/2050-12-25.json").read_text(encoding="utf-8"))
+    forecast = mercury["weekly_forecast"]["week_forecast"]
+    assert [day["date"] for day in forecast][-1] == "2050-12-31"
@@ -0,0 +1,63 @@
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+from telegram_auth import ANONYMOUS_USER_ID, InitDataError, InitDataVerifier
+
+BOT_TOKEN = "123:test"
+
+
+def sign(user_id: int, auth_date: int = None) -> str:
+    fields = {"user": json.dumps({"id": user_id}), "auth_date": str(auth_date or int(time.time()))}
+    secret = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    fields["hash"] = hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def test_valid_init_data_is_cached():
+    verifier = InitDataVerifier(BOT_TOKEN)
+    init_data = sign(42)
+    assert verifier.user_id(init_data) == 42
+    assert verifier.user_id(init_data) == 42
+    assert (verifier.misses, verifier.hits) == (1, 1)
+
+
+def test_empty_init_data_is_anonymous():
+    assert InitDataVerifier(BOT_TOKEN).user_id("") == ANONYMOUS_USER_ID
+
+
+def test_expired_init_data_is_rejected():
+    verifier = InitDataVerifier(BOT_TOKEN, max_age=60)
+    with pytest.raises(InitDataError):
+        verifier.user_id(sign(42, auth_date=int(time.time()) - 3600))
+
+
+def test_invalid_init_data_is_negatively_cached():
+    verifier = InitDataVerifier(BOT_TOKEN)
+    forged = sign(42).replace("42", "43", 1)
+    for _ in range(3):
+        with pytest.raises(InitDataError):
+            verifier.user_id(forged)
+    # HMAC считался только один раз
+    assert verifier.misses == 1
+
+
+def test_forged_copy_does_not_lock_out_owner():
+    verifier = InitDataVerifier(BOT_TOKEN)
+    genuine = sign(42)
+    with pytest.raises(InitDataError):
+        verifier.user_id(genuine.replace("42", "43", 1))
+    assert verifier.user_id(genuine) == 42
+
+
+def test_negative_cache_is_bounded():
+    verifier = InitDataVerifier(BOT_TOKEN, cache_size=2)
+    for user_id in range(5):
+        with pytest.raises(InitDataError):
+            verifier.user_id(sign(user_id) + "0")
+    assert len(verifier.rejected) == 2
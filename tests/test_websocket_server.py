@@ -0,0 +1,122 @@
+import asyncio
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+import websocket_server
+from room_bus import InProcessRoomBus
+from websocket_server import ROOM_INBOX_SIZE, GameManager, RoomActor, valid_answer_batch
+
+
+def test_control_commands_skip_the_full_inbox():
+    applied = []
+
+    async def apply(room_code, command):
+        applied.append(command["type"])
+
+    async def run():
+        actor = RoomActor("1234", apply)
+        for _ in range(ROOM_INBOX_SIZE):
+            assert actor.submit({"type": "submit_answer"})
+        assert not actor.submit({"type": "submit_answer"})
+        actor.submit_control({"type": "start_game"})
+        await actor.task
+        return actor
+
+    actor = asyncio.run(run())
+    assert applied[0] == "start_game"
+    assert len(applied) == ROOM_INBOX_SIZE + 1
+    assert actor.task is None
+
+
+def test_handle_command_never_waits_for_a_full_room():
+    async def run():
+        manager = GameManager(InProcessRoomBus())
+        await manager.start()
+        room_code, _ = await manager.create_room(FakeSocket(), "Аня")
+        actor = manager.actors[room_code]
+        for _ in range(ROOM_INBOX_SIZE):
+            actor.submit({"type": "resync", "player_id": "x"})
+        # Актор еще не получал управления: команда встала в очередь, не дожидаясь места
+        await manager.handle_command(room_code, {"type": "leave", "player_id": "x"})
+        return actor.inbox.full(), list(actor.control)
+
+    full, control = asyncio.run(run())
+    assert full
+    assert control == [{"type": "leave", "player_id": "x"}]
+
+
+def test_stopped_actor_returns_pending_commands():
+    async def apply(room_code, command):
+        pass
+
+    async def run():
+        actor = RoomActor("1234", apply)
+        actor.submit({"type": "submit_answer"})
+        actor.submit_control({"type": "leave"})
+        return actor.stop()
+
+    assert [c["type"] for c in asyncio.run(run())] == ["leave", "submit_answer"]
+
+
+def test_deferred_task_errors_are_logged(caplog):
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def run():
+        manager = GameManager(InProcessRoomBus())
+        task = manager.spawn(fail())
+        assert task in manager.tasks
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        return manager
+
+    with caplog.at_level(logging.ERROR):
+        manager = asyncio.run(run())
+    assert manager.tasks == set()
+    assert "boom" in caplog.text
+
+
+def test_valid_answer_batch():
+    assert valid_answer_batch([{"question_id": 0, "answer": "🍎"}])
+    assert not valid_answer_batch([])
+    assert not valid_answer_batch([{"question_id": -1, "answer": "🍎"}])
+    assert not valid_answer_batch([{"question_id": True, "answer": "🍎"}])
+    assert not valid_answer_batch({"question_id": 0, "answer": "🍎"})
+
+
+class FakeSocket:
+    async def send_text(self, text):
+        pass
+
+
+def receive_until(socket, *types):
+    while True:
+        message = socket.receive_json()
+        if message.get("type") == "error":
+            raise AssertionError(message)
+        if message.get("event", message.get("type")) in types:
+            return message
+
+
+def test_two_players_finish_a_game(monkeypatch):
+    monkeypatch.setattr(websocket_server, "ROUND_RESULTS_PAUSE", 0.01)
+    monkeypatch.setattr(websocket_server, "ROOM_CLOSE_DELAY", 0.01)
+    with TestClient(websocket_server.app) as client, \
+            client.websocket_connect("/ws") as anya, client.websocket_connect("/ws") as borya:
+        anya.send_json({"type": "create_room", "player_name": "Аня"})
+        created = receive_until(anya, "room_created")
+        room_code, anya_id = created["room_code"], created["player_id"]
+        borya.send_json({"type": "join_room", "room_code": room_code, "player_name": "Боря"})
+        borya_id = receive_until(borya, "room_joined")["player_id"]
+        anya.send_json({"type": "start_game", "room_code": room_code})
+        receive_until(anya, "game_started")
+
+        for question in range(2):
+            anya.send_json({"type": "submit_answer", "room_code": room_code, "player_id": anya_id, "answer": "apple"})
+            borya.send_json({"type": "submit_answer", "room_code": room_code, "player_id": borya_id, "answer": "apple"})
+            receive_until(anya, "round_results")
+            finished = receive_until(anya, "next_question" if question == 0 else "game_finished")
+
+        assert finished["d"]["result"]["compatibility"] == 100
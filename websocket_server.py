@@ -1,28 +1,168 @@
+import os
 import asyncio
 import json
 import uuid
+import logging
 from datetime import datetime
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from typing import Dict, List
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
 import random
 
+from room_bus import ROOM_BUS_URL, ROOM_NOT_FOUND, RoomBus, create_room_bus
+from room_sync import RoomState
+import room_engine
+import group_scoring
+import memory_diagnostics
+
+logger = logging.getLogger(__name__)
+
+# Сжатие сообщений (permessage-deflate); дельты короткие, и на слабых клиентах
+# сжатие может стоить дороже сэкономленных байт
+WS_PER_MESSAGE_DEFLATE = os.environ.get("WS_PER_MESSAGE_DEFLATE", "1") == "1"
+# Без общей шины комнаты видны только своему воркеру — serve.py запустит один
+MAX_WORKERS = None if ROOM_BUS_URL.startswith("unix:") else 1
+# Сколько ответов можно прислать одним submit_answers
+MAX_ANSWER_BATCH = 64
+# Очередь команд одной комнаты; при переполнении команды игроков отклоняются
+ROOM_INBOX_SIZE = int(os.environ.get("ROOM_INBOX_SIZE", 64))
+# Команды, которые нельзя потерять: идут в отдельную неограниченную очередь
+# актора и не отклоняются и не ждут места (их шлют не чаще раза на игрока)
+CONTROL_COMMANDS = frozenset({"start_game", "leave", "worker_gone"})
+# Сколько секунд показываются результаты раунда
+ROUND_RESULTS_PAUSE = float(os.environ.get("ROUND_RESULTS_PAUSE_S", 3))
+# Через сколько секунд закрывается завершенная или опустевшая комната:
+# за это время игрок успевает переподключиться и увидеть итог
+ROOM_CLOSE_DELAY = float(os.environ.get("ROOM_CLOSE_DELAY_S", 60))
+# Сколько раз пытаемся занять случайный код комнаты, прежде чем сдаться
+MAX_CLAIM_ATTEMPTS = 32
+
 app = FastAPI()
 
 # Хранилище игровых комнат
 game_rooms: Dict[str, dict] = {}
 connections: Dict[str, WebSocket] = {}
 
+class RoomActor:
+    """Очереди команд комнаты и задача, применяющая их строго по одной.
+
+    Только актор меняет состояние своей комнаты, поэтому переходы между
+    вопросами не перемешиваются даже если обработчик уступает управление
+    посередине. Управляющие команды (CONTROL_COMMANDS и внутренние advance/close)
+    идут в отдельную неограниченную очередь и применяются первыми: постановка
+    никогда не ждет, поэтому полная комната не задерживает чтение шины.
+    Задача живет, пока в очередях есть команды, — простаивающие комнаты
+    не держат корутин. После stop() актор команд не принимает.
+    """
+
+    def __init__(self, room_code: str, apply: Callable[[str, dict], Awaitable[None]]):
+        self.room_code = room_code
+        self.apply = apply
+        self.inbox: asyncio.Queue = asyncio.Queue(maxsize=ROOM_INBOX_SIZE)
+        self.control: Deque[dict] = deque()
+        self.task: Optional[asyncio.Task] = None
+        self.stopped = False
+    
+    def submit(self, command: dict) -> bool:
+        """Поставить команду игрока в очередь; False — очередь переполнена"""
+        try:
+            self.inbox.put_nowait(command)
+        except asyncio.QueueFull:
+            return False
+        self._wake()
+        return True
+    
+    def submit_control(self, command: dict):
+        """Поставить управляющую команду; она не отклоняется и не ждет места"""
+        self.control.append(command)
+        self._wake()
+    
+    def _wake(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+    
+    def stop(self) -> List[dict]:
+        """Остановить актор; возвращает команды, которые остались в очереди.
+
+        Вызывается из команды самого актора: задача завершится, вернувшись в run().
+        """
+        self.stopped = True
+        dropped = list(self.control)
+        self.control.clear()
+        while not self.inbox.empty():
+            dropped.append(self.inbox.get_nowait())
+        return dropped
+    
+    async def run(self):
+        while not self.stopped:
+            if self.control:
+                command = self.control.popleft()
+            else:
+                try:
+                    command = self.inbox.get_nowait()
+                except asyncio.QueueEmpty:
+                    # Между пустыми очередями и сбросом задачи нет await — команда не потеряется
+                    self.task = None
+                    return
+            try:
+                await self.apply(self.room_code, command)
+            except Exception as e:
+                logger.error(f"❌ Ошибка команды {command.get('type')} в комнате {self.room_code}: {e}")
+        self.task = None
+
+
 class GameManager:
-    def __init__(self):
+    def __init__(self, bus: Optional[RoomBus] = None):
+        # Комнаты, которыми владеет этот воркер
         self.rooms = {}
+        # Версионированное состояние комнат для клиентов: room_code -> RoomState
+        self.states: Dict[str, RoomState] = {}
+        # Акторы комнат: все изменения комнаты идут через очередь ее актора
+        self.actors: Dict[str, RoomActor] = {}
+        # Сокеты игроков, подключенных к этому воркеру: room_code -> player_id -> WebSocket
+        self.sockets: Dict[str, Dict[str, WebSocket]] = {}
+        # Игроки на связи в комнатах этого воркера: room_code -> player_id -> воркер с его сокетом
+        self.online: Dict[str, Dict[str, str]] = {}
+        # Отложенные задачи (пауза перед следующим вопросом, закрытие комнаты):
+        # ссылки не дают сборщику мусора удалить их до завершения
+        self.tasks: Set[asyncio.Task] = set()
+        self.bus = bus or create_room_bus()
     
-    async def create_room(self, websocket: WebSocket, player_name: str):
-        """Создать новую игровую комнату"""
-        room_code = str(random.randint(1000, 9999))
-        
-        # Убеждаемся что код уникален
-        while room_code in self.rooms:
+    async def start(self):
+        await self.bus.start(self.deliver, self.handle_command)
+    
+    async def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await self.bus.stop()
+    
+    def spawn(self, coro: Awaitable[None]) -> asyncio.Task:
+        """Запустить отложенную задачу менеджера"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+    
+    def _task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"❌ Ошибка отложенной задачи комнаты: {task.exception()!r}")
+    
+    async def create_room(self, websocket: WebSocket, player_name: str,
+                          max_players: int = room_engine.DEFAULT_PLAYERS):
+        """Создать новую игровую комнату; None — свободного кода не нашлось"""
+        # Убеждаемся что код уникален среди всех воркеров
+        for _ in range(MAX_CLAIM_ATTEMPTS):
             room_code = str(random.randint(1000, 9999))
+            if room_code not in self.rooms and await self.bus.claim(room_code):
+                break
+        else:
+            logger.warning(f"⚠️ Не удалось занять код комнаты за {MAX_CLAIM_ATTEMPTS} попыток")
+            await self.send_to_player(websocket, {
+                "type": "error",
+                "message": "Нет свободных комнат, повторите позже"
+            })
+            return None
         
         player_id = str(uuid.uuid4())
         
@@ -31,11 +171,13 @@ class GameManager:
             "players": {
                 player_id: {
                     "name": player_name,
-                    "websocket": websocket,
                     "ready": False,
-                    "answers": {}
+                    "row": 0
                 }
             },
+            "max_players": max(2, min(max_players, room_engine.MAX_PLAYERS)),
+            # Ответы: строка игрока × номер вопроса
+            "answers": group_scoring.AnswerMatrix(),
             "game_state": "waiting",  # waiting, playing, finished
             "current_question": 0,
             "questions": [
@@ -62,9 +204,12 @@ class GameManager:
             ],
             "created_at": datetime.now().isoformat()
         }
+        state = self.track_room(room_code)
+        self.online[room_code] = {player_id: self.bus.worker_id}
+        await self.attach(room_code, player_id, websocket)
         
         await self.send_to_player(websocket, {
-            "type": "room_created",
+            **state.snapshot("room_created"),
             "room_code": room_code,
             "player_id": player_id
         })
@@ -72,108 +217,282 @@ class GameManager:
         return room_code, player_id
     
     async def join_room(self, websocket: WebSocket, room_code: str, player_name: str):
-        """Присоединиться к комнате"""
-        if room_code not in self.rooms:
-            await self.send_to_player(websocket, {
-                "type": "error",
-                "message": "Комната не найдена"
-            })
-            return None, None
-        
+        """Присоединиться к комнате — владелец комнаты может быть в другом воркере"""
+        player_id = str(uuid.uuid4())
+        await self.attach(room_code, player_id, websocket)
+        await self.bus.send_command(room_code, {
+            "type": "join_room",
+            "player_id": player_id,
+            "player_name": player_name
+        }, reply_to=player_id)
+        return room_code, player_id
+    
+    def track_room(self, room_code: str) -> RoomState:
+        """Начать версионирование состояния комнаты для клиентов"""
+        room = self.rooms[room_code]
+        # Вопросы уходят клиенту один раз в снимке, дальше — только номер текущего
+        state = RoomState({
+            "room_code": room_code,
+            "game_state": room["game_state"],
+            "current_question": room["current_question"],
+            "questions": room["questions"],
+            "players": {pid: {"name": p["name"]} for pid, p in room["players"].items()}
+        })
+        self.states[room_code] = state
+        self.actors[room_code] = RoomActor(room_code, self.apply_command)
+        return state
+    
+    async def add_player(self, room_code: str, player_id: str, player_name: str):
+        """Добавить игрока в комнату (выполняется у владельца)"""
         room = self.rooms[room_code]
         
-        if len(room["players"]) >= 2:
-            await self.send_to_player(websocket, {
+        if len(room["players"]) >= room["max_players"] or room["game_state"] != "waiting":
+            await self.send_to_player_id(room_code, player_id, {
                 "type": "error", 
-                "message": "Комната переполнена"
+                "message": "Комната переполнена" if room["game_state"] == "waiting" else "Игра уже началась",
+                "detach": True
             })
-            return None, None
+            return
         
-        player_id = str(uuid.uuid4())
         room["players"][player_id] = {
             "name": player_name,
-            "websocket": websocket,
             "ready": False,
-            "answers": {}
+            "row": len(room["players"])
         }
         
-        # Уведомляем всех в комнате
-        await self.broadcast_to_room(room_code, {
-            "type": "player_joined",
-            "player_name": player_name,
-            "players_count": len(room["players"])
-        })
+        state = self.states[room_code]
+        delta = state.apply("player_joined", {"players": {player_id: {"name": player_name}}})
         
-        await self.send_to_player(websocket, {
-            "type": "room_joined",
+        # Новый игрок получает полный снимок, дельту той же версии он пропустит
+        await self.send_to_player_id(room_code, player_id, {
+            **state.snapshot("room_joined"),
             "room_code": room_code,
             "player_id": player_id
         })
         
-        return room_code, player_id
+        # Уведомляем всех в комнате
+        await self.broadcast_to_room(room_code, delta)
+    
+    async def resync(self, room_code: str, player_id: str, version: Optional[int]):
+        """Догнать переподключившегося игрока с его последней версии"""
+        if player_id not in self.rooms[room_code]["players"]:
+            await self.send_to_player_id(room_code, player_id, {
+                "type": "error",
+                "message": "Игрок не найден в комнате",
+                "detach": True
+            })
+            return
+        await self.send_to_player_id(room_code, player_id, self.states[room_code].since(version))
+    
+    async def leave(self, room_code: str, player_id: str):
+        """Сокет игрока закрылся; опустевшую комнату закроем, если никто не вернется"""
+        online = self.online[room_code]
+        online.pop(player_id, None)
+        if not online:
+            self.schedule_close(room_code)
+    
+    async def worker_gone(self, room_code: str, worker: str):
+        """Воркер с сокетами игроков отключился от шины, не прислав leave (упал)"""
+        online = self.online[room_code]
+        for player_id in [pid for pid, where in online.items() if where == worker]:
+            del online[player_id]
+        if not online:
+            self.schedule_close(room_code)
+    
+    def seen(self, room_code: str, command: dict):
+        """Игрок комнаты прислал команду — он на связи через воркер command["worker"]"""
+        player_id, worker = command.get("player_id"), command.get("worker")
+        room = self.rooms.get(room_code)
+        if room is not None and worker and player_id in room["players"]:
+            self.online[room_code][player_id] = worker
+    
+    def schedule_close(self, room_code: str):
+        self.spawn(self.close_after_delay(room_code))
+    
+    async def close_after_delay(self, room_code: str):
+        await asyncio.sleep(ROOM_CLOSE_DELAY)
+        actor = self.actors.get(room_code)
+        if actor is not None:
+            actor.submit_control({"type": "close"})
+    
+    async def close(self, room_code: str):
+        """Закрыть комнату, если игра окончена или все игроки ушли, и освободить код"""
+        if self.rooms[room_code]["game_state"] != "finished" and self.online[room_code]:
+            return
+        # Очередь останавливаем до освобождения кода: новые команды не примутся
+        dropped = self.actors.pop(room_code).stop()
+        del self.rooms[room_code]
+        del self.states[room_code]
+        del self.online[room_code]
+        await self.bus.release(room_code)
+        for command in dropped:
+            if command.get("player_id") and command["type"] not in CONTROL_COMMANDS:
+                await self.send_to_player_id(room_code, command["player_id"], ROOM_NOT_FOUND)
+        logger.info(f"🧹 Комната {room_code} закрыта")
+    
+    async def commit(self, room_code: str, event: str, patch: dict):
+        """Применить изменение к состоянию клиентов и разослать дельту"""
+        await self.broadcast_to_room(room_code, self.states[room_code].apply(event, patch))
+    
+    async def handle_command(self, room_code: str, command: dict):
+        """Команда игрока для комнаты, которой владеет этот воркер: только в очередь актора"""
+        actor = self.actors.get(room_code)
+        if actor is None:
+            # Комнату закрыли, пока команда шла к владельцу
+            if command.get("player_id"):
+                await self.send_to_player_id(room_code, command["player_id"], ROOM_NOT_FOUND)
+            return
+        if command["type"] in CONTROL_COMMANDS:
+            actor.submit_control(command)
+        elif not actor.submit(command) and command.get("player_id"):
+            await self.send_to_player_id(room_code, command["player_id"], {
+                "type": "error",
+                "message": "Комната перегружена, повторите позже",
+                "command": command["type"]
+            })
+    
+    async def apply_command(self, room_code: str, command: dict):
+        """Применить команду к комнате (выполняется только актором комнаты)"""
+        if command["type"] == "join_room":
+            await self.add_player(room_code, command["player_id"], command["player_name"])
+        elif command["type"] == "start_game":
+            await self.start_game(room_code)
+        elif command["type"] == "submit_answer":
+            await self.submit_answer(room_code, command["player_id"], command["answer"])
+        elif command["type"] == "submit_answers":
+            await self.submit_answers(room_code, command["player_id"], command["answers"])
+        elif command["type"] == "resync":
+            await self.resync(room_code, command["player_id"], command.get("version"))
+        elif command["type"] == "advance":
+            await self.advance(room_code, command["question"])
+        elif command["type"] == "leave":
+            await self.leave(room_code, command["player_id"])
+            return
+        elif command["type"] == "worker_gone":
+            await self.worker_gone(room_code, command["worker"])
+            return
+        elif command["type"] == "close":
+            await self.close(room_code)
+            return
+        # Любая команда игрока подтверждает, что он на связи: так присутствие
+        # восстанавливается и после ложного worker_gone при обрыве связи с брокером
+        self.seen(room_code, command)
     
     async def start_game(self, room_code: str):
         """Начать игру"""
         room = self.rooms[room_code]
+        if room["game_state"] != "waiting":
+            return
         room["game_state"] = "playing"
         room["current_question"] = 0
         
-        question = room["questions"][0]
-        
-        await self.broadcast_to_room(room_code, {
-            "type": "game_started",
-            "question": question
+        await self.commit(room_code, "game_started", {
+            "game_state": "playing",
+            "current_question": 0,
+            "answered": None,
+            "round": None
         })
     
     async def submit_answer(self, room_code: str, player_id: str, answer: str):
         """Отправить ответ"""
         room = self.rooms[room_code]
         current_q = room["current_question"]
+        player = room["players"].get(player_id)
         
-        room["players"][player_id]["answers"][current_q] = answer
+        answers = room["answers"]
+        # Повтор ответа на текущий вопрос (ретрай клиента) ничего не меняет
+        if room["game_state"] != "playing" or player is None or answers.has(player["row"], current_q):
+            return
+        answers.set(player["row"], current_q, answer)
         
         # Проверяем, ответили ли все
         answered_count = sum(1 for p in room["players"].values() 
-                           if current_q in p["answers"])
+                           if answers.has(p["row"], current_q))
         
-        await self.broadcast_to_room(room_code, {
-            "type": "answer_received",
-            "player_id": player_id,
-            "answered_count": answered_count,
-            "total_players": len(room["players"])
-        })
+        await self.commit(room_code, "answer_received", {"answered": {player_id: True}})
         
         # Если все ответили
         if answered_count == len(room["players"]):
             await self.show_results(room_code, current_q)
     
+    async def submit_answers(self, room_code: str, player_id: str, items: List[dict]):
+        """Пакет ответов {question_id, answer} по порядку, целиком или никак.
+
+        question_id — номер вопроса в списке questions с нуля (как
+        current_question), а не поле "id" вопроса; формат пунктов проверен
+        до постановки в очередь (valid_answer_batch).
+        Уже отвеченные вопросы пропускаются, поэтому пакет можно повторять.
+        Новым может быть только текущий вопрос: следующий открывается
+        после ответов всех игроков и паузы с результатами.
+        """
+        room = self.rooms[room_code]
+        player = room["players"].get(player_id)
+        if room["game_state"] != "playing" or player is None:
+            await self.send_to_player_id(room_code, player_id, {"type": "error", "message": "Игра не идет"})
+            return
+        
+        current_q = room["current_question"]
+        fresh, duplicates = None, 0
+        for item in items:
+            question_id = item["question_id"]
+            if question_id < current_q or (
+                    question_id == current_q and (fresh is not None or room["answers"].has(player["row"], current_q))):
+                duplicates += 1
+            elif question_id == current_q:
+                fresh = item["answer"]
+            else:
+                await self.send_to_player_id(room_code, player_id, {
+                    "type": "error",
+                    "message": "Это не текущий вопрос",
+                    "question_id": question_id,
+                    "v": self.states[room_code].version
+                })
+                return
+        
+        if fresh is not None:
+            await self.submit_answer(room_code, player_id, fresh)
+        await self.send_to_player_id(room_code, player_id, {
+            "type": "answers_ack",
+            "applied": int(fresh is not None),
+            "duplicates": duplicates,
+            "v": self.states[room_code].version
+        })
+    
     async def show_results(self, room_code: str, question_index: int):
         """Показать результаты раунда"""
         room = self.rooms[room_code]
         
-        # Собираем ответы
+        # Собираем ответы; имена игроков у клиента уже есть
         answers = {}
         for pid, player in room["players"].items():
-            answers[pid] = {
-                "name": player["name"],
-                "answer": player["answers"][question_index]
-            }
+            answers[pid] = room["answers"].get(player["row"], question_index)
         
-        await self.broadcast_to_room(room_code, {
-            "type": "round_results",
-            "answers": answers
-        })
+        await self.commit(room_code, "round_results", {"round": answers})
         
-        # Переходим к следующему вопросу или завершаем игру
-        await asyncio.sleep(3)  # Показываем результаты 3 секунды
+        # Пауза идет в отдельной задаче, чтобы не задерживать обработку команд;
+        # сам переход выполнит актор комнаты
+        self.spawn(self.advance_after_pause(room_code, question_index))
+    
+    async def advance_after_pause(self, room_code: str, question_index: int):
+        await asyncio.sleep(ROUND_RESULTS_PAUSE)
+        actor = self.actors.get(room_code)
+        if actor is not None:
+            actor.submit_control({"type": "advance", "question": question_index})
+    
+    async def advance(self, room_code: str, question_index: int):
+        """Перейти к следующему вопросу или завершить игру"""
+        room = self.rooms[room_code]
+        # Переход для этого вопроса уже выполнен
+        if room["game_state"] != "playing" or room["current_question"] != question_index:
+            return
         
         if question_index + 1 < len(room["questions"]):
             room["current_question"] += 1
-            next_question = room["questions"][room["current_question"]]
             
-            await self.broadcast_to_room(room_code, {
-                "type": "next_question",
-                "question": next_question
+            await self.commit(room_code, "next_question", {
+                "current_question": room["current_question"],
+                "answered": None,
+                "round": None
             })
         else:
             await self.finish_game(room_code)
@@ -183,16 +502,18 @@ class GameManager:
         room = self.rooms[room_code]
         room["game_state"] = "finished"
         
-        # Подсчитываем совпадения
+        # Подсчитываем совпадения по матрице ответов
         total_questions = len(room["questions"])
-        matches = 0
+        players = list(room["players"].values())
+        codes = room["answers"].view(len(players), total_questions)
         
-        for q_index in range(total_questions):
-            answers = [p["answers"][q_index] for p in room["players"].values()]
-            if len(set(answers)) == 1:  # Все ответы одинаковые
-                matches += 1
+        # Вопросы, где все ответы одинаковые
+        matches = int(((codes == codes[0]).all(axis=0) & (codes[0] != group_scoring.MISSING)).sum())
         
-        compatibility = round((matches / total_questions) * 100)
+        # Совместимость группы — средняя по всем парам; для двоих это доля совпадений
+        same, compared = group_scoring.agreement_counts(codes)
+        percent = group_scoring.pair_percent(same, compared)
+        compatibility = round(group_scoring.group_percent(percent))
         
         # Генерируем совет от гномов
         if compatibility >= 75:
@@ -202,36 +523,124 @@ class GameManager:
         else:
             gnome_advice = "Гном-Исследователь предлагает: больше узнавайте друг о друге!"
         
-        await self.broadcast_to_room(room_code, {
-            "type": "game_finished",
-            "compatibility": compatibility,
-            "matches": matches,
-            "total": total_questions,
-            "gnome_advice": gnome_advice
+        await self.commit(room_code, "game_finished", {
+            "game_state": "finished",
+            "answered": None,
+            "round": None,
+            "result": {
+                "compatibility": compatibility,
+                "matches": matches,
+                "total": total_questions,
+                "gnome_advice": gnome_advice,
+                **group_scoring.compatibility_report(percent, [p["name"] for p in players])
+            }
         })
+        self.schedule_close(room_code)
     
     async def send_to_player(self, websocket: WebSocket, message: dict):
         """Отправить сообщение одному игроку"""
+        await self.send_text(websocket, encode_message(message))
+    
+    async def send_text(self, websocket: WebSocket, text: str):
         try:
-            await websocket.send_text(json.dumps(message))
+            await websocket.send_text(text)
         except:
             pass
     
+    async def send_to_player_id(self, room_code: str, player_id: str, message: dict):
+        """Отправить сообщение игроку комнаты, в каком бы воркере он ни был"""
+        await self.bus.publish(room_code, message, to=player_id)
+    
     async def broadcast_to_room(self, room_code: str, message: dict):
         """Отправить сообщение всем в комнате"""
-        if room_code not in self.rooms:
+        await self.bus.publish(room_code, message)
+    
+    async def deliver(self, room_code: str, message: dict, to: Optional[str] = None):
+        """Доставить событие комнаты локальным сокетам"""
+        sockets = self.sockets.get(room_code)
+        if not sockets:
             return
         
-        room = self.rooms[room_code]
-        for player in room["players"].values():
-            await self.send_to_player(player["websocket"], message)
+        if to is None:
+            # Сериализуем один раз на всех получателей
+            text = encode_message(message)
+            for websocket in list(sockets.values()):
+                await self.send_text(websocket, text)
+            return
+        
+        websocket = sockets.get(to)
+        if websocket is None:
+            return
+        if message.get("detach"):
+            await self.detach(room_code, to)
+            message = {key: value for key, value in message.items() if key != "detach"}
+        await self.send_to_player(websocket, message)
+    
+    async def attach(self, room_code: str, player_id: str, websocket: WebSocket):
+        """Привязать локальный сокет игрока к комнате"""
+        sockets = self.sockets.setdefault(room_code, {})
+        replaced = player_id in sockets
+        sockets[player_id] = websocket
+        # При переподключении подписка уже есть
+        if not replaced:
+            await self.bus.subscribe(room_code)
+    
+    async def detach(self, room_code: str, player_id: str, websocket: Optional[WebSocket] = None) -> bool:
+        """Отвязать сокет игрока; websocket — только если привязан именно он"""
+        sockets = self.sockets.get(room_code)
+        if sockets is None or player_id not in sockets:
+            return False
+        if websocket is not None and sockets[player_id] is not websocket:
+            return False
+        del sockets[player_id]
+        if not sockets:
+            del self.sockets[room_code]
+        await self.bus.unsubscribe(room_code)
+        return True
+
+def valid_answer_batch(items) -> bool:
+    """Пакет submit_answers: список {"question_id": номер с нуля, "answer": строка}"""
+    return isinstance(items, list) and 0 < len(items) <= MAX_ANSWER_BATCH and all(
+        isinstance(item, dict)
+        and type(item.get("question_id")) is int and item["question_id"] >= 0
+        and isinstance(item.get("answer"), str)
+        for item in items
+    )
+
+def encode_message(message: dict) -> str:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
 
 # Глобальный менеджер игр
 game_manager = GameManager()
 
+memory_diagnostics.install(app, {
+    "game_manager_rooms": lambda: game_manager.rooms,
+    "game_manager_sockets": lambda: game_manager.sockets,
+}, deep_types=(group_scoring.AnswerMatrix,))
+
+@app.on_event("startup")
+async def start_game_manager():
+    await game_manager.start()
+
+@app.on_event("shutdown")
+async def stop_game_manager():
+    await game_manager.stop()
+
+# Протокол синхронизации: изменения комнаты приходят как
+# {"type": "state_delta", "event": ..., "v": версия, "d": патч RFC 7386}.
+# room_created/room_joined несут полный снимок {"v", "s"}. После переподключения
+# клиент шлет {"type": "resync", "room_code", "player_id", "version"} и получает
+# state_deltas с недостающими патчами или state_sync с полным снимком.
+# Ответы после обрыва связи можно переслать пакетом {"type": "submit_answers",
+# "answers": [{"question_id", "answer"}, ...]}: question_id — номер вопроса
+# в списке questions с нуля (как current_question), а не его поле "id".
+# Принятые ранее ответы пропускаются, итог приходит как answers_ack
+# {"applied", "duplicates", "v"}; неверный пакет отклоняется ошибкой до отправки в комнату
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    # Комнаты, к которым привязан этот сокет
+    joined = []
     
     try:
         while True:
@@ -239,28 +648,73 @@ async def websocket_endpoint(websocket: WebSocket):
             message = json.loads(data)
             
             if message["type"] == "create_room":
-                await game_manager.create_room(
+                created = await game_manager.create_room(
                     websocket, 
-                    message["player_name"]
+                    message["player_name"],
+                    int(message.get("max_players", room_engine.DEFAULT_PLAYERS))
                 )
+                if created is not None:
+                    joined.append(created)
             
             elif message["type"] == "join_room":
-                await game_manager.join_room(
+                joined.append(await game_manager.join_room(
                     websocket,
                     message["room_code"], 
                     message["player_name"]
-                )
+                ))
             
             elif message["type"] == "start_game":
-                await game_manager.start_game(message["room_code"])
+                # player_id необязателен: с ним игрок узнает, если комнаты уже нет
+                player_id = message.get("player_id")
+                await game_manager.bus.send_command(message["room_code"], {
+                    "type": "start_game",
+                    "player_id": player_id
+                }, reply_to=player_id)
             
             elif message["type"] == "submit_answer":
-                await game_manager.submit_answer(
-                    message["room_code"],
-                    message["player_id"],
-                    message["answer"]
-                )
+                await game_manager.bus.send_command(message["room_code"], {
+                    "type": "submit_answer",
+                    "player_id": message["player_id"],
+                    "answer": message["answer"]
+                }, reply_to=message["player_id"])
+            
+            elif message["type"] == "submit_answers":
+                if not valid_answer_batch(message["answers"]):
+                    await game_manager.send_to_player(websocket, {
+                        "type": "error",
+                        "message": f"В пакете должно быть от 1 до {MAX_ANSWER_BATCH} ответов "
+                                   "вида {question_id: номер вопроса с нуля, answer: строка}",
+                        "command": "submit_answers"
+                    })
+                    continue
+                await game_manager.bus.send_command(message["room_code"], {
+                    "type": "submit_answers",
+                    "player_id": message["player_id"],
+                    "answers": message["answers"]
+                }, reply_to=message["player_id"])
+            
+            elif message["type"] == "resync":
+                room_code, player_id = message["room_code"], message["player_id"]
+                if (room_code, player_id) not in joined:
+                    await game_manager.attach(room_code, player_id, websocket)
+                    joined.append((room_code, player_id))
+                await game_manager.bus.send_command(room_code, {
+                    "type": "resync",
+                    "player_id": player_id,
+                    "version": message.get("version")
+                }, reply_to=player_id)
     
     except WebSocketDisconnect:
-        # Обработка отключения
         pass
+    finally:
+        # Отключение или ошибка в сообщении: отвязываем сокет и снимаем подписки.
+        # Сокет мог быть уже заменен переподключением — тогда detach его не тронет
+        for room_code, player_id in joined:
+            if await game_manager.detach(room_code, player_id, websocket):
+                await game_manager.bus.send_command(room_code, {"type": "leave", "player_id": player_id})
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.environ.get("PORT", 8001))
+    uvicorn.run(app, host="0.0.0.0", port=port, ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE)
+